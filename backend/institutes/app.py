@@ -3,13 +3,34 @@ Institution API - Handles institution account management and policy updates
 Uses Supabase Auth for authentication
 """
 
-from flask import Flask, jsonify, request
+import os
+import sys
+
+# Make the backend-wide `shared` package importable when run from this directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, g, request
 from flask_cors import CORS
 from supabase_client import supabase
 from datetime import datetime, timedelta
 from flasgger import Swagger, swag_from
+from utils.batch import BatchError, parse_batch, run_batch
 from utils.email import send_email, send_clep_policy_reminder
-import os
+from utils.course_index import course_index
+from utils.learner_alerts import queue_new_matches
+from shared.fields import (
+    ACCEPTANCE_COLUMNS,
+    EXAM_COLUMNS,
+    INSTITUTION_COLUMNS,
+    FieldSelectionError,
+    Projection,
+)
+from shared.autocomplete import InstitutionAutocomplete
+from shared.cache import EXAMS_TAG, cache, policy_tags
+from shared.etag import make_etag, not_modified, validators
+from shared.metrics import metrics
+from shared.response import encode, respond, respond_raw, wants_msgpack
+from shared.swr import CachedBody, SWRCache
 import secrets
 
 app = Flask(__name__)
@@ -68,6 +89,82 @@ swagger_template = {
 
 swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
+# ============================================================================
+# FIELD PROJECTIONS (allow-lists and slim defaults for ?fields=)
+# ============================================================================
+
+EXAM_PROJECTION = Projection(columns=EXAM_COLUMNS, default=('id', 'name'))
+
+INSTITUTION_SUMMARY_PROJECTION = Projection(
+    columns=INSTITUTION_COLUMNS,
+    default=('id', 'name', 'city', 'state'),
+)
+
+ADMIN_INSTITUTIONS_PROJECTION = Projection(
+    columns=INSTITUTION_COLUMNS,
+    default=('id', 'name', 'city', 'state', 'last_updated'),
+)
+
+MY_ACCEPTANCES_PROJECTION = Projection(
+    columns=ACCEPTANCE_COLUMNS,
+    default=(
+        'id', 'exam_id', 'cut_score', 'credits', 'related_course',
+        'last_updated', 'version', 'exams',
+    ),
+    relations={'exams': EXAM_PROJECTION},
+)
+
+FEEDBACK_PROJECTION = Projection(
+    columns=ACCEPTANCE_COLUMNS,
+    default=('id', 'exam_id', 'cut_score', 'credits', 'institutions', 'exams'),
+    relations={
+        'institutions': INSTITUTION_SUMMARY_PROJECTION,
+        'exams': EXAM_PROJECTION,
+    },
+    required=('likes', 'dislikes'),
+)
+
+EMAIL_HISTORY_PROJECTION = Projection(
+    columns=frozenset({
+        'id', 'institution_id', 'sent_to', 'subject', 'body', 'sent_by', 'sent_at',
+    }),
+    default=('id', 'institution_id', 'sent_to', 'subject', 'sent_at', 'institutions'),
+    relations={'institutions': INSTITUTION_SUMMARY_PROJECTION},
+)
+
+# ============================================================================
+# HTTP CACHING (Cache-Control per endpoint, version stamp lifetimes)
+# ============================================================================
+
+EXAMS_CACHE_CONTROL = 'private, max-age=300, stale-while-revalidate=3600'
+# Portal must always revalidate, but a matching ETag costs no acceptance query
+ACCEPTANCES_CACHE_CONTROL = 'private, no-cache'
+
+# Serialized exam catalogue responses, keyed by (select, msgpack?)
+exams_cache = SWRCache(
+    'exams',
+    soft_ttl=float(os.getenv('EXAMS_SOFT_TTL', '300')),
+    hard_ttl=float(os.getenv('EXAMS_HARD_TTL', '86400')),
+)
+
+
+def on_cache_invalidate(tags):
+    """Drop locally held exam responses when another worker invalidates them"""
+    if EXAMS_TAG in tags:
+        exams_cache.invalidate()
+
+
+cache.subscribe(on_cache_invalidate)
+
+
+# Institution columns the portal reads from /auth/login and /auth/me
+MEMBERSHIP_SELECT = (
+    'institution_id, role, institutions(id, name, city, state, zip, max_credits, '
+    'transcription_fee, score_validity, can_use_for_failed_courses, '
+    'can_enrolled_students_use_clep, last_updated, verified_by)'
+)
+
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
@@ -79,22 +176,58 @@ def get_current_user():
         return None
     
     token = auth_header.replace('Bearer ', '')
+    # Resolved once per app context, so batched sub-requests share it
+    cached = g.get('auth_user')
+    if cached is not None and cached[0] == token:
+        return cached[1]
     try:
         user = supabase.auth.get_user(token)
-        return user.user if user else None
+        user = user.user if user else None
     except:
         return None
+    g.auth_user = (token, user)
+    return user
 
 
 def get_institution_membership(user_id):
     """Get institution membership for a user"""
+    memberships = g.setdefault('memberships', {})
+    if user_id in memberships:
+        return memberships[user_id]
     try:
         result = supabase.table('institution_members').select(
-            '*, institutions(*)'
+            MEMBERSHIP_SELECT
         ).eq('user_id', user_id).single().execute()
-        return result.data
     except:
         return None
+    memberships[user_id] = result.data
+    return result.data
+
+
+def mutate_acceptance(function, **params):
+    """Run one of the acceptance mutation functions from migration 003 and
+    return its {"status", "acceptance", "previous"} result"""
+    return supabase.rpc(function, params).execute().data
+
+
+def parse_expected_version(value):
+    """Row version a client last read, or None for an unconditional write"""
+    if value is None:
+        return None
+    version = int(value)
+    if version < 1:
+        raise ValueError
+    return version
+
+
+def load_exams(select, as_msgpack):
+    """Fetch and serialize the exam catalogue for the exams cache"""
+    result = supabase.table('exams').select(select).order('name').execute()
+    # The catalogue is a few dozen rows, so the ETag hashes the rows themselves
+    # and changes with any edit, not just inserts and deletes
+    etag = make_etag('exams', select, result.data)
+    body, mimetype = encode({"exams": result.data}, as_msgpack)
+    return CachedBody(body, mimetype, etag)
 
 
 def require_platform_admin(f):
@@ -105,11 +238,11 @@ def require_platform_admin(f):
     def decorated_function(*args, **kwargs):
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         membership = get_institution_membership(user.id)
         if not membership or membership.get('role') != 'platform_admin':
-            return jsonify({"error": "Platform admin access required"}), 403
+            return respond({"error": "Platform admin access required"}), 403
         
         return f(*args, **kwargs)
     
@@ -186,7 +319,7 @@ def signup():
         institution_id = data.get('institution_id')
         
         if not email or not password or not institution_id:
-            return jsonify({"error": "Email, password, and institution_id required"}), 400
+            return respond({"error": "Email, password, and institution_id required"}), 400
         
         # Verify institution exists
         inst = supabase.table('institutions').select('id, name').eq(
@@ -194,7 +327,7 @@ def signup():
         ).single().execute()
         
         if not inst.data:
-            return jsonify({"error": "Institution not found"}), 404
+            return respond({"error": "Institution not found"}), 404
         
         # Create Supabase Auth user
         auth_response = supabase.auth.sign_up({
@@ -203,7 +336,7 @@ def signup():
         })
         
         if not auth_response.user:
-            return jsonify({"error": "Failed to create account"}), 500
+            return respond({"error": "Failed to create account"}), 500
         
         user_id = auth_response.user.id
         
@@ -240,10 +373,10 @@ def signup():
         else:
             response_data["message"] = "Account created. Please check your email to confirm."
         
-        return jsonify(response_data), 201
+        return respond(response_data), 201
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/auth/login', methods=['POST'])
@@ -300,7 +433,7 @@ def login():
         password = data.get('password')
         
         if not email or not password:
-            return jsonify({"error": "Email and password required"}), 400
+            return respond({"error": "Email and password required"}), 400
         
         # Authenticate with Supabase
         auth_response = supabase.auth.sign_in_with_password({
@@ -309,7 +442,7 @@ def login():
         })
         
         if not auth_response.user:
-            return jsonify({"error": "Invalid credentials"}), 401
+            return respond({"error": "Invalid credentials"}), 401
         
         user_id = auth_response.user.id
         
@@ -317,9 +450,9 @@ def login():
         membership = get_institution_membership(user_id)
         
         if not membership:
-            return jsonify({"error": "User not linked to any institution"}), 403
+            return respond({"error": "User not linked to any institution"}), 403
         
-        return jsonify({
+        return respond({
             "success": True,
             "user": {
                 "id": user_id,
@@ -334,7 +467,7 @@ def login():
         }), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/auth/logout', methods=['POST'])
@@ -363,13 +496,13 @@ def logout():
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         supabase.auth.sign_out()
-        return jsonify({"success": True, "message": "Logged out"}), 200
+        return respond({"success": True, "message": "Logged out"}), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/auth/me', methods=['GET'])
@@ -405,11 +538,11 @@ def get_current_user_info():
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         membership = get_institution_membership(user.id)
         
-        return jsonify({
+        return respond({
             "user": {
                 "id": user.id,
                 "email": user.email,
@@ -419,7 +552,7 @@ def get_current_user_info():
         }), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 # ============================================================================
@@ -434,6 +567,11 @@ def get_all_exams():
       - Exams
     security:
       - Bearer: []
+    parameters:
+      - name: fields
+        in: query
+        type: string
+        description: Comma-separated fields to return, including related rows (e.g. id,name)
     responses:
       200:
         description: List of all CLEP exams
@@ -449,6 +587,8 @@ def get_all_exams():
                     type: integer
                   name:
                     type: string
+      304:
+        description: Not modified (If-None-Match matched the current ETag)
       401:
         description: Not authenticated
       500:
@@ -457,17 +597,35 @@ def get_all_exams():
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
+        
+        select = EXAM_PROJECTION.select(request.args.get('fields'))
+        as_msgpack = wants_msgpack()
+        cached = exams_cache.get(
+            (select, as_msgpack),
+            lambda: cache.get_or_load(
+                f"exams:{select}:{int(as_msgpack)}",
+                lambda: load_exams(select, as_msgpack),
+                ttl=exams_cache.hard_ttl,
+                tags=[EXAMS_TAG],
+            )
+        )
         
-        # Fetch all exams
-        result = supabase.table('exams').select('id, name').order('name').execute()
+        not_modified_response = not_modified(cached.etag, EXAMS_CACHE_CONTROL)
+        if not_modified_response:
+            return not_modified_response
         
-        return jsonify({
-            "exams": result.data
-        }), 200
+        return respond_raw(
+            cached.body,
+            cached.mimetype,
+            headers=validators(cached.etag, EXAMS_CACHE_CONTROL)
+        ), 200
+        
+    except FieldSelectionError as e:
+        return respond({"error": str(e)}), 400
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/institution/acceptances', methods=['GET'])
@@ -478,6 +636,11 @@ def get_my_acceptances():
       - Acceptances
     security:
       - Bearer: []
+    parameters:
+      - name: fields
+        in: query
+        type: string
+        description: Comma-separated fields to return, including related rows (e.g. id,cut_score,credits,exams(name))
     responses:
       200:
         description: Acceptances retrieved successfully
@@ -490,6 +653,8 @@ def get_my_acceptances():
               type: array
               items:
                 type: object
+      304:
+        description: Not modified (If-None-Match matched the current ETag)
       401:
         description: Not authenticated
       403:
@@ -500,26 +665,40 @@ def get_my_acceptances():
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         membership = get_institution_membership(user.id)
         if not membership:
-            return jsonify({"error": "Not linked to institution"}), 403
+            return respond({"error": "Not linked to institution"}), 403
         
         institution_id = membership['institution_id']
+        select = MY_ACCEPTANCES_PROJECTION.select(request.args.get('fields'))
+        
+        # Every acceptance write touches institutions.last_updated, which the
+        # membership lookup already returned, so a match needs no further query
+        etag = make_etag(
+            'acceptances', institution_id,
+            sorted(membership['institutions'].items()), select
+        )
+        cached = not_modified(etag, ACCEPTANCES_CACHE_CONTROL)
+        if cached:
+            return cached
         
         # Fetch acceptances
         acceptances = supabase.table('acceptances').select(
-            '*, exams(id, name)'
+            select
         ).eq('institution_id', institution_id).execute()
         
-        return jsonify({
+        return respond({
             "institution": membership['institutions'],
             "acceptances": acceptances.data
-        }), 200
+        }, headers=validators(etag, ACCEPTANCES_CACHE_CONTROL)), 200
+        
+    except FieldSelectionError as e:
+        return respond({"error": str(e)}), 400
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/institution/acceptances', methods=['POST'])
@@ -579,31 +758,31 @@ def add_acceptance():
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         membership = get_institution_membership(user.id)
         if not membership:
-            return jsonify({"error": "Not linked to institution"}), 403
+            return respond({"error": "Not linked to institution"}), 403
         
         if membership['role'] not in ['admin', 'editor']:
-            return jsonify({"error": "Insufficient permissions"}), 403
+            return respond({"error": "Insufficient permissions"}), 403
         
         data = request.get_json()
         
         # Validate required fields
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return respond({"error": "Request body required"}), 400
         
         exam_id = data.get('exam_id')
         cut_score = data.get('cut_score')
         credits = data.get('credits')
         
         if exam_id is None:
-            return jsonify({"error": "exam_id is required"}), 400
+            return respond({"error": "exam_id is required"}), 400
         if cut_score is None:
-            return jsonify({"error": "cut_score is required"}), 400
+            return respond({"error": "cut_score is required"}), 400
         if credits is None:
-            return jsonify({"error": "credits is required"}), 400
+            return respond({"error": "credits is required"}), 400
         
         # Validate data types and ranges
         try:
@@ -611,43 +790,44 @@ def add_acceptance():
             cut_score = int(cut_score)
             credits = int(credits)
         except (ValueError, TypeError):
-            return jsonify({"error": "exam_id, cut_score, and credits must be integers"}), 400
+            return respond({"error": "exam_id, cut_score, and credits must be integers"}), 400
         
         if not (1 <= exam_id <= 38):
-            return jsonify({"error": "exam_id must be between 1 and 38"}), 400
+            return respond({"error": "exam_id must be between 1 and 38"}), 400
         
         if not (20 <= cut_score <= 80):
-            return jsonify({"error": "cut_score must be between 20 and 80"}), 400
+            return respond({"error": "cut_score must be between 20 and 80"}), 400
         
         if credits < 0:
-            return jsonify({"error": "credits must be a positive number"}), 400
+            return respond({"error": "credits must be a positive number"}), 400
         
         institution_id = membership['institution_id']
         
-        acceptance = {
-            "institution_id": institution_id,
-            "exam_id": exam_id,
-            "cut_score": cut_score,
-            "credits": credits,
-            "related_course": data.get('related_course', ''),
-            "updated_by_contact_id": None  # Could link to institution_members
-        }
+        # Insert and institution touch in one database call
+        result = mutate_acceptance(
+            'add_acceptance',
+            p_institution_id=institution_id,
+            p_exam_id=exam_id,
+            p_cut_score=cut_score,
+            p_credits=credits,
+            p_related_course=data.get('related_course', ''),
+            p_verified_by=user.email
+        )
+        created = result['acceptance']
         
-        result = supabase.table('acceptances').insert(acceptance).execute()
+        # Evict cached catalogue/policy reads in every worker of both services
+        cache.invalidate_tags(*policy_tags(institution_id, exam_id))
         
-        # Update institution's last_updated
-        supabase.table('institutions').update({
-            'last_updated': datetime.utcnow().isoformat(),
-            'verified_by': user.email
-        }).eq('id', institution_id).execute()
+        # Tell learners whose scores already meet the new policy
+        queue_new_matches(institution_id, exam_id, cut_score)
         
-        return jsonify({
+        return respond({
             "success": True,
-            "acceptance": result.data[0]
+            "acceptance": created
         }), 201
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/institution/acceptances/<acceptance_id>', methods=['PUT'])
@@ -686,6 +866,10 @@ def update_acceptance(acceptance_id):
               type: string
               example: "FREN 103"
               description: Course this CLEP exam replaces
+            version:
+              type: integer
+              example: 3
+              description: Version last read; the update is rejected if the acceptance has changed since
     responses:
       200:
         description: Acceptance updated successfully
@@ -702,28 +886,27 @@ def update_acceptance(acceptance_id):
         description: Insufficient permissions (requires admin or editor role)
       404:
         description: Acceptance not found
+      409:
+        description: Stale version; the response carries the current acceptance
       500:
         description: Server error
     """
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         membership = get_institution_membership(user.id)
         if not membership or membership['role'] not in ['admin', 'editor']:
-            return jsonify({"error": "Insufficient permissions"}), 403
+            return respond({"error": "Insufficient permissions"}), 403
         
         data = request.get_json()
         institution_id = membership['institution_id']
         
-        # Verify acceptance belongs to this institution
-        acceptance = supabase.table('acceptances').select('*').eq(
-            'id', acceptance_id
-        ).eq('institution_id', institution_id).single().execute()
-        
-        if not acceptance.data:
-            return jsonify({"error": "Acceptance not found"}), 404
+        try:
+            expected_version = parse_expected_version(data.get('version'))
+        except (ValueError, TypeError):
+            return respond({"error": "version must be a positive integer"}), 400
         
         updates = {}
         if 'exam_id' in data:
@@ -732,10 +915,10 @@ def update_acceptance(acceptance_id):
             try:
                 exam_id = int(exam_id)
                 if not (1 <= exam_id <= 38):
-                    return jsonify({"error": "exam_id must be between 1 and 38"}), 400
+                    return respond({"error": "exam_id must be between 1 and 38"}), 400
                 updates['exam_id'] = exam_id
             except (ValueError, TypeError):
-                return jsonify({"error": "exam_id must be an integer"}), 400
+                return respond({"error": "exam_id must be an integer"}), 400
         
         if 'cut_score' in data:
             cut_score = data['cut_score']
@@ -743,10 +926,10 @@ def update_acceptance(acceptance_id):
             try:
                 cut_score = int(cut_score)
                 if not (20 <= cut_score <= 80):
-                    return jsonify({"error": "cut_score must be between 20 and 80"}), 400
+                    return respond({"error": "cut_score must be between 20 and 80"}), 400
                 updates['cut_score'] = cut_score
             except (ValueError, TypeError):
-                return jsonify({"error": "cut_score must be an integer"}), 400
+                return respond({"error": "cut_score must be an integer"}), 400
         
         if 'credits' in data:
             credits = data['credits']
@@ -754,31 +937,54 @@ def update_acceptance(acceptance_id):
             try:
                 credits = int(credits)
                 if credits < 0:
-                    return jsonify({"error": "credits must be a positive number"}), 400
+                    return respond({"error": "credits must be a positive number"}), 400
                 updates['credits'] = credits
             except (ValueError, TypeError):
-                return jsonify({"error": "credits must be an integer"}), 400
+                return respond({"error": "credits must be an integer"}), 400
         
         if 'related_course' in data:
             updates['related_course'] = data['related_course']
         
         if not updates:
-            return jsonify({"error": "No fields to update"}), 400
-        
-        result = supabase.table('acceptances').update(updates).eq(
-            'id', acceptance_id
-        ).execute()
-        
-        # Update institution's last_updated
-        supabase.table('institutions').update({
-            'last_updated': datetime.utcnow().isoformat(),
-            'verified_by': user.email
-        }).eq('id', institution_id).execute()
+            return respond({"error": "No fields to update"}), 400
+        
+        # Ownership check, version check, write and institution touch in
+        # one database call
+        result = mutate_acceptance(
+            'update_acceptance',
+            p_id=acceptance_id,
+            p_institution_id=institution_id,
+            p_updates=updates,
+            p_expected_version=expected_version,
+            p_verified_by=user.email
+        )
+        if result['status'] == 'not_found':
+            return respond({"error": "Acceptance not found"}), 404
+        if result['status'] == 'conflict':
+            return respond({
+                "error": "Acceptance was changed by someone else; reload and retry",
+                "acceptance": result['acceptance']
+            }), 409
+        previous = result['previous']
+        
+        # Evict cached reads for the old and (if changed) new exam everywhere
+        cache.invalidate_tags(*policy_tags(
+            institution_id, previous['exam_id'], updates.get('exam_id')
+        ))
+        
+        # A new exam or a lower cut score can qualify learners who didn't before
+        new_exam_id = updates.get('exam_id', previous['exam_id'])
+        queue_new_matches(
+            institution_id,
+            new_exam_id,
+            updates.get('cut_score', previous['cut_score']),
+            previous['cut_score'] if new_exam_id == previous['exam_id'] else None
+        )
         
-        return jsonify({"success": True, "acceptance": result.data[0]}), 200
+        return respond({"success": True, "acceptance": result['acceptance']}), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/institution/acceptances/<acceptance_id>', methods=['DELETE'])
@@ -795,6 +1001,11 @@ def delete_acceptance(acceptance_id):
         required: true
         type: string
         description: UUID of the acceptance to delete
+      - name: version
+        in: query
+        required: false
+        type: integer
+        description: Version last read; the delete is rejected if the acceptance has changed since
     responses:
       200:
         description: Acceptance deleted successfully
@@ -811,40 +1022,404 @@ def delete_acceptance(acceptance_id):
         description: Admin access required
       404:
         description: Acceptance not found
+      409:
+        description: Stale version; the response carries the current acceptance
       500:
         description: Server error
     """
     try:
         user = get_current_user()
         if not user:
-            return jsonify({"error": "Not authenticated"}), 401
+            return respond({"error": "Not authenticated"}), 401
         
         membership = get_institution_membership(user.id)
         if not membership or membership['role'] != 'admin':
-            return jsonify({"error": "Admin access required"}), 403
+            return respond({"error": "Admin access required"}), 403
         
         institution_id = membership['institution_id']
         
-        # Verify acceptance belongs to this institution
-        acceptance = supabase.table('acceptances').select('*').eq(
-            'id', acceptance_id
-        ).eq('institution_id', institution_id).single().execute()
+        try:
+            expected_version = parse_expected_version(request.args.get('version'))
+        except ValueError:
+            return respond({"error": "version must be a positive integer"}), 400
+        
+        # Ownership check, version check, delete and institution touch in
+        # one database call
+        result = mutate_acceptance(
+            'delete_acceptance',
+            p_id=acceptance_id,
+            p_institution_id=institution_id,
+            p_expected_version=expected_version,
+            p_verified_by=user.email
+        )
+        if result['status'] == 'not_found':
+            return respond({"error": "Acceptance not found"}), 404
+        if result['status'] == 'conflict':
+            return respond({
+                "error": "Acceptance was changed by someone else; reload and retry",
+                "acceptance": result['acceptance']
+            }), 409
         
-        if not acceptance.data:
-            return jsonify({"error": "Acceptance not found"}), 404
+        # Evict cached catalogue/policy reads in every worker of both services
+        cache.invalidate_tags(*policy_tags(institution_id, result['previous']['exam_id']))
+        
+        return respond({"success": True, "message": "Acceptance deleted"}), 200
+        
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+# ============================================================================
+# CHANGE FEED (incremental sync for caches, replicas and analytics)
+# ============================================================================
+
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+# Pages follow change_log.seq, which is assigned in commit order (see
+# migrations/002_create_change_log.sql); rows still being committed have none
+CHANGE_TABLES = ('acceptances', 'institutions')
+
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    """Incremental feed of acceptance and institution changes
+    ---
+    tags:
+      - Changes
+    security:
+      - Bearer: []
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        description: Cursor returned by the previous call (omit or 0 to start from the beginning)
+      - name: limit
+        in: query
+        type: integer
+        description: Maximum entries per page (default 500, max 1000)
+      - name: table
+        in: query
+        type: string
+        description: Only return changes for this table (acceptances or institutions)
+    responses:
+      200:
+        description: Changes after the cursor in commit order; deletes have a null row (tombstone)
+        schema:
+          type: object
+          properties:
+            changes:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                  seq:
+                    type: integer
+                    description: Commit-ordered position; the cursor
+                  table_name:
+                    type: string
+                  op:
+                    type: string
+                    enum: [INSERT, UPDATE, DELETE]
+                  row_id:
+                    type: string
+                  institution_id:
+                    type: string
+                  row:
+                    type: object
+                  changed_at:
+                    type: string
+            next_cursor:
+              type: integer
+            has_more:
+              type: boolean
+      400:
+        description: Invalid cursor, limit or table
+      401:
+        description: Not authenticated
+      500:
+        description: Server error
+    """
+    try:
+        user = get_current_user()
+        if not user:
+            return respond({"error": "Not authenticated"}), 401
+        
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', CHANGES_PAGE_SIZE, type=int)
+        if since is None or since < 0:
+            return respond({"error": "since must be a non-negative integer cursor"}), 400
+        if limit is None or not 1 <= limit <= CHANGES_MAX_PAGE_SIZE:
+            return respond({"error": f"limit must be between 1 and {CHANGES_MAX_PAGE_SIZE}"}), 400
+        
+        table = request.args.get('table')
+        if table and table not in CHANGE_TABLES:
+            return respond({"error": f"table must be one of: {', '.join(CHANGE_TABLES)}"}), 400
+        
+        query = supabase.table('change_log').select(
+            'id, seq, table_name, op, row_id, institution_id, row, changed_at'
+        ).gt('seq', since)
+        if table:
+            query = query.eq('table_name', table)
+        
+        # One extra row tells us whether another page follows
+        rows = query.order('seq').limit(limit + 1).execute().data
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        return respond({
+            "changes": rows,
+            "next_cursor": rows[-1]['seq'] if rows else since,
+            "has_more": has_more
+        }), 200
+        
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+# ============================================================================
+# INSTITUTION AUTOCOMPLETE (Public)
+# ============================================================================
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+institution_autocomplete = InstitutionAutocomplete(supabase)
+
+
+@app.route('/institutions/autocomplete', methods=['GET'])
+def autocomplete_institutions():
+    """Institution name suggestions for a partial, possibly misspelled query
+    ---
+    tags:
+      - Institutions
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: What the user has typed so far (e.g. "state univ", "bufalo")
+      - name: limit
+        in: query
+        type: integer
+        description: Maximum suggestions (default 10, max 50)
+    responses:
+      200:
+        description: Best matches first; exact prefixes rank above typo corrections
+        schema:
+          type: object
+          properties:
+            institutions:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: string
+                  name:
+                    type: string
+                  city:
+                    type: string
+                  state:
+                    type: string
+      400:
+        description: Invalid limit
+      500:
+        description: Server error
+    """
+    try:
+        limit = request.args.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= AUTOCOMPLETE_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {AUTOCOMPLETE_MAX_LIMIT}"}), 400
         
-        supabase.table('acceptances').delete().eq('id', acceptance_id).execute()
+        query = request.args.get('q', '')
+        return respond({
+            "institutions": institution_autocomplete.search(query, limit)
+        }), 200
         
-        # Update institution's last_updated
-        supabase.table('institutions').update({
-            'last_updated': datetime.utcnow().isoformat(),
-            'verified_by': user.email
-        }).eq('id', institution_id).execute()
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+# ============================================================================
+# COURSE EQUIVALENTS (Public)
+# ============================================================================
+
+COURSES_DEFAULT_LIMIT = 50
+COURSES_MAX_LIMIT = 500
+
+
+@app.route('/courses/institutions', methods=['GET'])
+def get_course_institutions():
+    """Institutions that grant credit for a course (by related_course)
+    ---
+    tags:
+      - Courses
+    parameters:
+      - name: course
+        in: query
+        type: string
+        description: Course code or prefix, e.g. "FREN 102", "fren10", "ENG"
+      - name: department
+        in: query
+        type: string
+        description: Whole department, e.g. "FREN"
+      - name: limit
+        in: query
+        type: integer
+        description: Maximum postings per page (default 50, max 500)
+      - name: offset
+        in: query
+        type: integer
+        description: Postings to skip (default 0)
+    responses:
+      200:
+        description: Postings ordered by course code, then most credits and lowest cut score
+        schema:
+          type: object
+          properties:
+            courses:
+              type: array
+              items:
+                type: string
+            postings:
+              type: array
+              items:
+                type: object
+                properties:
+                  course:
+                    type: string
+                  acceptance_id:
+                    type: string
+                  institution_id:
+                    type: string
+                  institution_name:
+                    type: string
+                  city:
+                    type: string
+                  state:
+                    type: string
+                  exam_id:
+                    type: integer
+                  cut_score:
+                    type: integer
+                  credits:
+                    type: integer
+                  related_course:
+                    type: string
+            total:
+              type: integer
+            has_more:
+              type: boolean
+      400:
+        description: Missing course/department or invalid paging
+      500:
+        description: Server error
+    """
+    try:
+        course = (request.args.get('course') or '').strip()
+        department = (request.args.get('department') or '').strip()
+        if not course and not department:
+            return respond({"error": "course or department is required"}), 400
+        
+        limit = request.args.get('limit', COURSES_DEFAULT_LIMIT, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if limit is None or not 1 <= limit <= COURSES_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {COURSES_MAX_LIMIT}"}), 400
+        if offset is None or offset < 0:
+            return respond({"error": "offset must be a non-negative integer"}), 400
+        
+        courses, postings, total = course_index.lookup(
+            course or None, department or None, limit, offset
+        )
         
-        return jsonify({"success": True, "message": "Acceptance deleted"}), 200
+        return respond({
+            "courses": courses,
+            "postings": postings,
+            "total": total,
+            "has_more": offset + len(postings) < total
+        }), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
+
+
+# ============================================================================
+# REQUEST BATCHING (Authenticated)
+# ============================================================================
+
+@app.route('/batch', methods=['POST'])
+def batch_requests():
+    """Run several API requests in one round trip
+    ---
+    tags:
+      - Batch
+    security:
+      - Bearer: []
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          required:
+            - requests
+          properties:
+            requests:
+              type: array
+              description: Sub-requests in order. Consecutive GETs run concurrently; each write runs alone, after everything before it
+              items:
+                type: object
+                properties:
+                  method:
+                    type: string
+                    example: PUT
+                  path:
+                    type: string
+                    example: /institution/acceptances/123e4567-e89b-12d3-a456-426614174000
+                  body:
+                    type: object
+                    example: {"cut_score": 55}
+    responses:
+      200:
+        description: One response per sub-request, in request order
+        schema:
+          type: object
+          properties:
+            responses:
+              type: array
+              items:
+                type: object
+                properties:
+                  status:
+                    type: integer
+                  body:
+                    type: object
+      400:
+        description: Malformed batch
+      401:
+        description: Not authenticated
+      500:
+        description: Server error
+    """
+    try:
+        try:
+            subrequests = parse_batch(request.get_json(silent=True))
+        except BatchError as e:
+            return respond({"error": str(e)}), 400
+        
+        # Authenticate and resolve membership once; sub-requests reuse both
+        user = get_current_user()
+        if not user:
+            return respond({"error": "Not authenticated"}), 401
+        get_institution_membership(user.id)
+        
+        headers = {'Authorization': request.headers['Authorization']}
+        return respond({"responses": run_batch(app, subrequests, headers)}), 200
+        
+    except Exception as e:
+        return respond({"error": str(e)}), 500
 
 
 # ============================================================================
@@ -870,7 +1445,27 @@ def health_check():
               type: string
               example: institutions
     """
-    return jsonify({"status": "healthy", "service": "institutions"}), 200
+    return respond({"status": "healthy", "service": "institutions"}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """In-process metrics for this worker
+    ---
+    tags:
+      - Health
+    responses:
+      200:
+        description: Counters and timing summaries (serialization time, bytes saved, ...)
+        schema:
+          type: object
+          properties:
+            counters:
+              type: object
+            timings:
+              type: object
+    """
+    return respond(metrics.snapshot()), 200
 
 
 # ============================================================================
@@ -917,7 +1512,7 @@ def test_email():
         to_email = data.get('to')
         
         if not to_email:
-            return jsonify({"error": "Email address required"}), 400
+            return respond({"error": "Email address required"}), 400
         
         # Send test email
         success = send_email(
@@ -927,18 +1522,18 @@ def test_email():
         )
         
         if success:
-            return jsonify({
+            return respond({
                 "success": True,
                 "message": f"Test email sent to {to_email}"
             }), 200
         else:
-            return jsonify({
+            return respond({
                 "success": False,
                 "error": "Failed to send test email. Check logs for details."
             }), 500
             
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 # ============================================================================
@@ -971,6 +1566,10 @@ def get_admin_institutions():
         in: query
         type: integer
         description: Limit number of results (default 100)
+      - name: fields
+        in: query
+        type: string
+        description: Comma-separated fields to return, including related rows (e.g. id,name,last_updated)
     responses:
       200:
         description: List of institutions
@@ -988,7 +1587,9 @@ def get_admin_institutions():
     """
     try:
         # Build query
-        query = supabase.table('institutions').select('*')
+        query = supabase.table('institutions').select(
+            ADMIN_INSTITUTIONS_PROJECTION.select(request.args.get('fields'))
+        )
         
         # Apply filters
         state = request.args.get('state')
@@ -1010,13 +1611,16 @@ def get_admin_institutions():
         # Execute query
         result = query.execute()
         
-        return jsonify({
+        return respond({
             "institutions": result.data,
             "total": len(result.data)
         }), 200
         
+    except FieldSelectionError as e:
+        return respond({"error": str(e)}), 400
+        
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/admin/acceptances/feedback', methods=['GET'])
@@ -1037,6 +1641,10 @@ def get_acceptances_feedback():
         in: query
         type: integer
         description: Limit number of results (default 50)
+      - name: fields
+        in: query
+        type: string
+        description: Comma-separated fields to return, including related rows (e.g. id,cut_score,institutions(name))
     responses:
       200:
         description: List of acceptances with feedback
@@ -1056,7 +1664,7 @@ def get_acceptances_feedback():
         
         # Get acceptances with institution and exam details
         result = supabase.table('acceptances').select(
-            '*, institutions(id, name, city, state), exams(id, name)'
+            FEEDBACK_PROJECTION.select(request.args.get('fields'))
         ).limit(limit).execute()
         
         acceptances = result.data
@@ -1077,10 +1685,13 @@ def get_acceptances_feedback():
         else:  # default to dislikes
             acceptances.sort(key=lambda x: x['dislikes'], reverse=True)
         
-        return jsonify({"acceptances": acceptances}), 200
+        return respond({"acceptances": acceptances}), 200
+        
+    except FieldSelectionError as e:
+        return respond({"error": str(e)}), 400
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/admin/email/send', methods=['POST'])
@@ -1135,7 +1746,7 @@ def send_bulk_emails():
         print(f"[DEBUG] FRONTEND_BASE_URL env: '{os.getenv('FRONTEND_BASE_URL')}'")
         
         if not institution_ids:
-            return jsonify({"error": "institution_ids required"}), 400
+            return respond({"error": "institution_ids required"}), 400
         
         user = get_current_user()
         sent_count = 0
@@ -1194,7 +1805,7 @@ def send_bulk_emails():
                 details.append({"institution_id": inst_id, "status": "failed", "error": str(e)})
                 failed_count += 1
         
-        return jsonify({
+        return respond({
             "success": True,
             "sent_count": sent_count,
             "failed_count": failed_count,
@@ -1202,7 +1813,7 @@ def send_bulk_emails():
         }), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/admin/email/history', methods=['GET'])
@@ -1223,6 +1834,10 @@ def get_email_history():
         in: query
         type: string
         description: Filter by institution UUID
+      - name: fields
+        in: query
+        type: string
+        description: Comma-separated fields to return, including related rows (e.g. sent_to,sent_at,institutions.name)
     responses:
       200:
         description: Email history
@@ -1242,7 +1857,7 @@ def get_email_history():
         
         # Build query
         query = supabase.table('sent_emails').select(
-            '*, institutions(id, name, city, state)'
+            EMAIL_HISTORY_PROJECTION.select(request.args.get('fields'))
         ).order('sent_at', desc=True).limit(limit)
         
         # Apply institution filter if provided
@@ -1251,10 +1866,13 @@ def get_email_history():
         
         result = query.execute()
         
-        return jsonify({"emails": result.data}), 200
+        return respond({"emails": result.data}), 200
+        
+    except FieldSelectionError as e:
+        return respond({"error": str(e)}), 400
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 # ============================================================================
@@ -1293,7 +1911,7 @@ def like_acceptance(acceptance_id):
         ).single().execute()
         
         if not acceptance.data:
-            return jsonify({"error": "Acceptance not found"}), 404
+            return respond({"error": "Acceptance not found"}), 404
         
         # Increment likes
         new_likes = acceptance.data['likes'] + 1
@@ -1301,13 +1919,13 @@ def like_acceptance(acceptance_id):
             'likes': new_likes
         }).eq('id', acceptance_id).execute()
         
-        return jsonify({
+        return respond({
             "success": True,
             "likes": new_likes
         }), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 @app.route('/acceptances/<acceptance_id>/dislike', methods=['POST'])
@@ -1342,7 +1960,7 @@ def dislike_acceptance(acceptance_id):
         ).single().execute()
         
         if not acceptance.data:
-            return jsonify({"error": "Acceptance not found"}), 404
+            return respond({"error": "Acceptance not found"}), 404
         
         # Increment dislikes
         new_dislikes = acceptance.data['dislikes'] + 1
@@ -1350,13 +1968,13 @@ def dislike_acceptance(acceptance_id):
             'dislikes': new_dislikes
         }).eq('id', acceptance_id).execute()
         
-        return jsonify({
+        return respond({
             "success": True,
             "dislikes": new_dislikes
         }), 200
         
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 if __name__ == '__main__':
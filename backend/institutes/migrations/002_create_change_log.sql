@@ -0,0 +1,100 @@
+-- Append-only change log for acceptances and institutions.
+--
+-- Every insert, update and delete on the policy tables appends one row here
+-- from a trigger, so consumers can follow GET /changes?since=<cursor> instead
+-- of re-reading whole tables. Deletes are recorded as tombstones (row = NULL).
+--
+-- The cursor is `seq`, not `id`. An id is allocated when the row is inserted,
+-- so a transaction that commits late can land behind ids a reader has already
+-- passed. `seq` is assigned by a deferred trigger at commit time, under a
+-- transaction-scoped advisory lock. No transaction can take a sequence number
+-- until the previous holder has committed or rolled back, so once a reader
+-- sees seq N, every lower seq is visible too (rolled back ones leave gaps).
+-- Writers of the policy tables serialize on that lock only for the last
+-- moment of their commit.
+--
+-- Institution rows carry `verified_by` (the editor's email), which is
+-- stripped from the logged row. The log is readable by the service role only.
+
+CREATE TABLE IF NOT EXISTS change_log (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    op TEXT NOT NULL CHECK (op IN ('INSERT', 'UPDATE', 'DELETE')),
+    row_id UUID NOT NULL,
+    institution_id UUID,
+    row JSONB,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+    seq BIGINT
+);
+
+CREATE SEQUENCE IF NOT EXISTS change_log_seq;
+ALTER TABLE change_log ADD COLUMN IF NOT EXISTS seq BIGINT;
+
+CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log (changed_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_seq ON change_log (seq);
+CREATE INDEX IF NOT EXISTS idx_change_log_institution ON change_log (institution_id, id);
+
+CREATE OR REPLACE FUNCTION log_policy_change() RETURNS TRIGGER AS $$
+DECLARE
+    target RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        target := OLD;
+    ELSE
+        target := NEW;
+    END IF;
+
+    INSERT INTO change_log (table_name, op, row_id, institution_id, row)
+    VALUES (
+        TG_TABLE_NAME,
+        TG_OP,
+        target.id,
+        CASE WHEN TG_TABLE_NAME = 'institutions' THEN target.id
+             ELSE (to_jsonb(target) ->> 'institution_id')::UUID END,
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE to_jsonb(target) - 'verified_by' END
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS acceptances_change_log ON acceptances;
+CREATE TRIGGER acceptances_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON acceptances
+    FOR EACH ROW EXECUTE FUNCTION log_policy_change();
+
+DROP TRIGGER IF EXISTS institutions_change_log ON institutions;
+CREATE TRIGGER institutions_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON institutions
+    FOR EACH ROW EXECUTE FUNCTION log_policy_change();
+
+CREATE OR REPLACE FUNCTION sequence_change_log() RETURNS TRIGGER AS $$
+BEGIN
+    -- Held until commit, so sequence numbers become visible in order
+    PERFORM pg_advisory_xact_lock(hashtext('change_log_seq'));
+    UPDATE change_log SET seq = nextval('change_log_seq') WHERE id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS change_log_sequence ON change_log;
+CREATE CONSTRAINT TRIGGER change_log_sequence
+    AFTER INSERT ON change_log
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION sequence_change_log();
+
+-- Rows logged before seq and verified_by stripping existed
+SELECT pg_advisory_xact_lock(hashtext('change_log_seq'));
+UPDATE change_log SET row = row - 'verified_by' WHERE row ? 'verified_by';
+UPDATE change_log c SET seq = o.seq
+FROM (
+    SELECT id, nextval('change_log_seq') AS seq
+    FROM (SELECT id FROM change_log WHERE seq IS NULL ORDER BY id) pending
+) o
+WHERE c.id = o.id;
+
+-- The log is written by triggers and read by the API with the service role
+-- key. RLS with no policy for anon/authenticated keeps PostgREST from serving
+-- it to anyone else.
+ALTER TABLE change_log ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS change_log_read ON change_log;
+REVOKE ALL ON change_log FROM anon, authenticated;
@@ -0,0 +1,128 @@
+-- One database call per acceptance mutation, with optimistic concurrency.
+--
+-- Each function checks that the acceptance belongs to the caller's
+-- institution, writes it, bumps its version and touches the institution's
+-- last_updated/verified_by in a single transaction. The API used to make a
+-- separate round trip for each of those steps.
+--
+-- `version` starts at 1 and increases with every update. Callers that pass
+-- the version they last read (p_expected_version) get status 'conflict' and
+-- the current row back if someone else changed it in the meantime. NULL
+-- skips the check.
+--
+-- Every function returns {"status": "ok" | "not_found" | "conflict",
+-- "acceptance": <row>, "previous": <row before the write>}.
+
+ALTER TABLE acceptances ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION touch_institution(p_institution_id UUID, p_verified_by TEXT)
+RETURNS VOID AS $$
+    UPDATE institutions
+    SET last_updated = now(), verified_by = p_verified_by
+    WHERE id = p_institution_id;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION add_acceptance(
+    p_institution_id UUID,
+    p_exam_id INTEGER,
+    p_cut_score INTEGER,
+    p_credits INTEGER,
+    p_related_course TEXT,
+    p_verified_by TEXT
+) RETURNS JSONB AS $$
+DECLARE
+    created acceptances%ROWTYPE;
+BEGIN
+    INSERT INTO acceptances (institution_id, exam_id, cut_score, credits, related_course)
+    VALUES (p_institution_id, p_exam_id, p_cut_score, p_credits, p_related_course)
+    RETURNING * INTO created;
+
+    PERFORM touch_institution(p_institution_id, p_verified_by);
+    RETURN jsonb_build_object('status', 'ok', 'acceptance', to_jsonb(created));
+END;
+$$ LANGUAGE plpgsql;
+
+-- p_updates holds only the fields to change: exam_id, cut_score, credits,
+-- related_course
+CREATE OR REPLACE FUNCTION update_acceptance(
+    p_id UUID,
+    p_institution_id UUID,
+    p_updates JSONB,
+    p_expected_version INTEGER,
+    p_verified_by TEXT
+) RETURNS JSONB AS $$
+DECLARE
+    previous acceptances%ROWTYPE;
+    updated acceptances%ROWTYPE;
+BEGIN
+    SELECT * INTO previous FROM acceptances
+    WHERE id = p_id AND institution_id = p_institution_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+    IF p_expected_version IS NOT NULL AND previous.version <> p_expected_version THEN
+        RETURN jsonb_build_object('status', 'conflict', 'acceptance', to_jsonb(previous));
+    END IF;
+
+    UPDATE acceptances SET
+        exam_id = COALESCE((p_updates ->> 'exam_id')::INTEGER, exam_id),
+        cut_score = COALESCE((p_updates ->> 'cut_score')::INTEGER, cut_score),
+        credits = COALESCE((p_updates ->> 'credits')::INTEGER, credits),
+        related_course = CASE WHEN p_updates ? 'related_course'
+                              THEN p_updates ->> 'related_course'
+                              ELSE related_course END,
+        version = version + 1
+    WHERE id = p_id
+    RETURNING * INTO updated;
+
+    PERFORM touch_institution(p_institution_id, p_verified_by);
+    RETURN jsonb_build_object(
+        'status', 'ok',
+        'acceptance', to_jsonb(updated),
+        'previous', to_jsonb(previous)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION delete_acceptance(
+    p_id UUID,
+    p_institution_id UUID,
+    p_expected_version INTEGER,
+    p_verified_by TEXT
+) RETURNS JSONB AS $$
+DECLARE
+    previous acceptances%ROWTYPE;
+BEGIN
+    SELECT * INTO previous FROM acceptances
+    WHERE id = p_id AND institution_id = p_institution_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+    IF p_expected_version IS NOT NULL AND previous.version <> p_expected_version THEN
+        RETURN jsonb_build_object('status', 'conflict', 'acceptance', to_jsonb(previous));
+    END IF;
+
+    DELETE FROM acceptances WHERE id = p_id;
+
+    PERFORM touch_institution(p_institution_id, p_verified_by);
+    RETURN jsonb_build_object('status', 'ok', 'previous', to_jsonb(previous));
+END;
+$$ LANGUAGE plpgsql;
+
+-- These functions trust p_institution_id: the API checks membership before
+-- calling them. Functions in public are executable by PUBLIC by default,
+-- which PostgREST would expose at /rpc/* to anon and authenticated keys, so
+-- only the service role (the API's key) may call them.
+REVOKE EXECUTE ON FUNCTION touch_institution(UUID, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION add_acceptance(UUID, INTEGER, INTEGER, INTEGER, TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION update_acceptance(UUID, UUID, JSONB, INTEGER, TEXT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION delete_acceptance(UUID, UUID, INTEGER, TEXT) FROM PUBLIC, anon, authenticated;
+
+GRANT EXECUTE ON FUNCTION touch_institution(UUID, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION add_acceptance(UUID, INTEGER, INTEGER, INTEGER, TEXT, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION update_acceptance(UUID, UUID, JSONB, INTEGER, TEXT) TO service_role;
+GRANT EXECUTE ON FUNCTION delete_acceptance(UUID, UUID, INTEGER, TEXT) TO service_role;
@@ -0,0 +1,107 @@
+"""
+Request batching for the institution portal
+
+A batch is an ordered list of sub-requests dispatched through the app's own
+routes, so each one behaves exactly as if it had been sent on its own. Runs
+of consecutive reads (GET) are dispatched concurrently. Every write is a
+barrier: it starts only after everything before it has finished, and nothing
+after it starts until it is done. A read therefore always sees the writes
+listed before it.
+
+Sub-requests share the batch's app context, so the user and membership that
+get_current_user()/get_institution_membership() memoize on `flask.g` are
+resolved once for the whole batch.
+"""
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from flask import Flask
+from shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '50'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+
+READ_METHODS = ('GET',)
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='batch')
+
+
+class BatchError(ValueError):
+    """Raised for a malformed batch or sub-request"""
+
+
+def parse_batch(payload) -> List[Dict]:
+    """Validated sub-requests: method, path and optional JSON body"""
+    if not isinstance(payload, dict) or not isinstance(payload.get('requests'), list):
+        raise BatchError('Body must be {"requests": [{"method", "path", "body"?}, ...]}')
+    subrequests = payload['requests']
+    if not 1 <= len(subrequests) <= BATCH_MAX_REQUESTS:
+        raise BatchError(f'requests must hold between 1 and {BATCH_MAX_REQUESTS} entries')
+
+    parsed = []
+    for i, sub in enumerate(subrequests):
+        if not isinstance(sub, dict):
+            raise BatchError(f'requests[{i}] must be an object')
+        method = str(sub.get('method', 'GET')).upper()
+        path = sub.get('path')
+        if method not in BATCH_METHODS:
+            raise BatchError(f'requests[{i}].method must be one of {list(BATCH_METHODS)}')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise BatchError(f'requests[{i}].path must be an absolute path')
+        if path.split('?', 1)[0].rstrip('/') == '/batch':
+            raise BatchError(f'requests[{i}] cannot be a nested batch')
+        parsed.append({'method': method, 'path': path, 'body': sub.get('body')})
+    return parsed
+
+
+def _dispatch(app: Flask, sub: Dict, headers: Dict[str, str]) -> Dict:
+    """Run one sub-request through the app's routes"""
+    kwargs = {'method': sub['method'], 'headers': headers}
+    if sub['body'] is not None:
+        kwargs['json'] = sub['body']
+    with app.test_request_context(sub['path'], **kwargs):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            logger.exception(f"Batch sub-request {sub['method']} {sub['path']} failed")
+            return {'status': 500, 'body': {'error': str(e)}}
+    body = response.get_json(silent=True)
+    if body is None and response.status_code != 304:
+        body = response.get_data(as_text=True) or None
+    return {'status': response.status_code, 'body': body}
+
+
+def _in_context(app: Flask, sub: Dict, headers: Dict[str, str]):
+    # Worker threads start with an empty context; carry over the batch's
+    # app context (and its `g`) so sub-requests reuse the resolved auth
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, _dispatch, app, sub, headers)
+
+
+def run_batch(app: Flask, subrequests: List[Dict], headers: Dict[str, str]) -> List[Dict]:
+    """Responses in request order; reads between writes run concurrently"""
+    results: List[Dict] = [None] * len(subrequests)
+    reads: List[Tuple[int, object]] = []
+
+    def drain():
+        for i, future in reads:
+            results[i] = future.result()
+        reads.clear()
+
+    for i, sub in enumerate(subrequests):
+        if sub['method'] in READ_METHODS:
+            reads.append((i, _in_context(app, sub, headers)))
+            continue
+        drain()
+        results[i] = _dispatch(app, sub, headers)
+    drain()
+
+    metrics.incr('batch.count')
+    metrics.incr('batch.subrequests', len(subrequests))
+    return results
@@ -0,0 +1,277 @@
+"""
+Inverted index from course equivalents to acceptance policies
+
+`acceptances.related_course` is free text ("FREN 102", "fren102",
+"ENGL 101 & 102", "BIO-110/111"). Each entry is parsed into normalised course
+codes ("FREN 102"), and every code gets a posting list of
+(institution, exam, cut score, credits). A code's department is the part
+before the number ("FREN"). Lookups are either:
+
+- a prefix of a course code ("FREN 1", "ENG"), answered with one bisect
+  range over the sorted list of known codes;
+- or a whole department ("FREN").
+
+The index is loaded with one pass over `acceptances`. After that, every
+worker, including the one that made the write, learns of an acceptance write
+through its `institution:<id>` cache tag and re-reads only that institution's
+acceptances on the next lookup. Lookups never scan the table.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from supabase_client import supabase
+from shared.cache import CATALOGUE_TAG, cache
+from shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+COURSE_INDEX_TTL = float(os.getenv('COURSE_INDEX_TTL', '86400'))
+PAGE_SIZE = 1000
+
+ACCEPTANCE_SELECT = (
+    'id, institution_id, exam_id, cut_score, credits, related_course, '
+    'institutions(name, city, state)'
+)
+
+# Department letters, then the course number ("102", "101L", "1010")
+TOKEN_RE = re.compile(r'[A-Za-z]+|\d+[A-Za-z]?')
+DEPARTMENT_RE = re.compile(r'^[A-Z]{2,8}$')
+NUMBER_RE = re.compile(r'^\d{2,4}[A-Z]?$')
+# Words that join course numbers rather than name a department
+CONNECTIVES = {'AND', 'OR', 'OF', 'THE', 'ANY', 'PLUS', 'TO', 'THRU'}
+
+
+def parse_courses(related_course: Optional[str]) -> List[str]:
+    """
+    Normalised course codes named in a `related_course` value
+
+    A bare number inherits the department before it, so "ENGL 101 & 102"
+    yields ["ENGL 101", "ENGL 102"]. Text without a course number yields
+    nothing.
+    """
+    if not related_course:
+        return []
+    codes = []
+    department = None
+    for token in TOKEN_RE.findall(related_course.upper()):
+        if token[0].isdigit():
+            if department and NUMBER_RE.match(token):
+                codes.append(f"{department} {token}")
+        elif token in CONNECTIVES:
+            continue
+        elif DEPARTMENT_RE.match(token):
+            department = token
+        else:
+            department = None
+    return list(dict.fromkeys(codes))
+
+
+def normalize_query(query: str) -> str:
+    """
+    "fren102", "Fren-10" and "FREN 102" become the prefixes "FREN 102" and
+    "FREN 10". A number-only query ("102") is returned unchanged, so it
+    matches no department.
+    """
+    tokens = TOKEN_RE.findall((query or '').upper())
+    if not tokens:
+        return ''
+    if len(tokens) == 1:
+        return tokens[0]
+    return f"{tokens[0]} {''.join(tokens[1:])}"
+
+
+def department_of(code: str) -> str:
+    return code.split(' ', 1)[0]
+
+
+class CourseIndex:
+    """Course code -> {acceptance id: posting}, plus department and prefix lookups"""
+
+    def __init__(self, ttl: float = COURSE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, Dict]] = {}
+        self._codes: List[str] = []
+        self._departments: Dict[str, Set[str]] = defaultdict(set)
+        self._by_acceptance: Dict[str, List[str]] = {}
+        self._by_institution: Dict[str, Set[str]] = defaultdict(set)
+        self._institutions: Dict[str, Dict] = {}
+        self._pending: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def mark_changed(self, institution_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._pending.update(institution_ids)
+
+    def _load(self) -> None:
+        rows = []
+        start = 0
+        while True:
+            page = supabase.table('acceptances').select(
+                ACCEPTANCE_SELECT
+            ).range(start, start + PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+
+        self._postings, self._codes = {}, []
+        self._departments = defaultdict(set)
+        self._by_acceptance = {}
+        self._by_institution = defaultdict(set)
+        self._institutions = {}
+        for row in rows:
+            self._add(row)
+        self._codes = sorted(self._postings)
+
+        self._pending.clear()
+        self._loaded_at = time.monotonic()
+        metrics.incr('course_index.loads')
+        logger.info(
+            f"Loaded course index: {len(self._codes)} courses from {len(rows)} acceptances"
+        )
+
+    def _refresh_pending(self) -> None:
+        """Re-read the acceptances of institutions changed by other workers"""
+        ids, self._pending = list(self._pending), set()
+        rows = supabase.table('acceptances').select(ACCEPTANCE_SELECT).in_(
+            'institution_id', ids
+        ).execute().data
+        for institution_id in ids:
+            for acceptance_id in list(self._by_institution.get(institution_id, ())):
+                self._remove(acceptance_id)
+        for row in rows:
+            self._add(row, sorted_insert=True)
+        metrics.incr('course_index.institution_refreshes', len(ids))
+
+    def _ensure_current(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+        elif self._pending:
+            self._refresh_pending()
+
+    def _add(self, row: Dict, sorted_insert: bool = False) -> None:
+        codes = parse_courses(row.get('related_course'))
+        if not codes:
+            return
+        institution_id = row['institution_id']
+        if row.get('institutions'):
+            self._institutions[institution_id] = row['institutions']
+        institution = self._institutions.get(institution_id) or {}
+
+        posting = {
+            'acceptance_id': row['id'],
+            'institution_id': institution_id,
+            'institution_name': institution.get('name'),
+            'city': institution.get('city'),
+            'state': institution.get('state'),
+            'exam_id': row.get('exam_id'),
+            'cut_score': row.get('cut_score'),
+            'credits': row.get('credits'),
+            'related_course': row.get('related_course'),
+        }
+        for code in codes:
+            postings = self._postings.get(code)
+            if postings is None:
+                postings = self._postings[code] = {}
+                self._departments[department_of(code)].add(code)
+                if sorted_insert:
+                    bisect.insort(self._codes, code)
+            postings[row['id']] = posting
+        self._by_acceptance[row['id']] = codes
+        self._by_institution[institution_id].add(row['id'])
+
+    def _remove(self, acceptance_id: str) -> None:
+        codes = self._by_acceptance.pop(acceptance_id, None)
+        if codes is None:
+            return
+        for code in codes:
+            postings = self._postings[code]
+            posting = postings.pop(acceptance_id)
+            if not postings:
+                del self._postings[code]
+                department = self._departments[department_of(code)]
+                department.discard(code)
+                if not department:
+                    del self._departments[department_of(code)]
+                i = bisect.bisect_left(self._codes, code)
+                if i < len(self._codes) and self._codes[i] == code:
+                    del self._codes[i]
+        owned = self._by_institution.get(posting['institution_id'])
+        if owned is not None:
+            owned.discard(acceptance_id)
+            if not owned:
+                del self._by_institution[posting['institution_id']]
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def courses(self, prefix: Optional[str] = None, department: Optional[str] = None) -> List[str]:
+        """Known course codes under a prefix and/or in a department, sorted"""
+        with self._lock:
+            self._ensure_current()
+            if department:
+                codes = sorted(self._departments.get(department.strip().upper(), ()))
+            else:
+                codes = self._codes
+            if prefix:
+                prefix = normalize_query(prefix)
+                lo = bisect.bisect_left(codes, prefix)
+                hi = bisect.bisect_left(codes, prefix + '\uffff', lo)
+                codes = codes[lo:hi]
+            return list(codes)
+
+    def lookup(
+        self,
+        prefix: Optional[str] = None,
+        department: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> Tuple[List[str], List[Dict], int]:
+        """
+        Postings for the matching courses, ordered by course code, then most
+        credits and lowest cut score
+
+        Returns:
+            (matching course codes, one page of postings, total postings matched)
+        """
+        codes = self.courses(prefix, department)
+        with self._lock:
+            matched = []
+            for code in codes:
+                postings = sorted(
+                    self._postings.get(code, {}).values(),
+                    key=lambda p: (-(p['credits'] or 0), p['cut_score'] or 0, p['institution_name'] or '')
+                )
+                matched.extend(dict(p, course=code) for p in postings)
+        metrics.incr('course_index.lookups')
+        return codes, matched[offset:offset + limit], len(matched)
+
+
+course_index = CourseIndex()
+
+
+def _on_invalidate(tags):
+    institution_ids = [t.split(':', 1)[1] for t in tags if t.startswith('institution:')]
+    if institution_ids:
+        course_index.mark_changed(institution_ids)
+    elif CATALOGUE_TAG in tags:
+        # A stream reset names no institutions; start over
+        course_index.invalidate()
+
+
+cache.subscribe(_on_invalidate)
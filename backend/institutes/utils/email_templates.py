@@ -1,8 +1,10 @@
 """
 Email template system for CLEPBridge
-Handles reminder emails for institutions to update their CLEP policies
+Handles reminder emails for institutions to update their CLEP policies and
+match alerts for learners
 """
-from typing import Optional
+from html import escape
+from typing import Dict, List, Optional
 
 
 def create_reminder_email(
@@ -88,3 +90,73 @@ The CLEPBridge Team
     
     return subject, text_body, html_body
 
+
+
+def create_match_alert_email(
+    learner_name: Optional[str],
+    matches: List[Dict]
+) -> tuple[str, str, str]:
+    """
+    Create an email telling a learner that new institutions accept their scores
+    
+    Args:
+        learner_name: Learner's name, if known
+        matches: One dict per policy with institution_name, city, state,
+                 exam_name and cut_score
+    
+    Returns:
+        Tuple of (subject, text_body, html_body)
+    """
+    greeting = f"Hi {learner_name}," if learner_name else "Hi there,"
+    
+    subject = "New schools accept your CLEP scores"
+    
+    lines = [
+        f"- {m['institution_name']} ({m.get('city')}, {m.get('state')}): "
+        f"{m['exam_name']} with a score of {m['cut_score']} or higher"
+        for m in matches
+    ]
+    text_body = f"""{greeting}
+
+Good news: these institutions now accept CLEP scores you have already earned:
+
+{chr(10).join(lines)}
+
+Log in to CLEPBridge to see the credits on offer.
+
+The CLEPBridge Team
+"""
+    
+    items = "\n".join(
+        f"""            <li><strong>{escape(m['institution_name'])}</strong> ({escape(str(m.get('city')))}, {escape(str(m.get('state')))}): {escape(m['exam_name'])} with a score of {m['cut_score']} or higher</li>"""
+        for m in matches
+    )
+    html_body = f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+</head>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+    <div style="background-color: #f8f9fa; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
+        <h2 style="color: #66b10e; margin-top: 0;">New Schools Accept Your Scores</h2>
+        <p>{escape(greeting)}</p>
+    </div>
+    
+    <div style="padding: 20px 0;">
+        <p>Good news: these institutions now accept CLEP scores you have already earned:</p>
+        <ul>
+{items}
+        </ul>
+        <p>Log in to CLEPBridge to see the credits on offer.</p>
+    </div>
+    
+    <div style="border-top: 1px solid #ddd; margin-top: 30px; padding-top: 20px; color: #666; font-size: 12px;">
+        <p>The CLEPBridge Team</p>
+    </div>
+</body>
+</html>
+"""
+    
+    return subject, text_body, html_body
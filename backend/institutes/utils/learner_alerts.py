@@ -0,0 +1,322 @@
+"""
+Learner match alerts for new or relaxed acceptance policies
+
+Keeps a reverse index from exam id to the learners' (score, learner id) pairs
+in `learner_exams`, sorted by score. When an institution adds an acceptance or
+lowers a cut score, the newly qualifying learners are one slice of that list,
+found with two binary searches.
+
+Nothing here runs on the request path. queue_new_matches() only queues the
+policy change; a background worker resolves it against the index and
+delivers the matches in batches, one email per learner. The index is loaded
+once by that worker. After that, each `learner_scores:<id>` tag published by
+the learners service re-reads just that learner's scores and moves their
+entries with bisect insert/remove.
+
+Alerts send real email, so they are off unless LEARNER_ALERTS_ENABLED=true.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from supabase_client import supabase
+from utils.email import send_email
+from utils.email_templates import create_match_alert_email
+from shared.cache import LEARNER_SCORES_TAG, cache
+from shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ALERTS_ENABLED = os.getenv('LEARNER_ALERTS_ENABLED', 'false').lower() == 'true'
+# Full reloads only guard against missed deltas
+SCORE_INDEX_TTL = float(os.getenv('LEARNER_SCORE_INDEX_TTL', '86400'))
+ALERT_BATCH_SIZE = int(os.getenv('LEARNER_ALERT_BATCH_SIZE', '200'))
+ALERT_FLUSH_INTERVAL = float(os.getenv('LEARNER_ALERT_FLUSH_INTERVAL', '60'))
+
+PAGE_SIZE = 1000
+# Learners per keyed re-read when applying score deltas
+DELTA_CHUNK_SIZE = 500
+
+
+class ScoreIndex:
+    """Exam id -> (score, learner id) pairs ascending, updated per learner"""
+
+    def __init__(self, ttl: float = SCORE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_exam: Dict[int, List[Tuple[int, int]]] = {}
+        # learner id -> {exam id: score}, to find a learner's old entries
+        self._by_learner: Dict[int, Dict[int, int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._changed: Set[int] = set()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def mark_changed(self, learner_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._changed.update(learner_ids)
+
+    def _load(self) -> None:
+        rows = []
+        start = 0
+        while True:
+            page = supabase.table('learner_exams').select(
+                'learner_id, eid, score'
+            ).range(start, start + PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+
+        by_exam = defaultdict(list)
+        by_learner = defaultdict(dict)
+        for row in rows:
+            if row.get('score') is not None:
+                by_exam[row['eid']].append((row['score'], row['learner_id']))
+                by_learner[row['learner_id']][row['eid']] = row['score']
+        for pairs in by_exam.values():
+            pairs.sort()
+
+        self._by_exam = dict(by_exam)
+        self._by_learner = dict(by_learner)
+        self._loaded_at = time.monotonic()
+        metrics.incr('learner_alerts.index_loads')
+        logger.info(f"Loaded learner score index: {len(rows)} scores over {len(by_exam)} exams")
+
+    def _apply_changes(self, learner_ids: List[int]) -> None:
+        """Re-read these learners' scores and move their entries"""
+        for start in range(0, len(learner_ids), DELTA_CHUNK_SIZE):
+            chunk = learner_ids[start:start + DELTA_CHUNK_SIZE]
+            rows = supabase.table('learner_exams').select(
+                'learner_id, eid, score'
+            ).in_('learner_id', chunk).execute().data
+            fresh = defaultdict(dict)
+            for row in rows:
+                if row.get('score') is not None:
+                    fresh[row['learner_id']][row['eid']] = row['score']
+
+            for learner_id in chunk:
+                old = self._by_learner.pop(learner_id, {})
+                new = fresh.get(learner_id, {})
+                for eid, score in old.items():
+                    if new.get(eid) == score:
+                        continue
+                    pairs = self._by_exam[eid]
+                    i = bisect.bisect_left(pairs, (score, learner_id))
+                    if i < len(pairs) and pairs[i] == (score, learner_id):
+                        del pairs[i]
+                for eid, score in new.items():
+                    if old.get(eid) != score:
+                        bisect.insort(self._by_exam.setdefault(eid, []), (score, learner_id))
+                if new:
+                    self._by_learner[learner_id] = new
+        metrics.incr('learner_alerts.index_deltas', len(learner_ids))
+
+    def refresh(self) -> None:
+        """Bring the index up to date; called from the alert worker only"""
+        with self._lock:
+            changed, self._changed = sorted(self._changed), set()
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._load()
+            elif changed:
+                self._apply_changes(changed)
+
+    def newly_qualifying(
+        self,
+        exam_id: int,
+        cut_score: int,
+        previous_cut: Optional[int] = None
+    ) -> List[int]:
+        """
+        Learners whose score meets `cut_score` but did not meet `previous_cut`.
+
+        Args:
+            exam_id: Exam the policy applies to
+            cut_score: New minimum score
+            previous_cut: Old minimum score for the same exam, or None if the
+                          institution did not accept this exam before
+
+        Returns:
+            List of learner ids
+        """
+        with self._lock:
+            pairs = self._by_exam.get(exam_id, [])
+            # (score,) sorts before every (score, learner_id)
+            lo = bisect.bisect_left(pairs, (cut_score,))
+            hi = len(pairs) if previous_cut is None else bisect.bisect_left(pairs, (previous_cut,))
+            return [learner_id for _, learner_id in pairs[lo:hi]]
+
+
+class MatchNotifier:
+    """Queues (learner, institution, exam) matches and emails them in batches"""
+
+    def __init__(
+        self,
+        batch_size: int = ALERT_BATCH_SIZE,
+        flush_interval: float = ALERT_FLUSH_INTERVAL
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Policy changes not yet resolved to learners
+        self._policies: List[Tuple[str, int, int, Optional[int]]] = []
+        self._pending: List[Tuple[int, str, int, int]] = []
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def enqueue_policy(
+        self,
+        institution_id: str,
+        exam_id: int,
+        cut_score: int,
+        previous_cut: Optional[int]
+    ) -> None:
+        """Queue a policy change; the worker finds the learners it qualifies"""
+        with self._lock:
+            self._policies.append((institution_id, exam_id, cut_score, previous_cut))
+        self._start()
+        self._wake.set()
+
+    def _resolve(self) -> None:
+        with self._lock:
+            policies, self._policies = self._policies, []
+        if not policies:
+            return
+        score_index.refresh()
+        for institution_id, exam_id, cut_score, previous_cut in policies:
+            learner_ids = score_index.newly_qualifying(exam_id, cut_score, previous_cut)
+            with self._lock:
+                self._pending.extend(
+                    (learner_id, institution_id, exam_id, cut_score) for learner_id in learner_ids
+                )
+            metrics.incr('learner_alerts.queued', len(learner_ids))
+
+    def _start(self) -> None:
+        if self._worker is not None:
+            return
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self._resolve()
+                with self._lock:
+                    backlog = len(self._pending)
+                if backlog >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    while self.flush():
+                        pass
+                    last_flush = time.monotonic()
+            except Exception as e:
+                logger.error(f"Learner alert delivery failed: {e}")
+
+    def flush(self) -> int:
+        """Deliver up to one batch of queued matches; returns matches taken"""
+        with self._lock:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+        if not batch:
+            return 0
+
+        # Latest cut per (learner, institution, exam) wins if a policy changed twice
+        matches = defaultdict(dict)
+        for learner_id, institution_id, exam_id, cut_score in batch:
+            matches[learner_id][(institution_id, exam_id)] = cut_score
+
+        # Three lookups for the whole batch instead of three per learner
+        learners = supabase.table('learners').select('id, name, email').in_(
+            'id', list(matches)
+        ).execute().data
+        institution_ids = list({inst for m in matches.values() for inst, _ in m})
+        institutions = supabase.table('institutions').select('id, name, city, state').in_(
+            'id', institution_ids
+        ).execute().data
+        exam_ids = list({exam for m in matches.values() for _, exam in m})
+        exams = supabase.table('exams').select('id, name').in_('id', exam_ids).execute().data
+
+        institution_map = {i['id']: i for i in institutions}
+        exam_map = {e['id']: e['name'] for e in exams}
+
+        sent = 0
+        for learner in learners:
+            if not learner.get('email'):
+                continue
+            learner_matches = []
+            for (institution_id, exam_id), cut_score in matches[learner['id']].items():
+                inst = institution_map.get(institution_id)
+                if not inst:
+                    continue
+                learner_matches.append({
+                    'institution_name': inst['name'],
+                    'city': inst.get('city'),
+                    'state': inst.get('state'),
+                    'exam_name': exam_map.get(exam_id, 'CLEP exam'),
+                    'cut_score': cut_score,
+                })
+            if not learner_matches:
+                continue
+
+            subject, text_body, html_body = create_match_alert_email(
+                learner.get('name'), learner_matches
+            )
+            if send_email(learner['email'], subject, text_body, html_body):
+                sent += 1
+
+        metrics.incr('learner_alerts.sent', sent)
+        return len(batch)
+
+
+score_index = ScoreIndex()
+notifier = MatchNotifier()
+
+
+def _on_cache_invalidate(tags):
+    prefix = f"{LEARNER_SCORES_TAG}:"
+    learner_ids = {int(t[len(prefix):]) for t in tags if t.startswith(prefix)}
+    if learner_ids:
+        score_index.mark_changed(learner_ids)
+    elif LEARNER_SCORES_TAG in tags:
+        # A stream reset names no learners; reload on the next resolve
+        score_index.invalidate()
+
+
+cache.subscribe(_on_cache_invalidate)
+
+
+def queue_new_matches(
+    institution_id: str,
+    exam_id: int,
+    cut_score: int,
+    previous_cut: Optional[int] = None
+) -> bool:
+    """
+    Queue alerts for learners who qualify under a new or relaxed policy.
+
+    Args:
+        institution_id: Institution that changed its policy
+        exam_id: Exam the acceptance applies to
+        cut_score: New minimum score
+        previous_cut: Previous minimum for the same exam (None for a new acceptance)
+
+    Returns:
+        bool: Whether the change was queued (alerts on and the policy relaxed)
+    """
+    if not ALERTS_ENABLED:
+        return False
+    if previous_cut is not None and cut_score >= previous_cut:
+        return False
+    # Alerts are best effort; the policy write has already succeeded
+    try:
+        notifier.enqueue_policy(institution_id, exam_id, cut_score, previous_cut)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to queue learner alerts for exam {exam_id}: {e}")
+        return False
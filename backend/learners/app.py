@@ -1,7 +1,18 @@
+import os
+import sys
+
+# Make the backend-wide `shared` package importable when run from this directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
 from flask import Flask
 from flask_cors import CORS
+from routes.exams import exams_bp
 from routes.users import users_bp
 from routes.universities import universities_bp
+from services.clusters import cluster_index
+from services.replica import replica
+from shared.metrics import metrics
+from shared.response import respond
 
 def create_app():
     app = Flask(__name__)
@@ -17,6 +28,16 @@ def create_app():
 
     app.register_blueprint(users_bp, url_prefix="/learners")
     app.register_blueprint(universities_bp, url_prefix="/universities")
+    app.register_blueprint(exams_bp, url_prefix="/exams")
+
+    if replica is not None:
+        replica.start()
+    # The first build takes seconds; /universities/clusters answers 503 until then
+    cluster_index.warm()
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        return respond(metrics.snapshot()), 200
 
     return app
 
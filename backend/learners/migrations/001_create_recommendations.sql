@@ -0,0 +1,14 @@
+-- Materialized per-learner recommendations (services/recommendations.py).
+--
+-- One row per learner holding their eligible institutions and credit totals,
+-- rewritten whenever the learner's scores or a policy on one of their exams
+-- changes, and by the nightly `python -m services.recommendations rebuild`.
+
+CREATE TABLE IF NOT EXISTS recommendations (
+    learner_id BIGINT PRIMARY KEY,
+    institutions JSONB NOT NULL DEFAULT '[]'::jsonb,
+    institution_count INTEGER NOT NULL DEFAULT 0,
+    total_credits INTEGER NOT NULL DEFAULT 0,
+    best_credits INTEGER NOT NULL DEFAULT 0,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,7 @@
+-- Change watermark for favorites, so the local replica (services/replica.py)
+-- pulls only favorites added since its last sync instead of re-downloading
+-- the whole table every time. Removed favorites are dropped by the replica's
+-- periodic key reconcile.
+
+ALTER TABLE favorites ADD COLUMN IF NOT EXISTS last_updated TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_favorites_last_updated ON favorites (last_updated);
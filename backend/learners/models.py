@@ -1,6 +1,8 @@
 from dataclasses import dataclass, field
 from typing import Dict, Optional
 
+from shared.cache import shared_type
+
 @dataclass
 class User: 
     name: str
@@ -8,3 +10,50 @@ class User:
     zipcode: int 
     maxCredits: Optional[int] = None
     exams: Dict[str, int] = field(default_factory = dict)
+
+
+@dataclass
+class LearnerCreate:
+    auth_uid: str
+    name: str
+    email: str
+    zipcode: str
+
+
+@dataclass
+class LearnerExam:
+    eid: int
+    score: int
+
+
+# Match results are cached in the shared tier (services/match_cache.py)
+@shared_type
+@dataclass
+class InstitutionHit:
+    msea_org_id: str
+    name: str
+    city: Optional[str]
+    state: Optional[str]
+    zip: Optional[str]
+    eid: int
+    exam_name: str
+    required_cut: int
+    learner_score: int
+    credits: int
+    related_course: Optional[str] = None
+    last_updated: Optional[str] = None
+    freshness: str = "old"
+    can_use_for_failed_courses: Optional[bool] = None
+    can_enrolled_students_use_clep: Optional[bool] = None
+    distance_miles: Optional[float] = None
+
+
+@dataclass
+class Favorite:
+    msea_org_id: str
+    name: str
+    city: Optional[str] = None
+    state: Optional[str] = None
+    zip: Optional[str] = None
+    max_credits: Optional[int] = None
+    last_updated: Optional[str] = None
@@ -0,0 +1,41 @@
+from flask import Blueprint, request
+from service import exam_institutions
+from services.leaderboard import SORTS, cursor_key
+from shared.response import respond
+from utils import decode_cursor, encode_cursor
+
+exams_bp = Blueprint("exams", __name__, url_prefix="/exams")
+
+LEADERBOARD_DEFAULT_LIMIT = 20
+LEADERBOARD_MAX_LIMIT = 100
+
+
+@exams_bp.route("/<int:eid>/institutions", methods=["GET"])
+async def list_exam_institutions(eid: int):
+    """
+    Institutions accepting an exam, ranked by `sort`: "credits" (most credits
+    first, the default) or "cut_score" (lowest cut score first).
+    Pass `next_cursor` back as `cursor` for the following page.
+    """
+    try:
+        sort = request.args.get("sort", "credits")
+        if sort not in SORTS:
+            return respond({"error": f"sort must be one of {list(SORTS)}"}), 400
+
+        try:
+            after = cursor_key(decode_cursor(request.args.get("cursor")))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+
+        limit = request.args.get("limit", LEADERBOARD_DEFAULT_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= LEADERBOARD_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {LEADERBOARD_MAX_LIMIT}"}), 400
+
+        result = await exam_institutions(eid, sort, limit, after)
+        if result is None:
+            return respond({"error": "Exam not found"}), 404
+        next_key = result.pop("next_key")
+        result["next_cursor"] = encode_cursor(list(next_key)) if next_key is not None else None
+        return respond(result), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
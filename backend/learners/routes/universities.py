@@ -1,14 +1,412 @@
-from flask import Blueprint, jsonify
+import os
+from flask import Blueprint, request
+from models import LearnerExam
+from service import (
+    compare_institutions,
+    faceted_search,
+    nearby_institutions,
+    plan_exams,
+    ranked_matches,
+    search_matches_nearby,
+    what_if,
+)
+from services.clusters import MAX_ZOOM, ClusterIndexNotReady, cluster_index
+from services.facets import FacetQueryError, parse_filters, parse_sort
+from services.geo import CentroidsUnavailable, geo_index
+from services.ranking import cursor_key
+from services.whatif import NEAR_MISS_WINDOW
 from services.supabase_client import supabase
+from shared.autocomplete import InstitutionAutocomplete
+from shared.fields import (
+    ACCEPTANCE_COLUMNS,
+    EXAM_COLUMNS,
+    INSTITUTION_COLUMNS,
+    FieldSelectionError,
+    Projection,
+)
+from shared.cache import CATALOGUE_TAG, cache
+from shared.etag import make_etag, not_modified, validators
+from shared.response import encode, respond, respond_raw, wants_msgpack
+from shared.swr import CachedBody, SWRCache
 from typing import List, Dict, Any
+from utils import decode_cursor, encode_cursor, is_valid_zip, parse_scores_param
 
 universities_bp = Blueprint("universities", __name__, url_prefix='/universities')
 
+UNIVERSITY_PROJECTION = Projection(
+    columns=INSTITUTION_COLUMNS,
+    default=("id", "name", "city", "state", "zip", "max_credits", "last_updated"),
+    relations={
+        "acceptances": Projection(
+            columns=ACCEPTANCE_COLUMNS,
+            default=("exam_id", "cut_score", "credits"),
+            relations={
+                "exams": Projection(columns=EXAM_COLUMNS, default=("id", "name"))
+            },
+        )
+    },
+)
+
+UNIVERSITIES_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=600"
+
+NEARBY_DEFAULT_RADIUS = 25.0
+NEARBY_MAX_RADIUS = 500.0
+NEARBY_DEFAULT_LIMIT = 50
+NEARBY_MAX_LIMIT = 500
+
+# Clusters only change on policy writes; let the map reuse them briefly
+CLUSTERS_CACHE_CONTROL = "public, max-age=60"
+# Seconds a client should wait while the cluster index is still being built
+CLUSTERS_RETRY_AFTER = "2"
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+
+RANKED_DEFAULT_LIMIT = 20
+RANKED_MAX_LIMIT = 100
+
+WHAT_IF_MAX_WINDOW = 20
+
+COMPARE_MAX_INSTITUTIONS = 25
+
+EXAM_PLAN_MAX_GOAL = 200
+EXAM_PLAN_MAX_CANDIDATES = 500
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Name index kept current from the change_log feed
+institution_autocomplete = InstitutionAutocomplete(
+    supabase, columns="id, msea_org_id, name, city, state"
+)
+
+# Serialized catalogue responses, keyed by (select, msgpack?)
+catalogue_cache = SWRCache(
+    "universities",
+    soft_ttl=float(os.getenv("CATALOGUE_SOFT_TTL", "60")),
+    hard_ttl=float(os.getenv("CATALOGUE_HARD_TTL", "3600")),
+)
+
+
+def _on_invalidate(tags):
+    # Acceptance writes in the institutions service publish the catalogue tag
+    if CATALOGUE_TAG in tags:
+        catalogue_cache.invalidate()
+
+
+cache.subscribe(_on_invalidate)
+
+
+def _catalogue_version() -> str:
+    """Version stamp for the institution catalogue.
+
+    Every acceptance write touches institutions.last_updated, so the newest
+    timestamp plus the row count changes whenever the catalogue does.
+    """
+    probe = (
+        supabase.table("institutions")
+        .select("last_updated", count="exact")
+        .not_.is_("last_updated", "null")
+        .order("last_updated", desc=True)
+        .limit(1)
+        .execute()
+    )
+    newest = probe.data[0]["last_updated"] if probe.data else None
+    return f"{probe.count}:{newest}"
+
+
+def _load_catalogue(select: str, as_msgpack: bool) -> CachedBody:
+    # Probe the version first so a concurrent write can only make the ETag older
+    etag = make_etag("universities", _catalogue_version(), select)
+    response = supabase.table("institutions").select(select).execute()
+    body, mimetype = encode(response.data, as_msgpack)
+    return CachedBody(body, mimetype, etag)
+
+
+def _shared_catalogue(select: str, as_msgpack: bool) -> CachedBody:
+    """Catalogue body from the cross-worker cache, loading it on a miss."""
+    return cache.get_or_load(
+        f"universities:{select}:{int(as_msgpack)}",
+        lambda: _load_catalogue(select, as_msgpack),
+        ttl=catalogue_cache.hard_ttl,
+        tags=[CATALOGUE_TAG],
+    )
+
 
 @universities_bp.route("", methods=["GET"])
 def list_universities():
     try:
-        response = supabase.table("institutions").select("*").execute()
-        return jsonify(response.data), 200
+        select = UNIVERSITY_PROJECTION.select(request.args.get("fields"))
+        as_msgpack = wants_msgpack()
+        cached = catalogue_cache.get(
+            (select, as_msgpack), lambda: _shared_catalogue(select, as_msgpack)
+        )
+
+        not_modified_response = not_modified(cached.etag, UNIVERSITIES_CACHE_CONTROL)
+        if not_modified_response:
+            return not_modified_response
+
+        return respond_raw(
+            cached.body,
+            cached.mimetype,
+            headers=validators(cached.etag, UNIVERSITIES_CACHE_CONTROL),
+        ), 200
+    except FieldSelectionError as e:
+        return respond({"error": str(e)}), 400
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/nearby", methods=["GET"])
+async def list_nearby_universities():
+    """
+    Institutions within `radius` miles of a ZIP code, nearest first.
+    With `scores=eid:score,...` only the learner's matches are returned.
+    """
+    try:
+        zipcode = (request.args.get("zip") or "").strip()
+        if not is_valid_zip(zipcode):
+            return respond({"error": "zip must be a 5-digit ZIP code"}), 400
+
+        radius = request.args.get("radius", NEARBY_DEFAULT_RADIUS, type=float)
+        if radius is None or not 0 < radius <= NEARBY_MAX_RADIUS:
+            return respond({"error": f"radius must be between 0 and {NEARBY_MAX_RADIUS:g} miles"}), 400
+
+        limit = request.args.get("limit", NEARBY_DEFAULT_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= NEARBY_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {NEARBY_MAX_LIMIT}"}), 400
+
+        try:
+            scores = parse_scores_param(request.args.get("scores"))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+
+        origin = geo_index.locate(zipcode)
+        if origin is None:
+            return respond({"error": f"Unknown ZIP code {zipcode}"}), 404
+
+        payload = {
+            "origin": {"zip": zipcode, "lat": origin[0], "lng": origin[1]},
+            "radius": radius,
+        }
+        if scores:
+            exams = [LearnerExam(eid=eid, score=score) for eid, score in scores.items()]
+            payload["matches"] = await search_matches_nearby(exams, origin, radius, limit)
+        else:
+            payload["institutions"] = await nearby_institutions(origin, radius, limit)
+
+        return respond(payload), 200
+    except CentroidsUnavailable as e:
+        return respond({"error": str(e)}), 503
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/search", methods=["GET"])
+async def search_universities():
+    """
+    Institutions filtered by facets (comma-separated values OR within a facet,
+    AND across facets), with live per-facet counts. `sort` takes keys such as
+    "-credits,fee,name"; `scores=eid:score,...` restricts the search to the
+    learner's matches and sorts "credits" by matched credits.
+    """
+    try:
+        limit = request.args.get("limit", SEARCH_DEFAULT_LIMIT, type=int)
+        offset = request.args.get("offset", 0, type=int)
+        if limit is None or not 1 <= limit <= SEARCH_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {SEARCH_MAX_LIMIT}"}), 400
+        if offset is None or offset < 0:
+            return respond({"error": "offset must be a non-negative integer"}), 400
+
+        try:
+            scores = parse_scores_param(request.args.get("scores"))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+        exams = [LearnerExam(eid=eid, score=score) for eid, score in scores.items()]
+
+        result = await faceted_search(
+            parse_filters(request.args),
+            parse_sort(request.args.get("sort")),
+            limit,
+            offset,
+            exams or None,
+        )
+        return respond(result), 200
+    except FacetQueryError as e:
+        return respond({"error": str(e)}), 400
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/ranked", methods=["GET"])
+async def list_ranked_universities():
+    """
+    A learner's matched institutions, one entry each, ranked by credits
+    capped at the institution's max_credits and the learner's `max_credits`.
+    Pass `next_cursor` back as `cursor` for the following page.
+    """
+    try:
+        try:
+            scores = parse_scores_param(request.args.get("scores"))
+            after = cursor_key(decode_cursor(request.args.get("cursor")))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+        if not scores:
+            return respond({"error": "scores is required (eid:score,...)"}), 400
+
+        limit = request.args.get("limit", RANKED_DEFAULT_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= RANKED_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {RANKED_MAX_LIMIT}"}), 400
+
+        max_credits = request.args.get("max_credits", type=int)
+        if "max_credits" in request.args and (max_credits is None or max_credits < 0):
+            return respond({"error": "max_credits must be a non-negative integer"}), 400
+
+        exams = [LearnerExam(eid=eid, score=score) for eid, score in scores.items()]
+        page, next_key, total = await ranked_matches(exams, max_credits, limit, after)
+        return respond({
+            "institutions": page,
+            "total": total,
+            "next_cursor": encode_cursor(next_key) if next_key is not None else None,
+        }), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/compare", methods=["GET"])
+async def compare_universities():
+    """
+    Side-by-side comparison of up to 25 institutions (`institutions`,
+    comma-separated msea_org_ids): cut score, credits and eligibility for
+    every exam. Rows follow `exams`, columns follow `institutions`; cells are
+    null where the exam is not accepted.
+    """
+    try:
+        try:
+            scores = parse_scores_param(request.args.get("scores"))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+
+        raw_ids = request.args.get("institutions")
+        org_ids = list(dict.fromkeys(o.strip() for o in (raw_ids or "").split(",") if o.strip()))
+        if not 1 <= len(org_ids) <= COMPARE_MAX_INSTITUTIONS:
+            return respond({
+                "error": f"institutions must list between 1 and {COMPARE_MAX_INSTITUTIONS} ids"
+            }), 400
+
+        exams = [LearnerExam(eid=eid, score=score) for eid, score in scores.items()]
+        try:
+            result = await compare_institutions(exams, org_ids)
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+        return respond(result), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/what-if", methods=["GET"])
+async def what_if_universities():
+    """
+    How many more institutions would accept the learner at every score 20-80
+    on every exam (`additional_institutions[i]` is for `scores[i]`), plus the
+    institutions missed by at most `window` points.
+    """
+    try:
+        try:
+            scores = parse_scores_param(request.args.get("scores"))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+
+        window = request.args.get("window", NEAR_MISS_WINDOW, type=int)
+        if window is None or not 1 <= window <= WHAT_IF_MAX_WINDOW:
+            return respond({"error": f"window must be between 1 and {WHAT_IF_MAX_WINDOW}"}), 400
+
+        exams = [LearnerExam(eid=eid, score=score) for eid, score in scores.items()]
+        return respond(await what_if(exams, window)), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/exam-plan", methods=["GET"])
+async def plan_university_exams():
+    """
+    The fewest additional exams that reach `goal` credits at each candidate
+    institution: `institutions` (comma-separated msea_org_ids) or every
+    institution in `state`.
+    """
+    try:
+        try:
+            scores = parse_scores_param(request.args.get("scores"))
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+
+        goal = request.args.get("goal", type=int)
+        if goal is None or not 1 <= goal <= EXAM_PLAN_MAX_GOAL:
+            return respond({"error": f"goal must be between 1 and {EXAM_PLAN_MAX_GOAL} credits"}), 400
+
+        raw_ids = request.args.get("institutions")
+        org_ids = [o.strip() for o in raw_ids.split(",") if o.strip()] if raw_ids else None
+        state = (request.args.get("state") or "").strip().upper() or None
+        if not org_ids and not state:
+            return respond({"error": "institutions or state is required"}), 400
+
+        limit = request.args.get("limit", EXAM_PLAN_MAX_CANDIDATES, type=int)
+        if limit is None or not 1 <= limit <= EXAM_PLAN_MAX_CANDIDATES:
+            return respond({"error": f"limit must be between 1 and {EXAM_PLAN_MAX_CANDIDATES}"}), 400
+
+        exams = [LearnerExam(eid=eid, score=score) for eid, score in scores.items()]
+        try:
+            plans = await plan_exams(exams, goal, org_ids, state, EXAM_PLAN_MAX_CANDIDATES)
+        except ValueError as e:
+            return respond({"error": str(e)}), 400
+        return respond({"goal": goal, "institutions": plans[:limit]}), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/clusters", methods=["GET"])
+def list_university_clusters():
+    """
+    Map clusters (count, centroid, bounding box) for a viewport and zoom.
+    bbox is "west,south,east,north" in degrees.
+    """
+    try:
+        try:
+            west, south, east, north = (float(v) for v in request.args.get("bbox", "").split(","))
+        except ValueError:
+            return respond({"error": "bbox must be west,south,east,north"}), 400
+        if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+            return respond({"error": "bbox is out of range"}), 400
+
+        zoom = request.args.get("zoom", type=int)
+        if zoom is None or not 0 <= zoom <= 22:
+            return respond({"error": "zoom must be an integer between 0 and 22"}), 400
+
+        clusters = cluster_index.current().query((west, south, east, north), zoom)
+        return respond(
+            {"zoom": min(zoom, MAX_ZOOM), "clusters": clusters},
+            headers={"Cache-Control": CLUSTERS_CACHE_CONTROL},
+        ), 200
+    except ClusterIndexNotReady as e:
+        return respond({"error": str(e)}, headers={"Retry-After": CLUSTERS_RETRY_AFTER}), 503
+    except CentroidsUnavailable as e:
+        return respond({"error": str(e)}), 503
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@universities_bp.route("/autocomplete", methods=["GET"])
+def autocomplete_universities():
+    """
+    Institution name suggestions for a partial, possibly misspelled query.
+    Exact prefixes rank above typo corrections.
+    """
+    try:
+        limit = request.args.get("limit", AUTOCOMPLETE_DEFAULT_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= AUTOCOMPLETE_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {AUTOCOMPLETE_MAX_LIMIT}"}), 400
+
+        results = institution_autocomplete.search(request.args.get("q", ""), limit)
+        return respond({"institutions": results}), 200
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return respond({"error": str(e)}), 500
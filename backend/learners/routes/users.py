@@ -1,23 +1,34 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request
+from service import (
+    DASHBOARD_MATCH_LIMIT,
+    favorites_with_matches,
+    get_recommendations,
+    learner_dashboard,
+)
 from services.supabase_client import supabase
+from shared.response import respond
+from utils import encode_cursor
 
 users_bp = Blueprint('users', __name__, url_prefix='/learners')
 
+# Same bound as /universities/ranked
+DASHBOARD_MAX_LIMIT = 100
+
 @users_bp.route('/signup', methods=['POST'])
 def signup():
     data = request.get_json()
     if not data:
-        return jsonify({"error": "Missing JSON payload"}), 400
+        return respond({"error": "Missing JSON payload"}), 400
 
     # Required fields
     required_fields = ["email", "password", "name", "zipcode"]
     for field in required_fields:
         if not data.get(field):
-            return jsonify({"error": f"{field} is required"}), 400
+            return respond({"error": f"{field} is required"}), 400
 
     # Password validation
     if len(data["password"]) < 6:
-        return jsonify({"error": "Password must be at least 6 characters"}), 400
+        return respond({"error": "Password must be at least 6 characters"}), 400
 
     try:
         # Attempt signup
@@ -30,10 +41,10 @@ def signup():
         if getattr(auth_response, "error", None):
             # Supabase sometimes puts the message directly in .error
             error_message = getattr(auth_response.error, "message", str(auth_response.error))
-            return jsonify({"error": error_message}), 400
+            return respond({"error": error_message}), 400
 
         if not getattr(auth_response, "user", None):
-            return jsonify({"error": "Failed to create user"}), 400
+            return respond({"error": "Failed to create user"}), 400
 
         # Insert additional user data
         user_data = {
@@ -48,7 +59,7 @@ def signup():
         insert_response = supabase.table("users").insert(user_data).execute()
         if getattr(insert_response, "error", None):
             insert_error = getattr(insert_response.error, "message", str(insert_response.error))
-            return jsonify({"error": insert_error}), 500
+            return respond({"error": insert_error}), 500
 
         # Return a safe JSON-serializable user object
         user_dict = {
@@ -58,11 +69,11 @@ def signup():
             "role": auth_response.user.role
         }
 
-        return jsonify({"success": True, "user": user_dict}), 201
+        return respond({"success": True, "user": user_dict}), 201
 
     except Exception as e:
         print("Error creating user:", e)
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
 
 
 
@@ -70,7 +81,7 @@ def signup():
 def login():
     data = request.get_json()
     if not data or "email" not in data or "password" not in data:
-        return jsonify({"error": "Email and password are required"}), 400
+        return respond({"error": "Email and password are required"}), 400
 
     try:
         # Sign in with Supabase Auth
@@ -83,16 +94,54 @@ def login():
             # Get user data from your users table
             user_data = supabase.table("users").select("*").eq("id", auth_response.user.id).execute()
             
-            return jsonify({
+            return respond({
                 "success": True,
                 "session": auth_response.session,
                 "user": user_data.data[0] if user_data.data else None
             }), 200
             
-        return jsonify({"error": "Invalid credentials"}), 401
+        return respond({"error": "Invalid credentials"}), 401
 
     except Exception as e:
         print("Error logging in:", e)
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}), 500
+
+
+@users_bp.route('/<int:learner_id>/favorites', methods=['GET'])
+async def list_learner_favorites(learner_id: int):
+    """Favorite institutions, each with a summary of the learner's matches there."""
+    try:
+        return respond({"favorites": await favorites_with_matches(learner_id)}), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
 
 
+@users_bp.route('/<int:learner_id>/recommendations', methods=['GET'])
+async def get_learner_recommendations(learner_id: int):
+    """Materialized recommendations: one keyed read, computed on first use."""
+    try:
+        return respond(await get_recommendations(learner_id)), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
+
+
+@users_bp.route('/<int:learner_id>/dashboard', methods=['GET'])
+async def get_learner_dashboard(learner_id: int):
+    """
+    Everything the learner dashboard shows, in one round trip. Only the first
+    `limit` matches are included; pass `next_cursor` as `cursor` (with the
+    learner's scores) to /universities/ranked for the rest.
+    """
+    try:
+        limit = request.args.get("limit", DASHBOARD_MATCH_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= DASHBOARD_MAX_LIMIT:
+            return respond({"error": f"limit must be between 1 and {DASHBOARD_MAX_LIMIT}"}), 400
+
+        dashboard = await learner_dashboard(learner_id, limit, include_timings=current_app.debug)
+        if dashboard is None:
+            return respond({"error": "Learner not found"}), 404
+        next_key = dashboard.pop("next_key")
+        dashboard["next_cursor"] = encode_cursor(next_key) if next_key is not None else None
+        return respond(dashboard), 200
+    except Exception as e:
+        return respond({"error": str(e)}), 500
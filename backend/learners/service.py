@@ -1,20 +1,30 @@
-from datetime import datetime, timedelta, timezone
-from typing import List, Optional
-from backend.learners.services.supabase_client import supabase
-from backend.learners.models import LearnerCreate, LearnerExam, InstitutionHit, Favorite
+import asyncio
+import time
+from dataclasses import asdict, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+from services.supabase_client import supabase
+from services.facets import facet_index
+from services.geo import geo_index
+from services.match_index import match_index
+from services import exam_plan, match_cache, ranking, recommendations
+from services.compare import compare
+from services.leaderboard import leaderboard
+from services.replica import replica
+from services.matching import freshness, search_snapshot
+from services.snapshot import snapshots
+from services.whatif import SCORE_MAX, SCORE_MIN, whatif_index
+from shared.cache import LEARNER_SCORES_TAG, cache, learner_scores_tag
+from models import LearnerCreate, LearnerExam, InstitutionHit, Favorite
 
-
-def _freshness(ts: Optional[str]) -> str:
-    if ts is None:
-        return "old"
-    dt = datetime.fromisoformat(ts.replace(" ", "T"))
-    now = datetime.now(timezone.utc)
-    delta = now - dt.replace(tzinfo=timezone.utc)
-    if delta <= timedelta(days=180):
-        return "fresh"
-    if delta <= timedelta(days=365):
-        return "stale"
-    return "old"
+# Only the columns the matching code and response models actually read
+ACCEPTANCE_SELECT = "msea_org_id, eid, cut_score, credits, related_course, last_updated"
+INSTITUTION_HIT_SELECT = (
+    "msea_org_id, name, city, state, zip, "
+    "can_use_for_failed_courses, can_enrolled_students_use_clep"
+)
+FAVORITE_INSTITUTION_SELECT = "msea_org_id, name, city, state, zip, max_credits, last_updated"
+# Matches returned with the dashboard; the rest page through ranked_matches
+DASHBOARD_MATCH_LIMIT = 20
 
 
 async def create_or_update_learner(payload: LearnerCreate):
@@ -47,18 +57,121 @@ async def upsert_learner_exams(learner_id: int, exams: List[LearnerExam]):
     for e in exams:
         rows.append({"learner_id": learner_id, "eid": e.eid, "score": e.score})
     supabase.table("learner_exams").upsert(rows).execute()
+    # Lets the institutions service update this learner in its score index
+    cache.invalidate_tags(LEARNER_SCORES_TAG, learner_scores_tag(learner_id))
+    _refresh_recommendations(learner_id)
     return len(rows)
 
 
+def _refresh_recommendations(learner_id: int) -> dict:
+    exams = recommendations.learner_scores([learner_id])[learner_id]
+    row = recommendations.summarize(
+        learner_id, _find_matches(exams, None, None), _institution_rows()
+    )
+    recommendations.store([row])
+    return row
+
+
+async def get_recommendations(learner_id: int) -> dict:
+    row = recommendations.load(learner_id)
+    if row is None:
+        row = _refresh_recommendations(learner_id)
+    return row
+
+
+def _search_replica(
+    exams: List[LearnerExam],
+    zipcode: Optional[str],
+    state: Optional[str],
+) -> List[InstitutionHit]:
+    score_map = {e.eid: e.score for e in exams}
+    matched = replica.matching_acceptances(score_map)
+    inst_map = replica.institutions({a["msea_org_id"] for a in matched})
+    exam_map = replica.exam_names()
+
+    results = []
+    for acc in matched:
+        inst = inst_map.get(acc["msea_org_id"])
+        if not inst:
+            continue
+
+        if zipcode and inst["zip"] != zipcode:
+            continue
+        if state and inst["state"] != state:
+            continue
+
+        results.append(
+            InstitutionHit(
+                msea_org_id=acc["msea_org_id"],
+                name=inst["name"],
+                city=inst["city"],
+                state=inst["state"],
+                zip=inst["zip"],
+                eid=acc["eid"],
+                exam_name=exam_map.get(acc["eid"], "Unknown"),
+                required_cut=acc["cut_score"],
+                learner_score=score_map[acc["eid"]],
+                credits=acc["credits"],
+                related_course=acc["related_course"],
+                last_updated=acc["last_updated"],
+                freshness=freshness(acc["last_updated"]),
+                can_use_for_failed_courses=inst["can_use_for_failed_courses"],
+                can_enrolled_students_use_clep=inst["can_enrolled_students_use_clep"],
+            )
+        )
+
+    return results
+
+
 async def search_matches(
     learner_id: int,
     exams: List[LearnerExam],
     zipcode: Optional[str],
     state: Optional[str],
+) -> List[InstitutionHit]:
+    return _find_matches(exams, zipcode, state)
+
+
+def _find_matches(
+    exams: List[LearnerExam],
+    zipcode: Optional[str],
+    state: Optional[str],
+) -> List[InstitutionHit]:
+    # The shared-memory index (or failing that, a mapped snapshot file)
+    # answers without any database round trip
+    with match_index.acquire() as index:
+        if index is not None:
+            return search_snapshot(index, exams, zipcode, state)
+
+    snapshot = snapshots.current()
+    if snapshot is not None:
+        return search_snapshot(snapshot, exams, zipcode, state)
+
+    # Database-backed paths go through the threshold-signature cache
+    if replica is not None and replica.is_ready():
+        return match_cache.get_matches(
+            exams, zipcode, state, f"replica:{replica.version()}",
+            replica.cut_scores, _search_replica,
+        )
+
+    return match_cache.get_matches(
+        exams, zipcode, state, "db", _query_cut_scores, _query_matches
+    )
+
+
+def _query_cut_scores(eid: int) -> List[int]:
+    rows = supabase.table("acceptance").select("cut_score").eq("eid", eid).execute().data
+    return [r["cut_score"] for r in rows]
+
+
+def _query_matches(
+    exams: List[LearnerExam],
+    zipcode: Optional[str],
+    state: Optional[str],
 ) -> List[InstitutionHit]:
     exam_ids = [e.eid for e in exams]
     acceptance = (
-        supabase.table("acceptance").select("*").in_("eid", exam_ids).execute().data
+        supabase.table("acceptance").select(ACCEPTANCE_SELECT).in_("eid", exam_ids).execute().data
     )
 
     score_map = {e.eid: e.score for e in exams}
@@ -75,7 +188,7 @@ async def search_matches(
     org_ids = list({a["msea_org_id"] for a in matched_acceptance})
     inst_rows = (
         supabase.table("institutions")
-        .select("*")
+        .select(INSTITUTION_HIT_SELECT)
         .in_("msea_org_id", org_ids)
         .execute()
         .data
@@ -84,7 +197,7 @@ async def search_matches(
     inst_map = {i["msea_org_id"]: i for i in inst_rows}
 
     eid_list = [a["eid"] for a in matched_acceptance]
-    exam_info = supabase.table("exams").select("*").in_("eid", eid_list).execute().data
+    exam_info = supabase.table("exams").select("eid, name").in_("eid", eid_list).execute().data
     exam_map = {e["eid"]: e["name"] for e in exam_info}
 
     results = []
@@ -112,7 +225,7 @@ async def search_matches(
                 credits=acc["credits"],
                 related_course=acc.get("related_course"),
                 last_updated=acc.get("last_updated"),
-                freshness=_freshness(acc.get("last_updated")),
+                freshness=freshness(acc.get("last_updated")),
                 can_use_for_failed_courses=inst.get("can_use_for_failed_courses"),
                 can_enrolled_students_use_clep=inst.get(
                     "can_enrolled_students_use_clep"
@@ -123,16 +236,215 @@ async def search_matches(
     return results
 
 
+async def nearby_institutions(
+    origin: Tuple[float, float], radius_miles: float, limit: int
+) -> List[dict]:
+    index = geo_index.current()
+    return [
+        {**index.records[org_id], "distance_miles": round(miles, 2)}
+        for org_id, miles in index.within(*origin, radius_miles, limit)
+    ]
+
+
+async def search_matches_nearby(
+    exams: List[LearnerExam],
+    origin: Tuple[float, float],
+    radius_miles: float,
+    limit: int,
+) -> List[InstitutionHit]:
+    distances = dict(geo_index.current().within(*origin, radius_miles))
+    hits = [
+        replace(hit, distance_miles=round(distances[hit.msea_org_id], 2))
+        for hit in _find_matches(exams, None, None)
+        if hit.msea_org_id in distances
+    ]
+    hits.sort(key=lambda h: (h.distance_miles, -(h.credits or 0)))
+    return hits[:limit]
+
+
+async def faceted_search(
+    filters: Dict[str, List[str]],
+    sort: Sequence[str],
+    limit: int,
+    offset: int,
+    exams: Optional[List[LearnerExam]] = None,
+) -> dict:
+    """Facet-filtered institutions; with `exams`, only the learner's matches."""
+    matched_credits = None
+    if exams:
+        matched_credits = {}
+        for hit in _find_matches(exams, None, None):
+            matched_credits[hit.msea_org_id] = matched_credits.get(hit.msea_org_id, 0) + (hit.credits or 0)
+    return facet_index.current().search(filters, sort, limit, offset, matched_credits)
+
+
+def _institution_rows() -> Dict[str, dict]:
+    """msea_org_id -> institution row (max_credits, transcription_fee, ...)."""
+    index = facet_index.current()
+    return {org_id: index.records[row] for org_id, row in index.row_of.items()}
+
+
+async def ranked_matches(
+    exams: List[LearnerExam],
+    learner_max_credits: Optional[int],
+    limit: int,
+    after: Optional[list] = None,
+) -> Tuple[List[dict], Optional[list], int]:
+    """
+    One page of matched institutions, best capped credits first.
+    Returns (page, sort key to continue after, institutions matched).
+    """
+    entries = ranking.aggregate(
+        _find_matches(exams, None, None), _institution_rows(), learner_max_credits
+    )
+    page, next_key = ranking.top_page(entries, limit, after)
+    return page, next_key, len(entries)
+
+
+async def exam_institutions(
+    eid: int, sort: str, limit: int, after: Optional[tuple] = None
+) -> Optional[dict]:
+    """
+    One page of the institutions accepting an exam, ranked by `sort`, or
+    None for an unknown exam. Also returns the sort key to continue after.
+    """
+    board = leaderboard.current()
+    if eid not in board.exam_names:
+        return None
+    page, next_key = board.page(eid, sort, limit, after)
+    return {
+        "exam": {"eid": eid, "name": board.exam_names[eid]},
+        "sort": sort,
+        "total": board.count(eid),
+        "institutions": page,
+        "next_key": next_key,
+    }
+
+
+async def compare_institutions(exams: List[LearnerExam], org_ids: List[str]) -> dict:
+    """
+    Exams x institutions matrices of cut score, credits and the learner's
+    eligibility. Raises ValueError for unknown institutions.
+    """
+    records = facet_index.current()
+    unknown = [o for o in org_ids if o not in records.row_of]
+    if unknown:
+        raise ValueError(f"Unknown institution(s): {', '.join(unknown)}")
+    institutions = [records.records[records.row_of[o]] for o in org_ids]
+    result = compare(
+        whatif_index.current(),
+        org_ids,
+        {e.eid: e.score for e in exams},
+        {i["msea_org_id"]: i["max_credits"] for i in institutions},
+    )
+    summaries = result.pop("summaries")
+    result["institutions"] = [
+        {**inst, "match": summaries[inst["msea_org_id"]]} for inst in institutions
+    ]
+    return result
+
+
+async def what_if(exams: List[LearnerExam], window: int) -> dict:
+    """Additional institutions for every exam and score, plus near misses."""
+    index = whatif_index.current()
+    score_map = {e.eid: e.score for e in exams}
+    table = index.sensitivity(score_map)
+    return {
+        "scores": list(range(SCORE_MIN, SCORE_MAX + 1)),
+        "current_institutions": len(index.matched(score_map)),
+        "exams": [
+            {
+                "eid": eid,
+                "exam_name": index.exam_names.get(eid),
+                "score": score_map.get(eid),
+                "additional_institutions": table[eid].tolist(),
+            }
+            for eid in sorted(table)
+        ],
+        "near_misses": index.near_misses(score_map, window),
+    }
+
+
+async def plan_exams(
+    exams: List[LearnerExam],
+    goal: int,
+    org_ids: Optional[List[str]],
+    state: Optional[str],
+    max_candidates: int,
+) -> List[dict]:
+    """
+    Fewest additional exams reaching `goal` credits at each candidate
+    institution (the listed ones, or every one in `state`), best plans first.
+    Raises ValueError when there are more than `max_candidates` candidates.
+    """
+    policies = whatif_index.current()
+    facets = facet_index.current()
+    if org_ids is None:
+        org_ids = [r["msea_org_id"] for r in facets.records if r["state"] == state]
+    org_ids = [o for o in dict.fromkeys(org_ids) if o in policies.by_institution]
+    if len(org_ids) > max_candidates:
+        raise ValueError(f"{len(org_ids)} candidate institutions; narrow the search to {max_candidates}")
+
+    def max_credits(org_id):
+        row = facets.row_of.get(org_id)
+        return None if row is None else facets.records[row]["max_credits"]
+
+    score_map = {e.eid: e.score for e in exams}
+    plans = exam_plan.plan_exams(
+        [(o, policies.by_institution[o], max_credits(o)) for o in org_ids], score_map, goal
+    )
+
+    results = []
+    for org_id, plan in plans.items():
+        results.append({
+            **(policies.institutions.get(org_id) or {"msea_org_id": org_id}),
+            "max_credits": max_credits(org_id),
+            "target": plan["target"],
+            "earned": plan["earned"],
+            "reachable": plan["reachable"],
+            "exams_needed": len(plan["exams"]),
+            "credits_after": plan["earned"] + sum(c for _, _, c in plan["exams"]),
+            "plan": [
+                {
+                    "eid": eid,
+                    "exam_name": policies.exam_names.get(eid),
+                    "cut_score": cut,
+                    "credits": credits,
+                    "current_score": score_map.get(eid),
+                }
+                for eid, cut, credits in plan["exams"]
+            ],
+        })
+    results.sort(key=lambda r: (
+        not r["reachable"], r["exams_needed"], sum(e["cut_score"] for e in r["plan"]), r.get("name") or ""
+    ))
+    return results
+
+
 async def save_favorite(learner_id: int, msea_org_id: str):
     supabase.table("favorites").upsert(
         {"learner_id": learner_id, "msea_org_id": msea_org_id}
     ).execute()
+    if replica is not None:
+        # Write through so the learner sees it before the next sync
+        replica.add_favorite(learner_id, msea_org_id)
 
 
 async def list_favorites(learner_id: int) -> List[Favorite]:
+    return _load_favorites(learner_id)
+
+
+def _load_favorites(learner_id: int) -> List[Favorite]:
+    if replica is not None and replica.is_ready():
+        inst_map = replica.institutions(replica.favorite_org_ids(learner_id))
+        return [
+            Favorite(**{k: i[k] for k in Favorite.__dataclass_fields__})
+            for i in inst_map.values()
+        ]
+
     favs = (
         supabase.table("favorites")
-        .select("*")
+        .select("msea_org_id")
         .eq("learner_id", learner_id)
         .execute()
         .data
@@ -143,10 +455,92 @@ async def list_favorites(learner_id: int) -> List[Favorite]:
     org_ids = [f["msea_org_id"] for f in favs]
     inst = (
         supabase.table("institutions")
-        .select("*")
+        .select(FAVORITE_INSTITUTION_SELECT)
         .in_("msea_org_id", org_ids)
         .execute()
         .data
     )
 
     return [Favorite(**i) for i in inst]
+
+
+async def favorites_with_matches(learner_id: int) -> List[dict]:
+    """The learner's favorites, each with a compact summary of its matches."""
+    favorites = await list_favorites(learner_id)
+    if not favorites:
+        return []
+    exams = recommendations.learner_scores([learner_id])[learner_id]
+    summaries = compare(
+        whatif_index.current(),
+        [f.msea_org_id for f in favorites],
+        {e.eid: e.score for e in exams},
+        {f.msea_org_id: f.max_credits for f in favorites},
+    )["summaries"]
+    return [{**asdict(f), "match": summaries[f.msea_org_id]} for f in favorites]
+
+
+def _load_learner(learner_id: int) -> Optional[dict]:
+    rows = supabase.table("learners").select("*").eq("id", learner_id).execute().data
+    return rows[0] if rows else None
+
+
+def _timed(timings: Dict[str, float], section: str, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        timings[section] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def _match_summary(matched: Optional[dict]) -> dict:
+    if matched is None:
+        return {"credits": 0, "eligible_exams": 0}
+    return {"credits": matched["credits"], "eligible_exams": len(matched["exams"])}
+
+
+async def learner_dashboard(
+    learner_id: int, limit: int = DASHBOARD_MATCH_LIMIT, include_timings: bool = False
+) -> Optional[dict]:
+    """
+    Profile, scores, the first `limit` matches, favorites and stats in one
+    payload, or None for an unknown learner. The three reads run concurrently
+    and matching runs once; favorites take their match summary from that same
+    result. Matches and stats are capped and ranked as in ranked_matches, and
+    `next_key` continues the ranking there.
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    learner, scores, favorites = await asyncio.gather(
+        asyncio.to_thread(_timed, timings, "learner", _load_learner, learner_id),
+        asyncio.to_thread(_timed, timings, "exams", recommendations.learner_scores, [learner_id]),
+        asyncio.to_thread(_timed, timings, "favorites", _load_favorites, learner_id),
+    )
+    timings["fetch"] = round((time.perf_counter() - started) * 1000, 2)
+    if learner is None:
+        return None
+
+    exams = scores[learner_id]
+    hits = _timed(timings, "matches", _find_matches, exams, None, None)
+    entries = ranking.aggregate(hits, _institution_rows())
+    page, next_key = ranking.top_page(entries, limit)
+    by_institution = {e["msea_org_id"]: e for e in entries}
+
+    dashboard = {
+        "learner": learner,
+        "exams": exams,
+        "matches": page,
+        "next_key": next_key,
+        "favorites": [
+            {**asdict(f), "match": _match_summary(by_institution.get(f.msea_org_id))}
+            for f in favorites
+        ],
+        "stats": {
+            "exam_count": len(exams),
+            **ranking.totals(entries),
+            "favorite_count": len(favorites),
+        },
+    }
+    if include_timings:
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+        dashboard["timings_ms"] = timings
+    return dashboard
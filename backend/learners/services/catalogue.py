@@ -0,0 +1,43 @@
+"""
+Bulk reads of the policy catalogue (institutions, acceptances, exams) used to
+build the learners service's in-memory and on-disk indexes.
+"""
+from typing import Dict, List
+
+from services.supabase_client import supabase
+
+INSTITUTION_COLUMNS = (
+    "id, msea_org_id, name, city, state, zip, enrollment, max_credits, "
+    "transcription_fee, can_use_for_failed_courses, "
+    "can_enrolled_students_use_clep, score_validity, last_updated"
+)
+ACCEPTANCE_COLUMNS = "msea_org_id, eid, cut_score, credits, related_course, last_updated"
+EXAM_COLUMNS = "eid, name"
+
+# PostgREST caps a single response, so whole tables are read in pages
+PAGE_SIZE = 1000
+
+
+def fetch_all(table: str, columns: str) -> List[Dict]:
+    rows: List[Dict] = []
+    start = 0
+    while True:
+        page = (
+            supabase.table(table)
+            .select(columns)
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+            .data
+        )
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def fetch_catalogue() -> Dict[str, List[Dict]]:
+    return {
+        "institutions": fetch_all("institutions", INSTITUTION_COLUMNS),
+        "acceptances": fetch_all("acceptance", ACCEPTANCE_COLUMNS),
+        "exams": fetch_all("exams", EXAM_COLUMNS),
+    }
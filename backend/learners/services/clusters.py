@@ -0,0 +1,400 @@
+"""
+Server-side map marker clustering.
+
+Institutions (placed at their ZIP centroid, see services/geo.py) are bucketed
+into a hierarchical Web Mercator grid: at zoom z each axis has
+2**z * CELLS_PER_TILE cells, so a cell's parent one zoom out is simply
+(cx >> 1, cy >> 1). Every level keeps a count, coordinate sums (for the
+centroid) and a bounding box per non-empty cell, so a viewport query is a
+lookup of the cells it overlaps at the requested zoom.
+
+Adding, moving or removing one institution touches one cell per level. When a
+policy write publishes `institution:<id>` tags, the named institutions are
+re-read and re-placed instead of rebuilding everything.
+
+Neither the build nor those updates run in a request. A background thread
+builds the index at startup (`warm`), queries raise `ClusterIndexNotReady` (a
+503) until it finishes, and later updates and TTL rebuilds are made on a copy
+that is swapped in once complete, so queries never see an index being
+changed. Cells are replaced rather than mutated, so a copy only duplicates
+the level dicts and the cells it actually touches.
+"""
+import gc
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.catalogue import fetch_all
+from services.geo import geo_index
+from services.supabase_client import supabase
+from shared.cache import INSTITUTIONS_TAG, cache
+
+logger = logging.getLogger(__name__)
+
+# Beyond this zoom the map shows individual markers, i.e. single-member cells
+MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "14"))
+# 256px tiles split into 4x4 cells gives ~64px clusters on screen
+CELLS_PER_TILE = 4
+CLUSTER_INDEX_TTL = float(os.getenv("CLUSTER_INDEX_TTL", "86400"))
+# Viewports spanning more cells than this are answered by scanning the level
+MAX_SCAN_CELLS = 4096
+
+MERCATOR_MAX_LAT = 85.05112878
+CLUSTER_INSTITUTION_COLUMNS = "id, msea_org_id, name, city, state, zip"
+
+Bounds = Tuple[float, float, float, float]  # west, south, east, north
+
+
+def _mercator(lat: float, lng: float) -> Tuple[float, float]:
+    """Unit-square Web Mercator coordinates."""
+    lat = max(-MERCATOR_MAX_LAT, min(MERCATOR_MAX_LAT, lat))
+    x = (lng + 180.0) / 360.0
+    sin = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+
+def _cell(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    n = (1 << zoom) * CELLS_PER_TILE
+    x, y = _mercator(lat, lng)
+    return min(int(x * n), n - 1), min(int(y * n), n - 1)
+
+
+class _Cell:
+    __slots__ = ("count", "sum_lat", "sum_lng", "bbox", "children")
+
+    def __init__(self, count=0, sum_lat=0.0, sum_lng=0.0, bbox=None, children=None):
+        self.count = count
+        self.sum_lat = sum_lat
+        self.sum_lng = sum_lng
+        self.bbox: Optional[List[float]] = bbox
+        # Child cell keys one zoom in, or member org ids at the finest level
+        self.children: Set = children if children is not None else set()
+
+    def clone(self) -> "_Cell":
+        bbox = list(self.bbox) if self.bbox is not None else None
+        return _Cell(self.count, self.sum_lat, self.sum_lng, bbox, set(self.children))
+
+    def extend(self, bounds: Iterable[float]) -> None:
+        w, s, e, n = bounds
+        if self.bbox is None:
+            self.bbox = [w, s, e, n]
+        else:
+            b = self.bbox
+            b[0], b[1], b[2], b[3] = min(b[0], w), min(b[1], s), max(b[2], e), max(b[3], n)
+
+
+class ClusterIndex:
+    def __init__(self, max_zoom: int = MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.levels: List[Dict[Tuple[int, int], _Cell]] = [{} for _ in range(max_zoom + 1)]
+        self.points: Dict[str, Tuple[float, float, Dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def copy(self) -> "ClusterIndex":
+        """An index sharing this one's cells; `upsert`/`remove` on it leave this one alone."""
+        index = ClusterIndex(self.max_zoom)
+        index.levels = [dict(level) for level in self.levels]
+        index.points = dict(self.points)
+        return index
+
+    def bulk_load(self, points: Dict[str, Tuple[float, float, Dict]]) -> None:
+        """Build every level at once, aggregating with numpy instead of per point."""
+        self.levels = [{} for _ in range(self.max_zoom + 1)]
+        self.points = dict(points)
+        if not points:
+            return
+
+        members = np.asarray(list(points), dtype=object)
+        lats = np.fromiter((p[0] for p in points.values()), np.float64, len(points))
+        lngs = np.fromiter((p[1] for p in points.values()), np.float64, len(points))
+        clamped = np.radians(np.clip(lats, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+        x = (lngs + 180.0) / 360.0
+        y = 0.5 - np.log((1 + np.sin(clamped)) / (1 - np.sin(clamped))) / (4 * np.pi)
+
+        n = (1 << self.max_zoom) * CELLS_PER_TILE
+        cx = np.minimum((x * n).astype(np.int64), n - 1)
+        cy = np.minimum((y * n).astype(np.int64), n - 1)
+        # Children of each cell: org ids at the finest level, cell keys above it
+        children = members
+        child_cell = np.arange(len(members))
+
+        for zoom in range(self.max_zoom, -1, -1):
+            keys, inverse = np.unique(cx * n + cy, return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            starts = np.searchsorted(inverse[order], np.arange(len(keys)))
+            counts = np.bincount(inverse, minlength=len(keys))
+            sum_lat = np.bincount(inverse, weights=lats, minlength=len(keys))
+            sum_lng = np.bincount(inverse, weights=lngs, minlength=len(keys))
+            bounds = [
+                np.minimum.reduceat(lngs[order], starts),
+                np.minimum.reduceat(lats[order], starts),
+                np.maximum.reduceat(lngs[order], starts),
+                np.maximum.reduceat(lats[order], starts),
+            ]
+            # Each cell's distinct children, grouped by parent
+            parent_of_child = np.zeros(len(children), dtype=np.int64)
+            parent_of_child[child_cell] = inverse
+            child_order = np.argsort(parent_of_child, kind="stable")
+            child_starts = np.searchsorted(parent_of_child[child_order], np.arange(len(keys) + 1))
+
+            cells = [divmod(k, n) for k in keys.tolist()]
+            grouped = children[child_order].tolist()
+            child_starts = child_starts.tolist()
+            self.levels[zoom] = {
+                key: _Cell(count, lat_total, lng_total, list(bbox), set(grouped[lo:hi]))
+                for key, count, lat_total, lng_total, bbox, lo, hi in zip(
+                    cells,
+                    counts.tolist(),
+                    sum_lat.tolist(),
+                    sum_lng.tolist(),
+                    zip(*(b.tolist() for b in bounds)),
+                    child_starts[:-1],
+                    child_starts[1:],
+                )
+            }
+
+            children = np.empty(len(keys), dtype=object)
+            children[:] = cells
+            child_cell = inverse
+            n >>= 1
+            cx >>= 1
+            cy >>= 1
+
+    def upsert(self, org_id: str, lat: float, lng: float, record: Dict) -> None:
+        if org_id in self.points:
+            self.remove(org_id)
+        self.points[org_id] = (lat, lng, record)
+
+        key = _cell(lat, lng, self.max_zoom)
+        child = org_id
+        for zoom in range(self.max_zoom, -1, -1):
+            cell = self.levels[zoom].get(key)
+            cell = self.levels[zoom][key] = cell.clone() if cell is not None else _Cell()
+            cell.count += 1
+            cell.sum_lat += lat
+            cell.sum_lng += lng
+            cell.extend((lng, lat, lng, lat))
+            cell.children.add(child)
+            child, key = key, (key[0] >> 1, key[1] >> 1)
+
+    def remove(self, org_id: str) -> None:
+        point = self.points.pop(org_id, None)
+        if point is None:
+            return
+        lat, lng, _ = point
+
+        key = _cell(lat, lng, self.max_zoom)
+        child = org_id
+        child_removed = True
+        for zoom in range(self.max_zoom, -1, -1):
+            level = self.levels[zoom]
+            cell = level[key] = level[key].clone()
+            cell.count -= 1
+            cell.sum_lat -= lat
+            cell.sum_lng -= lng
+            if child_removed:
+                cell.children.discard(child)
+
+            if cell.count == 0:
+                del level[key]
+                child_removed = True
+            else:
+                # Only the bounding box cannot be updated by subtraction
+                cell.bbox = None
+                if zoom == self.max_zoom:
+                    for member in cell.children:
+                        m_lat, m_lng, _ = self.points[member]
+                        cell.extend((m_lng, m_lat, m_lng, m_lat))
+                else:
+                    for child_key in cell.children:
+                        cell.extend(self.levels[zoom + 1][child_key].bbox)
+                child_removed = False
+            child, key = key, (key[0] >> 1, key[1] >> 1)
+
+    def query(self, bounds: Bounds, zoom: int) -> List[Dict]:
+        zoom = max(0, min(zoom, self.max_zoom))
+        west, south, east, north = bounds
+        x_lo, y_lo = _cell(north, west, zoom)
+        x_hi, y_hi = _cell(south, east, zoom)
+        level = self.levels[zoom]
+
+        if (x_hi - x_lo + 1) * (y_hi - y_lo + 1) <= MAX_SCAN_CELLS:
+            keys = (
+                (x, y) for x in range(x_lo, x_hi + 1) for y in range(y_lo, y_hi + 1)
+                if (x, y) in level
+            )
+        else:
+            keys = (
+                k for k in level if x_lo <= k[0] <= x_hi and y_lo <= k[1] <= y_hi
+            )
+
+        clusters = []
+        for key in keys:
+            cell = level[key]
+            cluster = {
+                "count": cell.count,
+                "lat": cell.sum_lat / cell.count,
+                "lng": cell.sum_lng / cell.count,
+                "bbox": list(cell.bbox),
+            }
+            if cell.count == 1:
+                cluster["institution"] = self._single(zoom, key)
+            clusters.append(cluster)
+        return clusters
+
+    def _single(self, zoom: int, key: Tuple[int, int]) -> Dict:
+        """Walk down to the one institution in a single-member cell."""
+        cell = self.levels[zoom][key]
+        while zoom < self.max_zoom:
+            zoom += 1
+            cell = self.levels[zoom][next(iter(cell.children))]
+        return self.points[next(iter(cell.children))][2]
+
+
+class ClusterIndexNotReady(RuntimeError):
+    """The first cluster index build has not finished yet."""
+
+
+class ClusterIndexManager:
+    """
+    Builds the cluster index in the background and applies institution changes
+    there too, swapping each new index in while the previous one keeps serving.
+    """
+
+    def __init__(self, ttl: float = CLUSTER_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: Optional[ClusterIndex] = None
+        self._built_at = 0.0
+        self._pending: Set[str] = set()
+        self._refreshing = False
+
+    @staticmethod
+    def _locate(rows: Iterable[Dict]) -> Dict[str, Optional[Tuple[float, float, Dict]]]:
+        """msea_org_id -> (lat, lng, record), or None when the ZIP is unknown."""
+        located = {}
+        for row in rows:
+            point = geo_index.locate(row.get("zip"))
+            record = {k: row.get(k) for k in ("id", "msea_org_id", "name", "city", "state", "zip")}
+            located[row["msea_org_id"]] = (point[0], point[1], record) if point else None
+        return located
+
+    def invalidate(self) -> None:
+        self._built_at = 0.0
+
+    def mark_changed(self, institution_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._pending.update(institution_ids)
+
+    def warm(self) -> None:
+        """Start a build or update in a background thread unless one is running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="cluster-index", daemon=True).start()
+
+    def _refresh(self) -> None:
+        ids: List[str] = []
+        try:
+            if self._index is None or time.monotonic() - self._built_at > self.ttl:
+                self._build()
+                return
+            with self._lock:
+                ids, self._pending = list(self._pending), set()
+            if ids:
+                self._apply(ids)
+        except Exception:
+            # Keep serving the previous index; the next request retries
+            logger.exception("Cluster index refresh failed")
+            self.mark_changed(ids)
+        finally:
+            self._refreshing = False
+
+    def _build(self) -> None:
+        started = time.perf_counter()
+        built_at = time.monotonic()
+        with self._lock:
+            # Changes marked from here on may postdate the fetch
+            self._pending = set()
+        index = ClusterIndex()
+        located = self._locate(fetch_all("institutions", CLUSTER_INSTITUTION_COLUMNS))
+        # Hundreds of thousands of long-lived cells; collector passes
+        # during the build would only rescan them
+        gc.disable()
+        try:
+            index.bulk_load({org: p for org, p in located.items() if p is not None})
+        finally:
+            gc.enable()
+        self._index, self._built_at = index, built_at
+        logger.info(
+            f"Built cluster index over {len(index)} institutions "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def _apply(self, ids: List[str]) -> None:
+        rows = (
+            supabase.table("institutions")
+            .select(CLUSTER_INSTITUTION_COLUMNS)
+            .in_("id", ids)
+            .execute()
+            .data
+        )
+        current = self._index
+        # Acceptance writes publish the tag too but rarely move or rename anyone
+        changes = {
+            org_id: point for org_id, point in self._locate(rows).items()
+            if current.points.get(org_id) != point
+        }
+        # Institutions that no longer exist are dropped
+        found = {row["id"] for row in rows}
+        by_id = {r.get("id"): org for org, (_, _, r) in current.points.items()}
+        for missing in set(ids) - found:
+            if missing in by_id:
+                changes[by_id[missing]] = None
+        if not changes:
+            return
+        index = current.copy()
+        for org_id, point in changes.items():
+            if point is None:
+                index.remove(org_id)
+            else:
+                index.upsert(org_id, *point)
+        self._index = index
+        logger.info(f"Updated {len(changes)} institutions in the cluster index")
+
+    def current(self) -> ClusterIndex:
+        """
+        The current index. Raises ClusterIndexNotReady before the first build
+        has finished, and CentroidsUnavailable without a centroid file.
+        """
+        index = self._index
+        if index is None or self._pending or time.monotonic() - self._built_at > self.ttl:
+            # Fail with the real cause instead of staying "not ready" forever
+            geo_index.centroids
+            self.warm()
+        if index is None:
+            raise ClusterIndexNotReady("Map clusters are still being built; retry shortly")
+        return index
+
+
+cluster_index = ClusterIndexManager()
+
+
+def _on_invalidate(tags):
+    ids = [t.split(":", 1)[1] for t in tags if t.startswith("institution:")]
+    if ids:
+        cluster_index.mark_changed(ids)
+    if INSTITUTIONS_TAG in tags:
+        cluster_index.invalidate()
+
+
+cache.subscribe(_on_invalidate)
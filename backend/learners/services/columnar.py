@@ -0,0 +1,125 @@
+"""
+Compact columnar container: named fixed-width arrays plus a string table,
+laid out in one contiguous buffer so it can live in an mmap'd file or a
+shared memory segment and be read without copying.
+
+Layout (native byte order, recorded in the header):
+    header   magic, byte order, section count, generation
+    sections name, typecode, offset, item count   (one per column)
+    data     each column 8-byte aligned
+"""
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"CLEPCOL1"
+HEADER = struct.Struct("<8sBxxxIQ")
+SECTION = struct.Struct("<16s1sxxxxxxxQQ")
+ALIGN = 8
+BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+
+# Reserved string index for NULL
+NULL_STRING = 0
+
+
+class SnapshotFormatError(ValueError):
+    """Raised when a buffer does not hold a readable columnar container."""
+
+
+def _aligned(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class StringTable:
+    """Deduplicating UTF-8 string table; index 0 is NULL."""
+
+    def __init__(self):
+        self._index: Dict[str, int] = {}
+        self._offsets = array("I", [0, 0])
+        self._data = bytearray()
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NULL_STRING
+        value = str(value)
+        idx = self._index.get(value)
+        if idx is None:
+            self._data.extend(value.encode("utf-8"))
+            self._offsets.append(len(self._data))
+            idx = self._index[value] = len(self._offsets) - 2
+        return idx
+
+
+class ColumnarWriter:
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.strings = StringTable()
+        self._columns: List[Tuple[str, str, bytes, int]] = []
+
+    def add(self, name: str, typecode: str, values: Iterable) -> None:
+        data = array(typecode, values)
+        self._columns.append((name, typecode, data.tobytes(), len(data)))
+
+    def _all_columns(self) -> List[Tuple[str, str, bytes, int]]:
+        strings = self.strings
+        return self._columns + [
+            ("str_offsets", "I", strings._offsets.tobytes(), len(strings._offsets)),
+            ("str_data", "B", bytes(strings._data), len(strings._data)),
+        ]
+
+    def to_bytes(self) -> bytes:
+        columns = self._all_columns()
+        offset = _aligned(HEADER.size + SECTION.size * len(columns))
+        out = bytearray(HEADER.pack(MAGIC, BYTE_ORDER, len(columns), self.generation))
+        placements = []
+        for name, typecode, data, count in columns:
+            out += SECTION.pack(name.encode("ascii"), typecode.encode("ascii"), offset, count)
+            placements.append((offset, data))
+            offset = _aligned(offset + len(data))
+        for start, data in placements:
+            out += b"\0" * (start - len(out))
+            out += data
+        return bytes(out)
+
+
+class ColumnarReader:
+    """Zero-copy view over a buffer produced by ColumnarWriter."""
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise SnapshotFormatError("Buffer too small for header")
+        magic, byte_order, count, generation = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise SnapshotFormatError("Bad magic")
+        if byte_order != BYTE_ORDER:
+            raise SnapshotFormatError("Snapshot was built on a host with a different byte order")
+
+        self.generation = generation
+        self.columns: Dict[str, memoryview] = {}
+        for i in range(count):
+            name, typecode, offset, n = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+            typecode = typecode.decode("ascii")
+            size = array(typecode).itemsize * n
+            if offset + size > len(view):
+                raise SnapshotFormatError(f"Section {name!r} runs past end of buffer")
+            self.columns[name.rstrip(b"\0").decode("ascii")] = view[offset:offset + size].cast(typecode)
+
+        self._str_offsets = self.columns["str_offsets"]
+        self._str_data = self.columns["str_data"]
+
+    def __getitem__(self, name: str) -> memoryview:
+        return self.columns[name]
+
+    def string(self, idx: int) -> Optional[str]:
+        if idx == NULL_STRING:
+            return None
+        start, end = self._str_offsets[idx], self._str_offsets[idx + 1]
+        return bytes(self._str_data[start:end]).decode("utf-8")
+
+    def release(self) -> None:
+        """Release every view so the underlying buffer can be closed."""
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
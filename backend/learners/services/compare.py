@@ -0,0 +1,84 @@
+"""
+Side-by-side institution comparison.
+
+The shortlisted institutions' policies are laid out as exams x institutions
+matrices of cut score and credits (-1 where the exam is not accepted),
+straight from the what-if index's per-institution policies. Eligibility is
+then one broadcast comparison against the learner's score column. Per-
+institution totals are column sums capped at each institution's
+`max_credits`.
+"""
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+
+from services.whatif import WhatIfIndex
+
+NOT_ACCEPTED = -1
+
+
+def _matrix(values: np.ndarray, accepted: np.ndarray) -> List[List[Optional[int]]]:
+    return [
+        [v if ok else None for v, ok in zip(row, ok_row)]
+        for row, ok_row in zip(values.tolist(), accepted.tolist())
+    ]
+
+
+def compare(
+    index: WhatIfIndex,
+    org_ids: List[str],
+    score_map: Mapping[int, int],
+    max_credits: Mapping[str, Optional[float]],
+) -> Dict:
+    """
+    Cut score, credits and eligibility for every exam (rows, by eid) at
+    every institution in `org_ids` (columns, in the given order), plus a
+    summary per institution.
+    """
+    eids = sorted(index.exam_names)
+    row_of = {eid: i for i, eid in enumerate(eids)}
+    cut = np.full((len(eids), len(org_ids)), NOT_ACCEPTED, dtype=np.int64)
+    credits = np.zeros((len(eids), len(org_ids)), dtype=np.int64)
+    for col, org_id in enumerate(org_ids):
+        for eid, (exam_cut, exam_credits) in index.by_institution.get(org_id, {}).items():
+            row = row_of.get(eid)
+            if row is not None:
+                cut[row, col] = exam_cut
+                credits[row, col] = exam_credits
+
+    scores = np.array([score_map.get(eid, NOT_ACCEPTED) for eid in eids], dtype=np.int64)
+    accepted = cut != NOT_ACCEPTED
+    eligible = accepted & (scores[:, None] >= cut) & (scores[:, None] != NOT_ACCEPTED)
+
+    matched = np.where(eligible, credits, 0).sum(axis=0)
+    caps = np.array(
+        [np.nan if max_credits.get(o) is None else max_credits[o] for o in org_ids],
+        dtype=np.float64,
+    )
+    capped = np.where(np.isnan(caps), matched, np.minimum(matched, np.nan_to_num(caps)))
+
+    summaries = {
+        org_id: {
+            "accepted_exams": int(n_accepted),
+            "eligible_exams": int(n_eligible),
+            "matched_credits": int(total),
+            "credits": int(capped_total),
+        }
+        for org_id, n_accepted, n_eligible, total, capped_total in zip(
+            org_ids,
+            accepted.sum(axis=0).tolist(),
+            eligible.sum(axis=0).tolist(),
+            matched.tolist(),
+            capped.tolist(),
+        )
+    }
+    return {
+        "exams": [
+            {"eid": eid, "name": index.exam_names[eid], "score": score_map.get(eid)}
+            for eid in eids
+        ],
+        "cut_score": _matrix(cut, accepted),
+        "credits": _matrix(credits, accepted),
+        "eligible": eligible.tolist(),
+        "summaries": summaries,
+    }
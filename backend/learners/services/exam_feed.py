@@ -0,0 +1,135 @@
+"""
+Per-exam acceptance changes shared by the indexes keyed by exam
+(services/leaderboard.py, services/whatif.py).
+
+A policy write publishes `exam:<id>` tags. The feed re-reads those exams'
+acceptances once, in one keyed query, the first time any index asks for
+changes, and every index then applies the same rows in memory. Each re-read
+gets a new version; an index remembers the version it last applied and
+is handed only the exams re-read after it. Exams are few (one row set per CLEP
+exam), so the latest rows of every changed exam are simply kept.
+
+A stream reset names no exams, so it counts as a reset and every index
+rebuilds from a full catalogue read.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Generic, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from services.catalogue import ACCEPTANCE_COLUMNS
+from services.supabase_client import supabase
+from shared.cache import CATALOGUE_TAG, cache
+
+logger = logging.getLogger(__name__)
+
+Index = TypeVar("Index")
+
+
+class ExamAcceptanceFeed:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Set[int] = set()
+        self._version = 0
+        # eid -> (version it was re-read at, its acceptance rows)
+        self._latest: Dict[int, Tuple[int, List[Dict]]] = {}
+        self.resets = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def mark_changed(self, exam_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._pending.update(exam_ids)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.resets += 1
+
+    def changes_since(self, version: int) -> Tuple[int, Dict[int, List[Dict]]]:
+        """
+        Current acceptances of every exam re-read after `version`, and the
+        version to pass next time.
+        """
+        with self._lock:
+            if self._pending:
+                exam_ids, self._pending = sorted(self._pending), set()
+                rows = (
+                    supabase.table("acceptance")
+                    .select(ACCEPTANCE_COLUMNS)
+                    .in_("eid", exam_ids)
+                    .execute()
+                    .data
+                )
+                grouped: Dict[int, List[Dict]] = {eid: [] for eid in exam_ids}
+                for row in rows:
+                    grouped[row["eid"]].append(row)
+                self._version += 1
+                for eid, exam_rows in grouped.items():
+                    self._latest[eid] = (self._version, exam_rows)
+            changes = {eid: rows for eid, (v, rows) in self._latest.items() if v > version}
+            return self._version, changes
+
+
+exam_feed = ExamAcceptanceFeed()
+
+
+class ExamIndexManager(Generic[Index]):
+    """
+    Builds an index from a full catalogue read, then keeps it current from
+    `exam_feed`. Subclasses implement `build()` and `apply()`.
+    """
+
+    name = "exam index"
+
+    def __init__(self, ttl: float, feed: ExamAcceptanceFeed = exam_feed):
+        self.ttl = ttl
+        self.feed = feed
+        self._lock = threading.Lock()
+        self._index: Optional[Index] = None
+        self._built_at = 0.0
+        self._version = 0
+        self._resets = 0
+
+    def build(self) -> Index:
+        raise NotImplementedError
+
+    def apply(self, index: Index, changes: Dict[int, List[Dict]]) -> None:
+        """Replace the acceptances of each exam in `changes` with its rows."""
+        raise NotImplementedError
+
+    def invalidate(self) -> None:
+        self._built_at = 0.0
+
+    def current(self) -> Index:
+        with self._lock:
+            if (
+                self._index is None
+                or self._resets != self.feed.resets
+                or time.monotonic() - self._built_at > self.ttl
+            ):
+                started = time.perf_counter()
+                # Exams re-read from here on are applied on top of the build
+                self._resets, self._version = self.feed.resets, self.feed.version
+                self._index = self.build()
+                self._built_at = time.monotonic()
+                logger.info(f"Built {self.name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+            else:
+                version, changes = self.feed.changes_since(self._version)
+                if changes:
+                    self.apply(self._index, changes)
+                self._version = version
+            return self._index
+
+
+def _on_invalidate(tags):
+    exam_ids = {int(t.split(":", 1)[1]) for t in tags if t.startswith("exam:")}
+    if exam_ids:
+        exam_feed.mark_changed(exam_ids)
+    elif CATALOGUE_TAG in tags:
+        # A stream reset names no exams; start over
+        exam_feed.reset()
+
+
+cache.subscribe(_on_invalidate)
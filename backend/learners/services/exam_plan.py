@@ -0,0 +1,164 @@
+"""
+Exam-plan optimizer: the fewest additional CLEP exams that take a learner to
+a credit goal at each candidate institution.
+
+Per institution this is a 0/1 knapsack over the exams it accepts but the
+learner has not yet cleared. Each exam's "weight" is the credits it awards,
+and the cost is one exam plus a small tie-breaker for its cut score, so among
+equally short plans the one with the lowest cut scores wins. `dp[j, t]` is
+the cheapest way for institution j to earn at least t more credits. The DP
+runs over all candidate institutions at once: each exam updates the whole
+(institutions x credits) matrix in one numpy step, and a take-table per exam
+is kept to read each plan back.
+
+The goal is capped at the institution's `max_credits`. Plans are cached per
+institution under a policy version derived from its acceptances, so unchanged
+institutions are answered from the cache and only changed ones go through the
+DP again.
+"""
+import os
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from shared.cache import LRUTier
+from shared.metrics import metrics
+
+PLAN_CACHE_TTL = float(os.getenv("EXAM_PLAN_CACHE_TTL", "3600"))
+PLAN_CACHE_ENTRIES = int(os.getenv("EXAM_PLAN_CACHE_ENTRIES", "20000"))
+
+MAX_GOAL = 200
+# Cost of one exam; cut scores (<= 80 each, <= 38 exams) never add up to it
+EXAM_COST = 10_000
+INFEASIBLE = np.iinfo(np.int64).max // 4
+
+# eid -> (cut score, credits) for the exams an institution accepts
+Policy = Dict[int, Tuple[int, int]]
+
+_plans = LRUTier(PLAN_CACHE_ENTRIES)
+
+
+def policy_version(policy: Policy, max_credits: Optional[int]) -> int:
+    """Changes whenever any of the institution's cut scores or credits do."""
+    # Plans are cached per process, so the built-in hash is stable enough
+    return hash((max_credits, tuple(sorted(policy.items()))))
+
+
+def _earned(policy: Policy, score_map: Mapping[int, int]) -> int:
+    return sum(
+        credits for eid, (cut, credits) in policy.items()
+        if score_map.get(eid) is not None and score_map[eid] >= cut
+    )
+
+
+def solve(
+    policies: List[Policy],
+    needs: List[int],
+    score_map: Mapping[int, int],
+) -> List[Optional[List[int]]]:
+    """
+    For each institution, the exam ids of a cheapest plan earning at least
+    needs[j] more credits, or None when even every remaining exam falls short.
+    """
+    n = len(policies)
+    if n == 0:
+        return []
+    goal = max(needs)
+    exams = sorted({eid for policy in policies for eid in policy})
+
+    # Items per exam: credits and cost, zero/absent where not available
+    credits = np.zeros((len(exams), n), dtype=np.int64)
+    cost = np.zeros((len(exams), n), dtype=np.int64)
+    available = np.zeros((len(exams), n), dtype=bool)
+    for j, policy in enumerate(policies):
+        for k, eid in enumerate(exams):
+            entry = policy.get(eid)
+            if entry is None:
+                continue
+            cut, award = entry
+            score = score_map.get(eid)
+            if (score is None or score < cut) and award > 0:
+                credits[k, j] = award
+                cost[k, j] = EXAM_COST + cut
+                available[k, j] = True
+
+    dp = np.full((n, goal + 1), INFEASIBLE, dtype=np.int64)
+    dp[:, 0] = 0
+    rows = np.arange(n)[:, None]
+    targets = np.arange(goal + 1)[None, :]
+    taken = []
+    for k in range(len(exams)):
+        # Earning at least t with this exam means earning t - credits before it
+        source = np.maximum(targets - credits[k][:, None], 0)
+        candidate = dp[rows, source] + cost[k][:, None]
+        take = available[k][:, None] & (candidate < dp)
+        dp = np.where(take, candidate, dp)
+        taken.append(take)
+
+    plans: List[Optional[List[int]]] = []
+    for j, need in enumerate(needs):
+        if dp[j, need] >= INFEASIBLE:
+            plans.append(None)
+            continue
+        plan, t = [], need
+        for k in range(len(exams) - 1, -1, -1):
+            if t > 0 and taken[k][j, t]:
+                plan.append(exams[k])
+                t = max(t - int(credits[k, j]), 0)
+        plans.append(plan[::-1])
+    metrics.incr("exam_plan.solved", n)
+    return plans
+
+
+def plan_exams(
+    candidates: List[Tuple[str, Policy, Optional[int]]],
+    score_map: Mapping[int, int],
+    goal: int,
+) -> Dict[str, Dict]:
+    """
+    msea_org_id -> plan for each (msea_org_id, policy, max_credits) candidate.
+
+    A plan holds the effective `target` (goal capped at max_credits), the
+    credits already `earned`, whether the target is `reachable`, and the
+    `exams` to add, as (eid, cut, credits).
+    """
+    goal = min(goal, MAX_GOAL)
+    results: Dict[str, Dict] = {}
+    pending = []
+    for org_id, policy, max_credits in candidates:
+        # Only the learner's scores on exams this institution accepts matter
+        scores = tuple(sorted((eid, score_map[eid]) for eid in policy if eid in score_map))
+        key = f"{org_id}:{policy_version(policy, max_credits)}:{goal}:{scores}"
+        hit, plan = _plans.get(key)
+        if hit:
+            results[org_id] = plan
+            continue
+        target = goal if max_credits is None else min(goal, max_credits)
+        earned = _earned(policy, score_map)
+        pending.append((org_id, policy, key, target, earned))
+    metrics.incr("exam_plan.cache_hits", len(results))
+
+    solved = solve(
+        [policy for _, policy, _, _, _ in pending],
+        [max(target - earned, 0) for _, _, _, target, earned in pending],
+        score_map,
+    )
+    for (org_id, policy, key, target, earned), exams in zip(pending, solved):
+        if exams is None:
+            # Not enough credits on offer; list everything that would help
+            exams = sorted(
+                eid for eid, (cut, credits) in policy.items()
+                if credits > 0 and (score_map.get(eid) is None or score_map[eid] < cut)
+            )
+            reachable = False
+        else:
+            reachable = True
+        plan = {
+            "target": target,
+            "earned": earned,
+            "reachable": reachable,
+            "exams": [(eid, policy[eid][0], policy[eid][1]) for eid in exams],
+        }
+        _plans.set(key, plan, PLAN_CACHE_TTL)
+        results[org_id] = plan
+    return results
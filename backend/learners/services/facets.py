@@ -0,0 +1,397 @@
+"""
+Faceted institution search.
+
+Every facet is a dictionary-encoded numpy column: a small list of values
+(states, fee bands, "true"/"false", ...) and one int code per institution. A
+search then needs no database query:
+
+- filtering ORs the selected values within a facet and ANDs across facets
+  (one `np.isin` per facet);
+- each facet's live counts are one `np.bincount` over the institutions that
+  pass every *other* facet's filter, so picking a state still shows how many
+  schools the other states have;
+- multi-key sorting is one `np.lexsort` over the surviving rows.
+
+Numeric attributes are bucketed for filtering and counting and kept raw for
+sorting. Facets only read institution rows. Institutions named by an
+`institution:<id>` tag are re-read in a background thread, and the index is
+rebuilt from the rows in memory only if one of them changed beyond its
+`last_updated` stamp, which is all an acceptance write touches and is patched
+in place. `INSTITUTIONS_TAG` and the TTL rebuild everything, also in the
+background. Requests keep getting the previous index meanwhile, like the geo
+index.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from services.catalogue import INSTITUTION_COLUMNS, fetch_all
+from services.snapshot import NULL_INT, validity_years
+from services.supabase_client import supabase
+from shared.cache import INSTITUTIONS_TAG, cache
+
+logger = logging.getLogger(__name__)
+
+FACET_INDEX_TTL = float(os.getenv("FACET_INDEX_TTL", "3600"))
+
+UNKNOWN = "unknown"
+
+# (label, low, high) with inclusive bounds; None means unbounded
+NUMERIC_BUCKETS = {
+    "max_credits": [
+        ("1-15", 1, 15),
+        ("16-30", 16, 30),
+        ("31-60", 31, 60),
+        ("61+", 61, None),
+    ],
+    "transcription_fee": [
+        ("free", 0, 0),
+        ("1-25", 1, 25),
+        ("26-50", 26, 50),
+        ("51+", 51, None),
+    ],
+}
+BOOLEAN_FACETS = ("can_use_for_failed_courses", "can_enrolled_students_use_clep")
+FACETS = (
+    "state",
+    "max_credits",
+    "transcription_fee",
+    "score_validity_years",
+) + BOOLEAN_FACETS
+
+# Sort key name -> institution column; "credits" means matched credits when
+# the search is restricted to a learner's matches
+SORT_KEYS = ("credits", "max_credits", "fee", "enrollment", "name")
+DEFAULT_SORT = ("-credits", "fee", "name")
+
+
+class FacetQueryError(ValueError):
+    """Raised for unknown facets, facet values or sort keys."""
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _bucket(value: float, buckets) -> str:
+    if np.isnan(value):
+        return UNKNOWN
+    for label, low, high in buckets:
+        if (low is None or value >= low) and (high is None or value <= high):
+            return label
+    return UNKNOWN
+
+
+class _Facet:
+    """Distinct values plus one value code per institution."""
+
+    def __init__(self, labels: Sequence[str], order: Optional[Sequence[str]] = None):
+        values = list(order or [])
+        values += sorted(set(labels) - set(values) - {UNKNOWN})
+        if UNKNOWN in labels:
+            values.append(UNKNOWN)
+        self.values = values
+        lookup = {v: i for i, v in enumerate(values)}
+        self.codes = np.fromiter((lookup[l] for l in labels), np.int32, len(labels))
+        self._lookup = lookup
+
+    def mask(self, selected: Iterable[str]) -> np.ndarray:
+        codes = []
+        for value in selected:
+            if value not in self._lookup:
+                raise FacetQueryError(f"Unknown value '{value}'; expected one of {self.values}")
+            codes.append(self._lookup[value])
+        return np.isin(self.codes, codes)
+
+    def counts(self, rows: np.ndarray) -> Dict[str, int]:
+        totals = np.bincount(self.codes[rows], minlength=len(self.values))
+        return {value: int(n) for value, n in zip(self.values, totals.tolist())}
+
+
+class FacetIndex:
+    def __init__(self, institutions: List[Dict]):
+        self.records = []
+        for inst in institutions:
+            years = validity_years(inst.get("score_validity"))
+            self.records.append({
+                "msea_org_id": inst["msea_org_id"],
+                "name": inst.get("name"),
+                "city": inst.get("city"),
+                "state": inst.get("state"),
+                "zip": inst.get("zip"),
+                "max_credits": inst.get("max_credits"),
+                "transcription_fee": inst.get("transcription_fee"),
+                "enrollment": inst.get("enrollment"),
+                "score_validity_years": None if years == NULL_INT else years,
+                "can_use_for_failed_courses": inst.get("can_use_for_failed_courses"),
+                "can_enrolled_students_use_clep": inst.get("can_enrolled_students_use_clep"),
+                "last_updated": inst.get("last_updated"),
+            })
+        self.row_of = {r["msea_org_id"]: i for i, r in enumerate(self.records)}
+        n = len(self.records)
+
+        def column(name):
+            return np.fromiter((_number(r[name]) for r in self.records), np.float64, n)
+
+        self.max_credits = column("max_credits")
+        self.fee = column("transcription_fee")
+        self.enrollment = column("enrollment")
+        # Names sort by precomputed rank so lexsort only ever sees numbers
+        by_name = sorted(range(n), key=lambda i: (self.records[i]["name"] or "").lower())
+        self.name_rank = np.empty(n, dtype=np.float64)
+        self.name_rank[by_name] = np.arange(n)
+
+        self.facets: Dict[str, _Facet] = {
+            "state": _Facet([r["state"] or UNKNOWN for r in self.records]),
+            "score_validity_years": _Facet([
+                UNKNOWN if r["score_validity_years"] is None else str(r["score_validity_years"])
+                for r in self.records
+            ]),
+        }
+        for name, buckets in NUMERIC_BUCKETS.items():
+            values = self.max_credits if name == "max_credits" else self.fee
+            self.facets[name] = _Facet(
+                [_bucket(v, buckets) for v in values.tolist()],
+                order=[label for label, _, _ in buckets],
+            )
+        for name in BOOLEAN_FACETS:
+            self.facets[name] = _Facet(
+                [UNKNOWN if r[name] is None else str(bool(r[name])).lower() for r in self.records],
+                order=["true", "false"],
+            )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def touch(self, msea_org_id: str, last_updated) -> None:
+        """Update a record's stamp; nothing is filtered or sorted by it."""
+        row = self.row_of.get(msea_org_id)
+        if row is not None:
+            self.records[row]["last_updated"] = last_updated
+
+    def _sort_keys(self, sort: Sequence[str], credits: np.ndarray, rows: np.ndarray) -> List[np.ndarray]:
+        columns = {
+            "credits": credits,
+            "max_credits": self.max_credits,
+            "fee": self.fee,
+            "enrollment": self.enrollment,
+            "name": self.name_rank,
+        }
+        keys = []
+        for key in sort:
+            descending = key.startswith("-")
+            name = key.lstrip("-")
+            if name not in columns:
+                raise FacetQueryError(f"Unknown sort key '{name}'; expected one of {list(SORT_KEYS)}")
+            values = columns[name][rows]
+            values = -values if descending else values
+            # Missing values sort last in either direction
+            keys.append(np.where(np.isnan(values), np.inf, values))
+        return keys
+
+    def search(
+        self,
+        filters: Dict[str, List[str]],
+        sort: Sequence[str] = DEFAULT_SORT,
+        limit: int = 20,
+        offset: int = 0,
+        matched_credits: Optional[Dict[str, float]] = None,
+    ) -> Dict:
+        """
+        One page of institutions passing `filters`, plus per-facet counts.
+
+        `matched_credits` (msea_org_id -> credits) restricts the search to a
+        learner's matches and becomes the "credits" sort key; otherwise
+        "credits" sorts by the institution's max_credits.
+        """
+        n = len(self.records)
+        unknown = set(filters) - set(self.facets)
+        if unknown:
+            raise FacetQueryError(f"Unknown facet(s) {sorted(unknown)}; expected some of {list(FACETS)}")
+
+        if matched_credits is None:
+            universe = np.ones(n, dtype=bool)
+            credits = self.max_credits
+        else:
+            universe = np.zeros(n, dtype=bool)
+            credits = np.full(n, np.nan)
+            for org_id, total in matched_credits.items():
+                row = self.row_of.get(org_id)
+                if row is not None:
+                    universe[row] = True
+                    credits[row] = total
+
+        masks = {name: self.facets[name].mask(values) for name, values in filters.items() if values}
+        selected = universe.copy()
+        for mask in masks.values():
+            selected &= mask
+
+        counts = {}
+        for name, facet in self.facets.items():
+            if name in masks:
+                others = universe.copy()
+                for other, mask in masks.items():
+                    if other != name:
+                        others &= mask
+            else:
+                others = selected
+            counts[name] = facet.counts(np.flatnonzero(others))
+
+        rows = np.flatnonzero(selected)
+        keys = self._sort_keys(sort, credits, rows)
+        # lexsort takes the primary key last
+        order = rows[np.lexsort(keys[::-1])] if keys else rows
+        page = order[offset:offset + limit].tolist()
+
+        institutions = []
+        for row in page:
+            record = dict(self.records[row])
+            if matched_credits is not None:
+                record["matched_credits"] = matched_credits[record["msea_org_id"]]
+            institutions.append(record)
+        return {"total": len(rows), "institutions": institutions, "facets": counts}
+
+
+def _unstamped(row: Dict) -> Dict:
+    return {k: v for k, v in row.items() if k != "last_updated"}
+
+
+class FacetIndexManager:
+    """
+    Builds the index on first use, then refreshes it in the background while
+    the previous one keeps serving.
+    """
+
+    def __init__(self, ttl: float = FACET_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: Optional[FacetIndex] = None
+        self._built_at = 0.0
+        # institutions.id -> row the current index was built from
+        self._rows: Dict[str, Dict] = {}
+        self._pending: Set[str] = set()
+        self._refreshing = False
+        self._invalidations = 0
+
+    def invalidate(self) -> None:
+        self._invalidations += 1
+        self._built_at = 0.0
+
+    def mark_changed(self, institution_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._pending.update(institution_ids)
+
+    def current(self) -> FacetIndex:
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    # Nothing to serve yet
+                    self._rebuild()
+                return self._index
+        if self._pending or time.monotonic() - self._built_at > self.ttl:
+            self._refresh_in_background()
+        return index
+
+    def _rebuild(self) -> None:
+        started = time.perf_counter()
+        built_at, invalidations = time.monotonic(), self._invalidations
+        # Anything marked from here on may postdate the fetch; keep it pending
+        self._pending = set()
+        rows = fetch_all("institutions", INSTITUTION_COLUMNS)
+        index = FacetIndex(rows)
+        self._rows = {row["id"]: row for row in rows}
+        self._index = index
+        # An invalidation during the fetch leaves the new index stale
+        self._built_at = built_at if invalidations == self._invalidations else 0.0
+        logger.info(
+            f"Built facet index over {len(index)} institutions "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="facet-index", daemon=True).start()
+
+    def _refresh(self) -> None:
+        ids: List[str] = []
+        try:
+            if time.monotonic() - self._built_at > self.ttl:
+                self._rebuild()
+                return
+            with self._lock:
+                ids, self._pending = list(self._pending), set()
+            if not ids:
+                return
+            rows = (
+                supabase.table("institutions")
+                .select(INSTITUTION_COLUMNS)
+                .in_("id", ids)
+                .execute()
+                .data
+            )
+            fresh = {row["id"]: row for row in rows}
+            changed = [i for i in ids if self._rows.get(i) != fresh.get(i)]
+            if not changed:
+                return
+            # Acceptance writes only bump last_updated; patch that in place
+            rebuild = False
+            for institution_id in changed:
+                old, new = self._rows.get(institution_id), fresh.get(institution_id)
+                if old is not None and new is not None and _unstamped(old) == _unstamped(new):
+                    self._index.touch(new["msea_org_id"], new.get("last_updated"))
+                else:
+                    rebuild = True
+                if new is not None:
+                    self._rows[institution_id] = new
+                else:
+                    self._rows.pop(institution_id, None)
+            if rebuild:
+                self._index = FacetIndex(list(self._rows.values()))
+                logger.info(f"Updated {len(changed)} institutions in the facet index")
+        except Exception:
+            # Keep serving the previous index; the next request retries
+            logger.exception("Facet index refresh failed")
+            self.mark_changed(ids)
+        finally:
+            self._refreshing = False
+
+
+facet_index = FacetIndexManager()
+
+
+def parse_filters(args, facets: Iterable[str] = FACETS) -> Dict[str, List[str]]:
+    """Comma-separated facet values from query arguments, e.g. state=NY,MA."""
+    filters = {}
+    for name in facets:
+        raw = args.get(name)
+        if raw:
+            filters[name] = [v.strip() for v in raw.split(",") if v.strip()]
+    return filters
+
+
+def parse_sort(raw: Optional[str]) -> Tuple[str, ...]:
+    if not raw:
+        return DEFAULT_SORT
+    return tuple(k.strip() for k in raw.split(",") if k.strip())
+
+
+def _on_invalidate(tags):
+    ids = [t.split(":", 1)[1] for t in tags if t.startswith("institution:")]
+    if ids:
+        facet_index.mark_changed(ids)
+    if INSTITUTIONS_TAG in tags:
+        facet_index.invalidate()
+
+
+cache.subscribe(_on_invalidate)
@@ -0,0 +1,301 @@
+"""
+Radius search over institution locations.
+
+Institutions only carry a ZIP code, so each one is placed at its ZIP
+centroid from a local file (ZIP_CENTROIDS_PATH, default zip_centroids.csv,
+not shipped with the repo). Any comma- or tab-separated file with zip/lat/lng
+columns works; common header spellings such as latitude/longitude are
+accepted, so the Census Bureau's ZCTA Gazetteer file can be used as
+downloaded (see README.md). Without it, `GeoIndexManager` raises
+`CentroidsUnavailable` and the location endpoints answer 503.
+
+Coordinates live in numpy arrays sorted by a fixed-size lat/lng grid cell, so
+a radius query only touches the cells overlapping the search box and computes
+haversine distances for those candidates in one vectorized pass.
+
+The index is built from Supabase on first use. After that, institutions named
+by an `institution:<id>` cache tag are re-read in a background thread and the
+index is only rebuilt if one of them moved or was renamed; requests keep
+getting the previous index meanwhile. Acceptance writes publish that tag too,
+but leave the location columns alone, so they no longer trigger a rebuild.
+"""
+import csv
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.catalogue import fetch_all
+from services.supabase_client import supabase
+from shared.cache import INSTITUTIONS_TAG, cache
+
+logger = logging.getLogger(__name__)
+
+ZIP_CENTROIDS_PATH = os.getenv("ZIP_CENTROIDS_PATH", "zip_centroids.csv")
+GRID_CELL_DEGREES = float(os.getenv("GEO_GRID_CELL_DEGREES", "0.5"))
+GEO_INDEX_TTL = float(os.getenv("GEO_INDEX_TTL", "3600"))
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+GEO_INSTITUTION_COLUMNS = "id, msea_org_id, name, city, state, zip"
+
+LAT_HEADERS = ("lat", "latitude", "intptlat")
+LNG_HEADERS = ("lng", "lon", "long", "longitude", "intptlong")
+ZIP_HEADERS = ("zip", "zipcode", "zip_code", "zcta", "zcta5", "geoid")
+
+
+class CentroidsUnavailable(RuntimeError):
+    """The ZIP centroid file is missing or unreadable."""
+
+
+def normalize_zip(zipcode) -> Optional[str]:
+    if zipcode is None:
+        return None
+    digits = str(zipcode).strip().split("-")[0]
+    return digits.zfill(5) if digits.isdigit() else None
+
+
+def load_zip_centroids(path: str = ZIP_CENTROIDS_PATH) -> Dict[str, Tuple[float, float]]:
+    with open(path, newline="") as f:
+        # The Census Gazetteer files are tab-separated
+        delimiter = "\t" if "\t" in f.readline() else ","
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        headers = {h.strip().lower(): h for h in reader.fieldnames or []}
+
+        def column(candidates):
+            for name in candidates:
+                if name in headers:
+                    return headers[name]
+            raise ValueError(f"{path} has no column named any of {candidates}")
+
+        zip_col, lat_col, lng_col = column(ZIP_HEADERS), column(LAT_HEADERS), column(LNG_HEADERS)
+        centroids = {}
+        for row in reader:
+            zipcode = normalize_zip(row[zip_col])
+            try:
+                centroids[zipcode] = (float(row[lat_col]), float(row[lng_col]))
+            except (TypeError, ValueError):
+                continue
+        centroids.pop(None, None)
+        return centroids
+
+
+def haversine_miles(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distance from one point to many, all in degrees."""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """Institution coordinates bucketed by grid cell."""
+
+    def __init__(
+        self,
+        institutions: Iterable[Dict],
+        centroids: Dict[str, Tuple[float, float]],
+        cell: float = GRID_CELL_DEGREES,
+    ):
+        self.cell = cell
+        self.records: Dict[str, Dict] = {}
+        ids, lats, lngs = [], [], []
+        for inst in institutions:
+            point = centroids.get(normalize_zip(inst.get("zip")))
+            if point is None:
+                continue
+            self.records[inst["msea_org_id"]] = inst
+            ids.append(inst["msea_org_id"])
+            lats.append(point[0])
+            lngs.append(point[1])
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        cell_lat = np.floor(lats / cell).astype(np.int64)
+        cell_lng = np.floor(lngs / cell).astype(np.int64)
+        order = np.lexsort((cell_lng, cell_lat))
+
+        self.ids = np.asarray(ids, dtype=object)[order]
+        self.lats = lats[order]
+        self.lngs = lngs[order]
+
+        # Contiguous [start, end) run per cell in the sorted arrays
+        self._cells: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        keys = np.stack((cell_lat[order], cell_lng[order]), axis=1)
+        if len(keys):
+            breaks = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+            starts = np.concatenate(([0], breaks))
+            ends = np.concatenate((breaks, [len(keys)]))
+            for start, end in zip(starts, ends):
+                self._cells[(int(keys[start, 0]), int(keys[start, 1]))] = (int(start), int(end))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _candidates(self, lat: float, lng: float, radius: float) -> np.ndarray:
+        dlat = radius / MILES_PER_DEGREE_LAT
+        # Longitude degrees shrink towards the poles; clamp to avoid blowing up
+        dlng = radius / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        lat_lo, lat_hi = math.floor((lat - dlat) / self.cell), math.floor((lat + dlat) / self.cell)
+        lng_lo, lng_hi = math.floor((lng - dlng) / self.cell), math.floor((lng + dlng) / self.cell)
+
+        runs = []
+        for cell_lat in range(lat_lo, lat_hi + 1):
+            for cell_lng in range(lng_lo, lng_hi + 1):
+                run = self._cells.get((cell_lat, cell_lng))
+                if run is not None:
+                    runs.append(np.arange(run[0], run[1]))
+        return np.concatenate(runs) if runs else np.empty(0, dtype=np.int64)
+
+    def within(
+        self, lat: float, lng: float, radius: float, limit: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """(msea_org_id, miles) within `radius` miles, nearest first."""
+        candidates = self._candidates(lat, lng, radius)
+        if not len(candidates):
+            return []
+        distances = haversine_miles(lat, lng, self.lats[candidates], self.lngs[candidates])
+        inside = distances <= radius
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [(self.ids[candidates[i]], float(distances[i])) for i in order]
+
+
+class GeoIndexManager:
+    """
+    Builds the index on first use, then refreshes it in the background while
+    the previous one keeps serving.
+    """
+
+    def __init__(self, centroids_path: str = ZIP_CENTROIDS_PATH, ttl: float = GEO_INDEX_TTL):
+        self.centroids_path = centroids_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._centroids: Optional[Dict[str, Tuple[float, float]]] = None
+        self._index: Optional[GeoIndex] = None
+        self._built_at = 0.0
+        # institutions.id -> row the current index was built from
+        self._rows: Dict[str, Dict] = {}
+        self._pending: Set[str] = set()
+        self._refreshing = False
+        self._invalidations = 0
+
+    @property
+    def centroids(self) -> Dict[str, Tuple[float, float]]:
+        if self._centroids is None:
+            try:
+                self._centroids = load_zip_centroids(self.centroids_path)
+            except (OSError, ValueError) as e:
+                raise CentroidsUnavailable(
+                    f"ZIP centroids are unavailable ({e}); set ZIP_CENTROIDS_PATH "
+                    "to a zip/lat/lng file such as the Census ZCTA Gazetteer"
+                ) from e
+        return self._centroids
+
+    def locate(self, zipcode: str) -> Optional[Tuple[float, float]]:
+        return self.centroids.get(normalize_zip(zipcode))
+
+    def invalidate(self) -> None:
+        self._invalidations += 1
+        self._built_at = 0.0
+
+    def mark_changed(self, institution_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._pending.update(institution_ids)
+
+    def current(self) -> GeoIndex:
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    # Nothing to serve yet
+                    self._rebuild()
+                return self._index
+        if self._pending or time.monotonic() - self._built_at > self.ttl:
+            self._refresh_in_background()
+        return index
+
+    def _rebuild(self) -> None:
+        started = time.perf_counter()
+        built_at, invalidations = time.monotonic(), self._invalidations
+        # Anything marked from here on may postdate the fetch; keep it pending
+        self._pending = set()
+        rows = fetch_all("institutions", GEO_INSTITUTION_COLUMNS)
+        index = GeoIndex(rows, self.centroids)
+        self._rows = {row["id"]: row for row in rows}
+        self._index = index
+        # An invalidation during the fetch leaves the new index stale
+        self._built_at = built_at if invalidations == self._invalidations else 0.0
+        logger.info(
+            f"Built geo index over {len(index)} institutions "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="geo-index", daemon=True).start()
+
+    def _refresh(self) -> None:
+        ids: List[str] = []
+        try:
+            if time.monotonic() - self._built_at > self.ttl:
+                self._rebuild()
+                return
+            with self._lock:
+                ids, self._pending = list(self._pending), set()
+            if not ids:
+                return
+            rows = (
+                supabase.table("institutions")
+                .select(GEO_INSTITUTION_COLUMNS)
+                .in_("id", ids)
+                .execute()
+                .data
+            )
+            fresh = {row["id"]: row for row in rows}
+            changed = [i for i in ids if self._rows.get(i) != fresh.get(i)]
+            if not changed:
+                return
+            for institution_id in changed:
+                if institution_id in fresh:
+                    self._rows[institution_id] = fresh[institution_id]
+                else:
+                    self._rows.pop(institution_id, None)
+            # Re-bucketing the in-memory rows is cheap next to a full fetch
+            self._index = GeoIndex(self._rows.values(), self.centroids)
+            logger.info(f"Updated {len(changed)} institutions in the geo index")
+        except Exception:
+            # Keep serving the previous index; the next request retries
+            logger.exception("Geo index refresh failed")
+            self.mark_changed(ids)
+        finally:
+            self._refreshing = False
+
+
+geo_index = GeoIndexManager()
+
+
+def _on_invalidate(tags):
+    ids = [t.split(":", 1)[1] for t in tags if t.startswith("institution:")]
+    if ids:
+        geo_index.mark_changed(ids)
+    if INSTITUTIONS_TAG in tags:
+        # An import or a stream reset; start over
+        geo_index.invalidate()
+
+
+cache.subscribe(_on_invalidate)
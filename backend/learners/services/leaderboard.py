@@ -0,0 +1,184 @@
+"""
+Browse-by-exam leaderboard.
+
+For every exam, the institutions accepting it are kept in two sorted key lists:
+- most credits first: (-credits, cut, name, org)
+- lowest cut first: (cut, -credits, name, org)
+
+A page is a bisect to the cursor (the last key of the previous page) plus a
+slice. Its cost therefore depends only on the page size, never on how many
+institutions accept the exam or how deep the page is.
+
+A policy write publishes `exam:<id>`. Only that exam's acceptances are
+re-read (once, for this and the what-if index, see services/exam_feed.py),
+and only the institutions whose posting changed are moved within the lists.
+"""
+import bisect
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.catalogue import ACCEPTANCE_COLUMNS, fetch_all
+from services.exam_feed import ExamIndexManager
+from services.supabase_client import supabase
+
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "86400"))
+LEADERBOARD_INSTITUTION_COLUMNS = "msea_org_id, name, city, state, zip"
+
+SORTS = ("credits", "cut_score")
+
+Key = Tuple
+
+
+def _keys(posting: Dict) -> Dict[str, Key]:
+    name = (posting["name"] or "").lower()
+    credits, cut = posting["credits"], posting["cut_score"]
+    return {
+        "credits": (-credits, cut, name, posting["msea_org_id"]),
+        "cut_score": (cut, -credits, name, posting["msea_org_id"]),
+    }
+
+
+def cursor_key(values: Optional[List]) -> Optional[Key]:
+    """A decoded cursor as a sort key. Raises ValueError if it is not one."""
+    if values is None:
+        return None
+    if (
+        len(values) != 4
+        or not all(isinstance(v, int) and not isinstance(v, bool) for v in values[:2])
+        or not all(isinstance(v, str) for v in values[2:])
+    ):
+        raise ValueError("Invalid cursor")
+    return tuple(values)
+
+
+class ExamLeaderboard:
+    def __init__(self, acceptances: List[Dict], institutions: List[Dict], exams: List[Dict]):
+        self.institutions = {
+            i["msea_org_id"]: {k: i.get(k) for k in ("msea_org_id", "name", "city", "state", "zip")}
+            for i in institutions
+        }
+        self.exam_names = {e["eid"]: e.get("name") for e in exams}
+        # eid -> msea_org_id -> posting
+        self.postings: Dict[int, Dict[str, Dict]] = defaultdict(dict)
+        # eid -> sort -> sorted keys
+        self.keys: Dict[int, Dict[str, List[Key]]] = defaultdict(lambda: {s: [] for s in SORTS})
+
+        grouped = defaultdict(list)
+        for acc in acceptances:
+            grouped[acc["eid"]].append(acc)
+        for eid, rows in grouped.items():
+            self.postings[eid] = self._postings(rows)
+            keys = [_keys(p) for p in self.postings[eid].values()]
+            self.keys[eid] = {s: sorted(k[s] for k in keys) for s in SORTS}
+
+    def _postings(self, rows: List[Dict]) -> Dict[str, Dict]:
+        """One posting per institution; its best (most credits) acceptance."""
+        postings = {}
+        for acc in rows:
+            org_id = acc["msea_org_id"]
+            inst = self.institutions.get(org_id)
+            if inst is None or acc.get("cut_score") is None:
+                continue
+            cut, credits = int(acc["cut_score"]), int(acc.get("credits") or 0)
+            best = postings.get(org_id)
+            if best is not None and (-best["credits"], best["cut_score"]) <= (-credits, cut):
+                continue
+            postings[org_id] = {
+                **inst,
+                "cut_score": cut,
+                "credits": credits,
+                "related_course": acc.get("related_course"),
+                "last_updated": acc.get("last_updated"),
+            }
+        return postings
+
+    def set_exam(self, eid: int, rows: List[Dict]) -> int:
+        """Apply an exam's current acceptances; returns postings moved."""
+        current = self.postings[eid]
+        fresh = self._postings(rows)
+        lists = self.keys[eid]
+        moved = 0
+        for org_id in set(current) | set(fresh):
+            old, new = current.get(org_id), fresh.get(org_id)
+            if old == new:
+                continue
+            if old is not None:
+                for sort, key in _keys(old).items():
+                    keys = lists[sort]
+                    del keys[bisect.bisect_left(keys, key)]
+                del current[org_id]
+            if new is not None:
+                for sort, key in _keys(new).items():
+                    bisect.insort(lists[sort], key)
+                current[org_id] = new
+            moved += 1
+        return moved
+
+    def count(self, eid: int) -> int:
+        return len(self.postings.get(eid, ()))
+
+    def page(
+        self, eid: int, sort: str, limit: int, after: Optional[Key] = None
+    ) -> Tuple[List[Dict], Optional[Key]]:
+        """
+        `limit` postings ranked after `after`, and the key to continue from
+        (None on the last page).
+        """
+        keys = self.keys[eid][sort] if eid in self.keys else []
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        window = keys[start:start + limit]
+        postings = self.postings.get(eid, {})
+        page = [postings[key[-1]] for key in window]
+        next_key = window[-1] if window and start + limit < len(keys) else None
+        return page, next_key
+
+
+class LeaderboardManager(ExamIndexManager[ExamLeaderboard]):
+    """Builds the leaderboard once and applies per-exam policy changes."""
+
+    name = "exam leaderboard"
+
+    def __init__(self, ttl: float = LEADERBOARD_TTL):
+        super().__init__(ttl)
+
+    def build(self) -> ExamLeaderboard:
+        return ExamLeaderboard(
+            fetch_all("acceptance", ACCEPTANCE_COLUMNS),
+            fetch_all("institutions", LEADERBOARD_INSTITUTION_COLUMNS),
+            fetch_all("exams", "eid, name"),
+        )
+
+    def apply(self, board: ExamLeaderboard, changes: Dict[int, List[Dict]]) -> None:
+        self._add_institutions(board, {r["msea_org_id"] for rows in changes.values() for r in rows})
+        self._add_exams(board, set(changes))
+        for eid, rows in changes.items():
+            board.set_exam(eid, rows)
+
+    @staticmethod
+    def _add_institutions(board: ExamLeaderboard, org_ids: Set[str]) -> None:
+        """Look up institutions that first appear in a changed policy."""
+        missing = list(org_ids - set(board.institutions))
+        if not missing:
+            return
+        rows = (
+            supabase.table("institutions")
+            .select(LEADERBOARD_INSTITUTION_COLUMNS)
+            .in_("msea_org_id", missing)
+            .execute()
+            .data
+        )
+        for row in rows:
+            board.institutions[row["msea_org_id"]] = row
+
+    @staticmethod
+    def _add_exams(board: ExamLeaderboard, exam_ids: Set[int]) -> None:
+        missing = list(exam_ids - set(board.exam_names))
+        if not missing:
+            return
+        rows = supabase.table("exams").select("eid, name").in_("eid", missing).execute().data
+        for row in rows:
+            board.exam_names[row["eid"]] = row.get("name")
+
+
+leaderboard = LeaderboardManager()
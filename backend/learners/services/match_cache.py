@@ -0,0 +1,83 @@
+"""
+Match-result cache keyed by threshold signature.
+
+Matching only depends on which cut scores each of a learner's scores clears,
+so every score is rounded down to the highest distinct cut score present for
+its exam. Learners with different raw scores but the same signature (plus the
+same zip/state filter) share one cached result; only `learner_score` differs
+and is filled back in per request.
+
+Entries and the per-exam cut lists are tagged `exam:<eid>`, so an acceptance
+write evicts exactly the signatures that include that exam.
+"""
+import bisect
+import os
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models import InstitutionHit, LearnerExam
+from shared.cache import cache, exam_tag
+from shared.metrics import metrics
+
+MATCH_CACHE_TTL = float(os.getenv("MATCH_CACHE_TTL", "600"))
+
+Signature = Tuple[Tuple[int, int], ...]
+
+
+def cut_scores(eid: int, source: str, loader: Callable[[int], List[int]]) -> List[int]:
+    """Distinct cut scores for an exam, ascending."""
+    return cache.get_or_load(
+        f"cuts:{source}:{eid}",
+        lambda: sorted(set(loader(eid))),
+        ttl=MATCH_CACHE_TTL,
+        tags=[exam_tag(eid)],
+    )
+
+
+def threshold_signature(score_map: Dict[int, int], cuts: Dict[int, List[int]]) -> Signature:
+    """(eid, highest cut cleared) per exam; exams clearing no cut drop out."""
+    signature = []
+    for eid, score in sorted(score_map.items()):
+        exam_cuts = cuts.get(eid) or []
+        i = bisect.bisect_right(exam_cuts, score)
+        if i:
+            signature.append((eid, exam_cuts[i - 1]))
+    return tuple(signature)
+
+
+def get_matches(
+    exams: List[LearnerExam],
+    zipcode: Optional[str],
+    state: Optional[str],
+    source: str,
+    cut_loader: Callable[[int], List[int]],
+    compute: Callable[[List[LearnerExam], Optional[str], Optional[str]], List[InstitutionHit]],
+) -> List[InstitutionHit]:
+    """
+    Cached `compute(exams, zipcode, state)`.
+
+    `source` names the data the loaders read (e.g. the replica's sync
+    watermark) so results from an older copy are never served after it moves.
+    """
+    score_map = {e.eid: e.score for e in exams}
+    cuts = {eid: cut_scores(eid, source, cut_loader) for eid in score_map}
+    signature = threshold_signature(score_map, cuts)
+    if not signature:
+        metrics.incr("match_cache.empty_signature")
+        return []
+
+    key = "matches:{}:{}|{}|{}".format(
+        source,
+        ",".join(f"{eid}={cut}" for eid, cut in signature),
+        zipcode or "",
+        state or "",
+    )
+    # Matching at the rounded-down scores selects exactly the same acceptances
+    canonical = [LearnerExam(eid=eid, score=cut) for eid, cut in signature]
+    hits = cache.get_or_load(
+        key,
+        lambda: compute(canonical, zipcode, state),
+        ttl=MATCH_CACHE_TTL,
+        tags=[exam_tag(eid) for eid, _ in signature],
+    )
+    return [replace(hit, learner_score=score_map[hit.eid]) for hit in hits]
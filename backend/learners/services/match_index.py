@@ -0,0 +1,222 @@
+"""
+Match index in shared memory, built once and attached by every worker.
+
+A coordinator process encodes the catalogue in the columnar snapshot layout
+(services/snapshot.py) and publishes it as a `multiprocessing.shared_memory`
+segment named after its generation. A tiny control segment holds the current
+generation behind a sequence lock. Workers map the published segment
+read-only, so memory does not grow with worker count and a policy change
+costs one rebuild instead of one per worker.
+
+Workers hold a reference on the index for the duration of a request; when the
+generation moves on they attach the new segment for new requests and close the
+old one once its last in-flight request finishes.
+
+Usage (from backend/learners):
+    python -m services.match_index serve [--interval SECONDS]
+"""
+import argparse
+import atexit
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, Optional
+
+from services.snapshot import Snapshot, build_bytes
+
+logger = logging.getLogger(__name__)
+
+PREFIX = os.getenv("MATCH_INDEX_SHM_PREFIX", "clep_match")
+# seq (odd while a write is in progress), generation, segment size
+CONTROL = struct.Struct("<QQQ")
+
+
+def _segment_name(generation: int) -> str:
+    return f"{PREFIX}_{generation}"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach without letting this process's resource tracker unlink it on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no `track` argument
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class MatchIndexCoordinator:
+    """Builds index generations and publishes them to shared memory."""
+
+    def __init__(self):
+        try:
+            self.control = shared_memory.SharedMemory(
+                name=f"{PREFIX}_ctl", create=True, size=CONTROL.size
+            )
+            CONTROL.pack_into(self.control.buf, 0, 0, 0, 0)
+        except FileExistsError:
+            self.control = _attach(f"{PREFIX}_ctl")
+        self._segments = []
+        self._lock = threading.Lock()
+
+    def publish(self, catalogue) -> int:
+        with self._lock:
+            generation = time.time_ns()
+            data = build_bytes(catalogue, generation)
+            segment = shared_memory.SharedMemory(
+                name=_segment_name(generation), create=True, size=len(data)
+            )
+            segment.buf[:len(data)] = data
+
+            seq = CONTROL.unpack_from(self.control.buf, 0)[0]
+            CONTROL.pack_into(self.control.buf, 0, seq + 1, generation, len(data))
+            CONTROL.pack_into(self.control.buf, 0, seq + 2, generation, len(data))
+
+            # Keep the previous generation's name around for workers that are
+            # attaching right now; older names can go (mappings stay valid)
+            self._segments.append(segment)
+            while len(self._segments) > 2:
+                old = self._segments.pop(0)
+                old.close()
+                old.unlink()
+            logger.info(f"Published match index generation {generation} ({len(data)} bytes)")
+            return generation
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+        self.control.close()
+        self.control.unlink()
+
+
+class _Attached:
+    def __init__(self, generation: int, shm: shared_memory.SharedMemory, size: int):
+        self.generation = generation
+        self.shm = shm
+        self.index = Snapshot(shm.buf[:size].toreadonly())
+        self.refs = 0
+        self.retired = False
+
+    def close(self) -> None:
+        self.index.reader.release()
+        self.index = None
+        self.shm.close()
+
+
+class MatchIndexClient:
+    """Per-worker handle on the shared index."""
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._control: Optional[shared_memory.SharedMemory] = None
+        self._current: Optional[_Attached] = None
+        self._checked_at = 0.0
+
+    def _read_control(self):
+        if self._control is None:
+            try:
+                self._control = _attach(f"{PREFIX}_ctl")
+            except FileNotFoundError:
+                return None
+        while True:
+            before, generation, size = CONTROL.unpack_from(self._control.buf, 0)
+            if before % 2:
+                continue
+            after = CONTROL.unpack_from(self._control.buf, 0)[0]
+            if before == after:
+                return (generation, size) if generation else None
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        published = self._read_control()
+        if published is None:
+            return
+        generation, size = published
+        if self._current is not None and self._current.generation == generation:
+            return
+        try:
+            attached = _Attached(generation, _attach(_segment_name(generation)), size)
+        except FileNotFoundError:
+            # Superseded between reading the control block and attaching
+            return
+
+        previous, self._current = self._current, attached
+        if previous is not None:
+            previous.retired = True
+            if previous.refs == 0:
+                previous.close()
+
+    @contextmanager
+    def acquire(self) -> Iterator[Optional[Snapshot]]:
+        """Pin the current index generation for the duration of a request."""
+        with self._lock:
+            self._refresh()
+            attached = self._current
+            if attached is not None:
+                attached.refs += 1
+        try:
+            yield attached.index if attached is not None else None
+        finally:
+            if attached is not None:
+                with self._lock:
+                    attached.refs -= 1
+                    if attached.retired and attached.refs == 0:
+                        attached.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._current is not None and self._current.refs == 0:
+                self._current.close()
+            self._current = None
+            if self._control is not None:
+                self._control.close()
+                self._control = None
+
+
+match_index = MatchIndexClient()
+atexit.register(match_index.close)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the shared match index coordinator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Build and republish the index")
+    serve.add_argument("--interval", type=float, default=300.0,
+                       help="Full rebuild interval in seconds")
+    args = parser.parse_args()
+
+    # `shared` lives one level above the learners service
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    from services.catalogue import fetch_catalogue
+    from shared.cache import CATALOGUE_TAG, cache
+
+    coordinator = MatchIndexCoordinator()
+    rebuild = threading.Event()
+    # Policy writes publish the catalogue tag; rebuild promptly instead of waiting
+    cache.subscribe(lambda tags: rebuild.set() if CATALOGUE_TAG in tags else None)
+
+    try:
+        while True:
+            try:
+                coordinator.publish(fetch_catalogue())
+            except Exception as e:
+                logger.error(f"Match index rebuild failed: {e}")
+            rebuild.wait(args.interval)
+            rebuild.clear()
+    finally:
+        coordinator.close()
+
+
+if __name__ == "__main__":
+    main()
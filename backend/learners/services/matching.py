@@ -0,0 +1,65 @@
+"""
+Matching helpers shared by the request path and background recomputes.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from models import InstitutionHit, LearnerExam
+from services.snapshot import Snapshot
+
+
+def freshness(ts: Optional[str]) -> str:
+    if ts is None:
+        return "old"
+    dt = datetime.fromisoformat(ts.replace(" ", "T"))
+    now = datetime.now(timezone.utc)
+    delta = now - dt.replace(tzinfo=timezone.utc)
+    if delta <= timedelta(days=180):
+        return "fresh"
+    if delta <= timedelta(days=365):
+        return "stale"
+    return "old"
+
+
+def search_snapshot(
+    snapshot: Snapshot,
+    exams: List[LearnerExam],
+    zipcode: Optional[str],
+    state: Optional[str],
+) -> List[InstitutionHit]:
+    score_map = {e.eid: e.score for e in exams}
+    institutions = {}
+
+    results = []
+    for i in snapshot.matches(score_map):
+        acc = snapshot.acceptance(i)
+        inst = institutions.get(acc["institution"])
+        if inst is None:
+            inst = institutions[acc["institution"]] = snapshot.institution(acc["institution"])
+
+        if zipcode and inst["zip"] != zipcode:
+            continue
+        if state and inst["state"] != state:
+            continue
+
+        results.append(
+            InstitutionHit(
+                msea_org_id=inst["msea_org_id"],
+                name=inst["name"],
+                city=inst["city"],
+                state=inst["state"],
+                zip=inst["zip"],
+                eid=acc["eid"],
+                exam_name=snapshot.exam_name(acc["eid"]) or "Unknown",
+                required_cut=acc["cut_score"],
+                learner_score=score_map[acc["eid"]],
+                credits=acc["credits"],
+                related_course=acc["related_course"],
+                last_updated=acc["last_updated"],
+                freshness=freshness(acc["last_updated"]),
+                can_use_for_failed_courses=inst["can_use_for_failed_courses"],
+                can_enrolled_students_use_clep=inst["can_enrolled_students_use_clep"],
+            )
+        )
+
+    return results
@@ -0,0 +1,137 @@
+"""
+Per-institution ranking of a learner's matches.
+
+`search_matches` yields one hit per matching acceptance. Here the hits are
+folded into one entry per institution. Its credits are the matched total
+capped by the institution's `max_credits` and by the learner's own credit
+goal (`User.maxCredits`). Ties go to the institution with the most recently
+updated matching policy, then the lower transcription fee, then the name.
+
+Only one page is ever ordered. `heapq.nsmallest` picks the `limit` best
+entries past the previous page's sort key, and that key is handed back as an
+opaque keyset cursor. Every page costs O(n log limit), however deep it is.
+"""
+import heapq
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from models import InstitutionHit
+from services.matching import freshness
+
+# Stands in for a missing fee so unknown fees rank after every known one
+UNKNOWN_FEE = 10 ** 9
+
+
+def _epoch(ts: Optional[str]) -> int:
+    if not ts:
+        return 0
+    try:
+        dt = datetime.fromisoformat(str(ts).replace(" ", "T").replace("Z", "+00:00"))
+    except ValueError:
+        return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _cap(total: int, *caps: Optional[int]) -> Tuple[int, Optional[str]]:
+    """Credits after applying caps (institution, learner) and which one bit."""
+    credits, capped_by = total, None
+    for name, cap in zip(("institution", "learner"), caps):
+        if cap is not None and cap < credits:
+            credits, capped_by = cap, name
+    return credits, capped_by
+
+
+def aggregate(
+    hits: Iterable[InstitutionHit],
+    institutions: Mapping[str, Dict],
+    learner_max_credits: Optional[int] = None,
+) -> List[Dict]:
+    """One entry per institution; `institutions` maps msea_org_id to its row."""
+    grouped: Dict[str, Dict] = {}
+    for hit in hits:
+        entry = grouped.get(hit.msea_org_id)
+        if entry is None:
+            inst = institutions.get(hit.msea_org_id) or {}
+            entry = grouped[hit.msea_org_id] = {
+                "msea_org_id": hit.msea_org_id,
+                "name": hit.name,
+                "city": hit.city,
+                "state": hit.state,
+                "zip": hit.zip,
+                "max_credits": inst.get("max_credits"),
+                "transcription_fee": inst.get("transcription_fee"),
+                "matched_credits": 0,
+                "last_updated": None,
+                "exams": [],
+            }
+        entry["matched_credits"] += hit.credits or 0
+        if _epoch(hit.last_updated) > _epoch(entry["last_updated"]):
+            entry["last_updated"] = hit.last_updated
+        entry["exams"].append({
+            "eid": hit.eid,
+            "exam_name": hit.exam_name,
+            "credits": hit.credits,
+            "required_cut": hit.required_cut,
+            "learner_score": hit.learner_score,
+        })
+
+    for entry in grouped.values():
+        entry["credits"], entry["capped_by"] = _cap(
+            entry["matched_credits"], entry["max_credits"], learner_max_credits
+        )
+        entry["freshness"] = freshness(entry["last_updated"])
+        entry["exams"].sort(key=lambda e: -(e["credits"] or 0))
+    return list(grouped.values())
+
+
+def totals(entries: List[Dict]) -> Dict:
+    """Institution count and capped credit totals over `aggregate` entries."""
+    return {
+        "institution_count": len(entries),
+        "total_credits": sum(e["credits"] for e in entries),
+        "best_credits": max((e["credits"] for e in entries), default=0),
+    }
+
+
+def sort_key(entry: Dict) -> List:
+    """Ascending key: most credits, freshest policy, lowest fee, then name."""
+    fee = entry["transcription_fee"]
+    return [
+        -entry["credits"],
+        -_epoch(entry["last_updated"]),
+        UNKNOWN_FEE if fee is None else fee,
+        (entry["name"] or "").lower(),
+        entry["msea_org_id"],
+    ]
+
+
+def cursor_key(values: Optional[List]) -> Optional[List]:
+    """A decoded cursor as a sort key. Raises ValueError if it is not one."""
+    if values is None:
+        return None
+    if (
+        len(values) != 5
+        or not all(isinstance(v, int) and not isinstance(v, bool) for v in values[:3])
+        or not all(isinstance(v, str) for v in values[3:])
+    ):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def top_page(
+    entries: List[Dict], limit: int, after: Optional[List] = None
+) -> Tuple[List[Dict], Optional[List]]:
+    """
+    The `limit` best entries ranked after `after` (a previous page's last sort
+    key), and the key to continue from, or None on the last page.
+    """
+    keyed = ((sort_key(e), e) for e in entries)
+    if after is not None:
+        keyed = ((k, e) for k, e in keyed if k > after)
+    # One extra entry tells us whether another page follows
+    best = heapq.nsmallest(limit + 1, keyed, key=lambda ke: ke[0])
+    page = best[:limit]
+    next_key = page[-1][0] if len(best) > limit else None
+    return [e for _, e in page], next_key
@@ -0,0 +1,241 @@
+"""
+Materialized per-learner recommendations.
+
+Each learner's eligible institutions and credit totals are stored in the
+`recommendations` table (migrations/001_create_recommendations.sql) and served
+with one keyed read. They are recomputed:
+
+- for one learner, when `upsert_learner_exams` changes their scores;
+- for the learners holding an exam, when a policy write publishes that
+  exam's cache tag (`watch`);
+- for everyone, by the nightly `rebuild`, which fans out over a process pool.
+
+Background recomputes match against the shared catalogue snapshot
+(services/snapshot.py). When the mapped file predates the writes being
+processed, the watcher rewrites it from one catalogue read. That refreshes it
+for every worker too, and recomputes never see a generation older than the
+write that triggered them. `watch` follows policy writes through the shared
+cache tier, so it needs CACHE_REDIS_URL.
+
+Usage (from backend/learners):
+    python -m services.recommendations rebuild [--workers N]
+    python -m services.recommendations watch
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from models import InstitutionHit, LearnerExam
+from services import ranking
+from services.catalogue import PAGE_SIZE, fetch_all, fetch_catalogue
+from services.matching import search_snapshot
+from services.snapshot import Snapshot, build_bytes, snapshots, write_snapshot
+from services.supabase_client import supabase
+
+logger = logging.getLogger(__name__)
+
+TABLE = "recommendations"
+# Learners per process-pool task and per upsert
+CHUNK_SIZE = 500
+# Policy writes arriving within this window are recomputed together
+WATCH_DEBOUNCE = float(os.getenv("RECOMMENDATIONS_WATCH_DEBOUNCE", "2"))
+
+
+def summarize(
+    learner_id: int, hits: List[InstitutionHit], institutions: Mapping[str, Dict]
+) -> Dict:
+    """
+    One row per institution, ranked and capped like /universities/ranked
+    (`institutions` maps msea_org_id to a row with max_credits).
+    """
+    entries = ranking.aggregate(hits, institutions)
+    entries.sort(key=ranking.sort_key)
+    return {
+        "learner_id": learner_id,
+        "institutions": entries,
+        **ranking.totals(entries),
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def load(learner_id: int) -> Optional[Dict]:
+    rows = supabase.table(TABLE).select("*").eq("learner_id", learner_id).execute().data
+    return rows[0] if rows else None
+
+
+def store(rows: List[Dict]) -> None:
+    for start in range(0, len(rows), CHUNK_SIZE):
+        supabase.table(TABLE).upsert(rows[start:start + CHUNK_SIZE]).execute()
+
+
+def learner_scores(learner_ids: Iterable[int]) -> Dict[int, List[LearnerExam]]:
+    learner_ids = list(learner_ids)
+    scores: Dict[int, List[LearnerExam]] = {learner_id: [] for learner_id in learner_ids}
+    for start in range(0, len(learner_ids), CHUNK_SIZE):
+        rows = (
+            supabase.table("learner_exams")
+            .select("learner_id, eid, score")
+            .in_("learner_id", learner_ids[start:start + CHUNK_SIZE])
+            .execute()
+            .data
+        )
+        for row in rows:
+            scores[row["learner_id"]].append(LearnerExam(eid=row["eid"], score=row["score"]))
+    return scores
+
+
+def affected_learners(exam_ids: Iterable[int]) -> List[int]:
+    """Learners holding a score for any of these exams."""
+    exam_ids = list(exam_ids)
+    learners = set()
+    start = 0
+    while exam_ids:
+        page = (
+            supabase.table("learner_exams")
+            .select("learner_id")
+            .in_("eid", exam_ids)
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+            .data
+        )
+        learners.update(row["learner_id"] for row in page)
+        if len(page) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return sorted(learners)
+
+
+def recompute(snapshot: Snapshot, learner_ids: List[int]) -> int:
+    scores = learner_scores(learner_ids)
+    institutions = {
+        inst["msea_org_id"]: inst
+        for inst in map(snapshot.institution, range(snapshot.institution_count))
+    }
+    rows = [
+        summarize(learner_id, search_snapshot(snapshot, exams, None, None), institutions)
+        for learner_id, exams in scores.items()
+    ]
+    store(rows)
+    return len(rows)
+
+
+def snapshot_since(written_at_ns: int) -> Snapshot:
+    """
+    The shared snapshot if it was built after `written_at_ns`; otherwise
+    rebuild the file once from a catalogue read started now.
+    """
+    snapshot = snapshots.current()
+    if snapshot is None or snapshot.generation < written_at_ns:
+        started = time.time_ns()
+        write_snapshot(fetch_catalogue(), snapshots.path, generation=started)
+        snapshot = snapshots.reload()
+    return snapshot
+
+
+# ----------------------------------------------------------------------
+# Full rebuild (process pool)
+# ----------------------------------------------------------------------
+
+_worker_snapshot: Optional[Snapshot] = None
+
+
+def _init_worker(snapshot_bytes: bytes) -> None:
+    global _worker_snapshot
+    _worker_snapshot = Snapshot(snapshot_bytes)
+
+
+def _rebuild_chunk(learner_ids: List[int]) -> int:
+    return recompute(_worker_snapshot, learner_ids)
+
+
+def rebuild(workers: Optional[int] = None) -> int:
+    """Recompute every learner, one catalogue read shared by all workers."""
+    snapshot_bytes = build_bytes(fetch_catalogue())
+    learner_ids = sorted({row["learner_id"] for row in fetch_all("learner_exams", "learner_id")})
+    chunks = [learner_ids[i:i + CHUNK_SIZE] for i in range(0, len(learner_ids), CHUNK_SIZE)]
+
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(snapshot_bytes,),
+    ) as pool:
+        return sum(pool.map(_rebuild_chunk, chunks))
+
+
+# ----------------------------------------------------------------------
+# Incremental recompute on policy writes
+# ----------------------------------------------------------------------
+
+
+def watch() -> None:
+    """Recompute the learners affected by each batch of policy writes."""
+    from shared.cache import cache
+
+    if cache.shared is None:
+        # Without the shared tier no other process's writes ever arrive here
+        raise RuntimeError("watch needs the shared cache tier; set CACHE_REDIS_URL")
+
+    pending = set()
+    lock = threading.Lock()
+    changed = threading.Event()
+    # When the oldest write in `pending` was seen
+    first_seen = [0]
+
+    def on_invalidate(tags):
+        exam_ids = {int(t.split(":", 1)[1]) for t in tags if t.startswith("exam:")}
+        if exam_ids:
+            with lock:
+                if not pending:
+                    first_seen[0] = time.time_ns()
+                pending.update(exam_ids)
+            changed.set()
+
+    cache.subscribe(on_invalidate)
+    while True:
+        changed.wait()
+        changed.clear()
+        # Let bursts of writes to several exams settle into one pass
+        changed.wait(WATCH_DEBOUNCE)
+        with lock:
+            exam_ids = sorted(pending)
+            written_at = first_seen[0]
+            pending.clear()
+        changed.clear()
+        try:
+            learner_ids = affected_learners(exam_ids)
+            if learner_ids:
+                count = recompute(snapshot_since(written_at), learner_ids)
+                logger.info(f"Recomputed {count} learners for exams {exam_ids}")
+        except Exception as e:
+            logger.error(f"Recommendation recompute for exams {exam_ids} failed: {e}")
+            with lock:
+                first_seen[0] = min(first_seen[0], written_at) if pending else written_at
+                pending.update(exam_ids)
+            changed.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain materialized recommendations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("rebuild", help="Recompute every learner")
+    build.add_argument("--workers", type=int, default=None,
+                       help="Worker processes (default: CPU count)")
+    sub.add_parser("watch", help="Recompute affected learners on policy writes")
+    args = parser.parse_args()
+
+    # `shared` lives one level above the learners service
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+    if args.command == "rebuild":
+        print(f"Recomputed {rebuild(args.workers)} learners")
+    else:
+        watch()
+
+
+if __name__ == "__main__":
+    main()
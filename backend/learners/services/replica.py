@@ -0,0 +1,398 @@
+"""
+Optional local SQLite read replica of the learner-facing tables.
+
+Enabled by LEARNERS_REPLICA_PATH. A background loop pulls institutions,
+acceptances and favorites changed since the last `last_updated` watermark
+(favorites need migrations/002_favorites_last_updated.sql), refreshes the
+small exam table, and periodically reconciles keys so deletes are dropped
+too. Each table is paged in (last_updated, primary key) order by keyset, so
+rows sharing a timestamp are neither skipped nor read twice across pages.
+Reads are then local queries against indexed tables (exam id + cut score,
+state, zip) with FTS5 over institution names.
+
+Every worker process that imports this module opens the same file, but only
+one of them syncs it at a time: the loop holds an exclusive lock on
+`<path>.sync.lock`, and the other workers' loops wait for it. The OS drops
+the lock when the worker exits, so another worker takes over within one
+interval.
+
+Usage (from backend/learners):
+    python -m services.replica sync [--path PATH]
+"""
+import argparse
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from services.catalogue import (
+    ACCEPTANCE_COLUMNS, EXAM_COLUMNS, INSTITUTION_COLUMNS, PAGE_SIZE, fetch_all,
+)
+from services.supabase_client import supabase
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PATH = os.getenv("LEARNERS_REPLICA_PATH")
+SYNC_INTERVAL = float(os.getenv("LEARNERS_REPLICA_SYNC_INTERVAL", "30"))
+# Every Nth sync also reconciles primary keys to pick up deletes
+RECONCILE_EVERY = int(os.getenv("LEARNERS_REPLICA_RECONCILE_EVERY", "20"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS institutions (
+    msea_org_id TEXT PRIMARY KEY,
+    id TEXT,
+    name TEXT,
+    city TEXT,
+    state TEXT,
+    zip TEXT,
+    enrollment INTEGER,
+    max_credits INTEGER,
+    transcription_fee INTEGER,
+    can_use_for_failed_courses INTEGER,
+    can_enrolled_students_use_clep INTEGER,
+    score_validity TEXT,
+    last_updated TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_institutions_state ON institutions (state);
+CREATE INDEX IF NOT EXISTS idx_institutions_zip ON institutions (zip);
+
+CREATE TABLE IF NOT EXISTS acceptance (
+    msea_org_id TEXT NOT NULL,
+    eid INTEGER NOT NULL,
+    cut_score INTEGER NOT NULL,
+    credits INTEGER,
+    related_course TEXT,
+    last_updated TEXT,
+    PRIMARY KEY (msea_org_id, eid)
+);
+CREATE INDEX IF NOT EXISTS idx_acceptance_eid_cut ON acceptance (eid, cut_score);
+
+CREATE TABLE IF NOT EXISTS exams (
+    eid INTEGER PRIMARY KEY,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    learner_id INTEGER NOT NULL,
+    msea_org_id TEXT NOT NULL,
+    PRIMARY KEY (learner_id, msea_org_id)
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    table_name TEXT PRIMARY KEY,
+    watermark TEXT
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS institutions_fts USING fts5 (
+    name, city, content='institutions', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS institutions_ai AFTER INSERT ON institutions BEGIN
+    INSERT INTO institutions_fts (rowid, name, city) VALUES (new.rowid, new.name, new.city);
+END;
+CREATE TRIGGER IF NOT EXISTS institutions_ad AFTER DELETE ON institutions BEGIN
+    INSERT INTO institutions_fts (institutions_fts, rowid, name, city)
+    VALUES ('delete', old.rowid, old.name, old.city);
+END;
+CREATE TRIGGER IF NOT EXISTS institutions_au AFTER UPDATE ON institutions BEGIN
+    INSERT INTO institutions_fts (institutions_fts, rowid, name, city)
+    VALUES ('delete', old.rowid, old.name, old.city);
+    INSERT INTO institutions_fts (rowid, name, city) VALUES (new.rowid, new.name, new.city);
+END;
+"""
+
+INSTITUTION_FIELDS = [c.strip() for c in INSTITUTION_COLUMNS.split(",")]
+ACCEPTANCE_FIELDS = [c.strip() for c in ACCEPTANCE_COLUMNS.split(",")]
+FAVORITE_FIELDS = ["learner_id", "msea_org_id"]
+
+
+def _quote(value) -> str:
+    """A PostgREST filter value, quoted so timestamps and commas stay intact."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _after(row: Dict, key: List[str]) -> str:
+    """
+    PostgREST `or` filter for rows after `row` in (last_updated, *key) order.
+    Ascending order puts NULL stamps last.
+    """
+    stamp = row.get("last_updated")
+    if stamp is None:
+        same, branches = ["last_updated.is.null"], []
+    else:
+        same = [f"last_updated.eq.{_quote(stamp)}"]
+        branches = [f"last_updated.gt.{_quote(stamp)}", "last_updated.is.null"]
+    for i, column in enumerate(key):
+        ties = [f"{k}.eq.{_quote(row[k])}" for k in key[:i]]
+        branches.append(f"and({','.join(same + ties + [f'{column}.gt.{_quote(row[column])}'])})")
+    return ",".join(branches)
+
+
+def _upsert_sql(table: str, fields: List[str], key: List[str]) -> str:
+    updates = ", ".join(f"{f} = excluded.{f}" for f in fields if f not in key)
+    return (
+        f"INSERT INTO {table} ({', '.join(fields)}) "
+        f"VALUES ({', '.join('?' for _ in fields)}) "
+        f"ON CONFLICT ({', '.join(key)}) "
+        + (f"DO UPDATE SET {updates}" if updates else "DO NOTHING")
+    )
+
+
+class Replica:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._syncs = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+        with self._write_lock:
+            conn = self._conn()
+            had_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'institutions_fts'"
+            ).fetchone()
+            conn.executescript(SCHEMA)
+            if not had_fts:
+                # Replicas created while the index was dropped already have rows
+                conn.execute("INSERT INTO institutions_fts (institutions_fts) VALUES ('rebuild')")
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+
+    def _watermark(self, table: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT watermark FROM sync_state WHERE table_name = ?", (table,)
+        ).fetchone()
+        return row["watermark"] if row else None
+
+    def _pull_changed(self, table: str, columns: str, key: List[str]) -> List[Dict]:
+        """Rows changed since the watermark, oldest first."""
+        watermark = self._watermark(table)
+        rows: List[Dict] = []
+        while True:
+            query = supabase.table(table).select(columns).order("last_updated")
+            for column in key:
+                query = query.order(column)
+            if watermark:
+                query = query.gte("last_updated", watermark)
+            if rows:
+                query = query.or_(_after(rows[-1], key))
+            page = query.limit(PAGE_SIZE).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+
+    def _apply(self, table: str, fields: List[str], key: List[str], rows: Iterable[Dict]) -> int:
+        rows = list(rows)
+        if not rows:
+            return 0
+        conn = self._conn()
+        conn.executemany(
+            _upsert_sql(table, fields, key),
+            [tuple(row.get(f) for f in fields) for row in rows],
+        )
+        stamps = [row["last_updated"] for row in rows if row.get("last_updated")]
+        if stamps:
+            conn.execute(
+                "INSERT INTO sync_state (table_name, watermark) VALUES (?, ?) "
+                "ON CONFLICT (table_name) DO UPDATE SET watermark = excluded.watermark",
+                (table, max(stamps)),
+            )
+        return len(rows)
+
+    @staticmethod
+    def _upstream_keys(table: str, key: List[str]) -> Set[tuple]:
+        return {tuple(r[k] for k in key) for r in fetch_all(table, ", ".join(key))}
+
+    def _reconcile(self, table: str, key: List[str], upstream: Set[tuple]) -> int:
+        """Delete local rows whose keys are not in `upstream`."""
+        conn = self._conn()
+        local = conn.execute(f"SELECT {', '.join(key)} FROM {table}").fetchall()
+        stale = [tuple(r) for r in local if tuple(r) not in upstream]
+        where = " AND ".join(f"{k} = ?" for k in key)
+        conn.executemany(f"DELETE FROM {table} WHERE {where}", stale)
+        return len(stale)
+
+    def sync_once(self) -> Dict[str, int]:
+        # Network reads happen before taking the write lock
+        institutions = self._pull_changed("institutions", INSTITUTION_COLUMNS, ["msea_org_id"])
+        acceptances = self._pull_changed(
+            "acceptance", ACCEPTANCE_COLUMNS, ["msea_org_id", "eid"]
+        )
+        exams = fetch_all("exams", EXAM_COLUMNS)
+        favorites = self._pull_changed(
+            "favorites", "learner_id, msea_org_id, last_updated", FAVORITE_FIELDS
+        )
+
+        self._syncs += 1
+        reconcile = self._syncs % RECONCILE_EVERY == 0
+        if reconcile:
+            # Read after the pulls, so nothing just pulled is missing from here
+            upstream = {
+                "institutions": self._upstream_keys("institutions", ["msea_org_id"]),
+                "acceptance": self._upstream_keys("acceptance", ["msea_org_id", "eid"]),
+                "favorites": self._upstream_keys("favorites", FAVORITE_FIELDS),
+            }
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                stats = {
+                    "institutions": self._apply(
+                        "institutions", INSTITUTION_FIELDS, ["msea_org_id"], institutions
+                    ),
+                    "acceptance": self._apply(
+                        "acceptance", ACCEPTANCE_FIELDS, ["msea_org_id", "eid"], acceptances
+                    ),
+                    "exams": self._apply("exams", ["eid", "name"], ["eid"], exams),
+                    "favorites": self._apply(
+                        "favorites", FAVORITE_FIELDS, FAVORITE_FIELDS, favorites
+                    ),
+                }
+                if reconcile:
+                    stats["deleted"] = (
+                        self._reconcile("institutions", ["msea_org_id"], upstream["institutions"])
+                        + self._reconcile(
+                            "acceptance", ["msea_org_id", "eid"], upstream["acceptance"]
+                        )
+                        + self._reconcile("favorites", FAVORITE_FIELDS, upstream["favorites"])
+                    )
+        return stats
+
+    def _acquire_sync_lock(self) -> bool:
+        """True once this process is the one syncing the file."""
+        if self._lock_file is not None:
+            return True
+        f = open(f"{self.path}.sync.lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        # Held until the process exits
+        self._lock_file = f
+        logger.info(f"Worker {os.getpid()} is syncing the replica")
+        return True
+
+    def start(self, interval: float = SYNC_INTERVAL) -> None:
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    if self._acquire_sync_lock():
+                        stats = self.sync_once()
+                        logger.info(f"Replica sync: {stats}")
+                except Exception as e:
+                    logger.error(f"Replica sync failed: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def is_ready(self) -> bool:
+        return self._watermark("acceptance") is not None
+
+    def version(self) -> str:
+        """Changes whenever a sync applies new rows."""
+        return f"{self._watermark('acceptance')}|{self._watermark('institutions')}"
+
+    def cut_scores(self, eid: int) -> List[int]:
+        rows = self._conn().execute(
+            "SELECT DISTINCT cut_score FROM acceptance WHERE eid = ? ORDER BY cut_score", (eid,)
+        ).fetchall()
+        return [r["cut_score"] for r in rows]
+
+    def matching_acceptances(self, score_map: Dict[int, int]) -> List[Dict]:
+        """Acceptances a learner qualifies for, via the (eid, cut_score) index."""
+        if not score_map:
+            return []
+        clause = " OR ".join("(eid = ? AND cut_score <= ?)" for _ in score_map)
+        params = [v for pair in score_map.items() for v in pair]
+        rows = self._conn().execute(
+            f"SELECT {', '.join(ACCEPTANCE_FIELDS)} FROM acceptance WHERE {clause}", params
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def institutions(self, org_ids: Iterable[str]) -> Dict[str, Dict]:
+        org_ids = list(org_ids)
+        if not org_ids:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT {', '.join(INSTITUTION_FIELDS)} FROM institutions "
+            f"WHERE msea_org_id IN ({', '.join('?' for _ in org_ids)})",
+            org_ids,
+        ).fetchall()
+        result = {}
+        for r in rows:
+            inst = dict(r)
+            inst["can_use_for_failed_courses"] = bool(inst["can_use_for_failed_courses"])
+            inst["can_enrolled_students_use_clep"] = bool(inst["can_enrolled_students_use_clep"])
+            result[inst["msea_org_id"]] = inst
+        return result
+
+    def exam_names(self) -> Dict[int, str]:
+        return {r["eid"]: r["name"] for r in self._conn().execute("SELECT eid, name FROM exams")}
+
+    def search_names(self, query: str, limit: int = 10) -> List[Dict]:
+        """Full-text search over institution names and cities."""
+        terms = [t for t in query.replace('"', " ").split() if t]
+        if not terms:
+            return []
+        match = " ".join(f'"{t}"*' for t in terms)
+        rows = self._conn().execute(
+            "SELECT i.msea_org_id, i.name, i.city, i.state, i.zip "
+            "FROM institutions_fts f JOIN institutions i ON i.rowid = f.rowid "
+            "WHERE institutions_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def favorite_org_ids(self, learner_id: int) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT msea_org_id FROM favorites WHERE learner_id = ?", (learner_id,)
+        ).fetchall()
+        return [r["msea_org_id"] for r in rows]
+
+    def add_favorite(self, learner_id: int, msea_org_id: str) -> None:
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO favorites (learner_id, msea_org_id) VALUES (?, ?)",
+                    (learner_id, msea_org_id),
+                )
+
+
+replica = Replica(REPLICA_PATH) if REPLICA_PATH else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the local SQLite replica")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync = sub.add_parser("sync", help="Run one sync pass")
+    sync.add_argument("--path", default=REPLICA_PATH or "learners_replica.db")
+    args = parser.parse_args()
+    print(Replica(args.path).sync_once())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Memory-mapped columnar snapshot of the policy catalogue.
+
+`build` exports institutions, acceptances and exams into one compact file
+(fixed-width columns plus a string table, see services/columnar.py) and
+atomically swaps it into place. Workers map the file read-only, so startup
+needs no database round trip and every worker shares the same page cache.
+`SnapshotManager.current()` notices a swapped file and remaps it without a
+restart.
+
+Usage (from backend/learners):
+    python -m services.snapshot build [--out PATH]
+    python -m services.snapshot info [PATH]
+"""
+import argparse
+import bisect
+import mmap
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.columnar import ColumnarReader, ColumnarWriter
+
+DEFAULT_PATH = os.getenv("CATALOGUE_SNAPSHOT_PATH", "catalogue.snap")
+
+# Sentinel stored in integer columns for NULL
+NULL_INT = -1
+
+FLAG_FAILED_COURSES = 1
+FLAG_ENROLLED_STUDENTS = 2
+
+YEARS_REGEX = re.compile(r"(\d+)")
+
+
+def _epoch(ts: Optional[str]) -> int:
+    if not ts:
+        return 0
+    try:
+        dt = datetime.fromisoformat(str(ts).replace(" ", "T").replace("Z", "+00:00"))
+    except ValueError:
+        return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _iso(epoch: int) -> Optional[str]:
+    if not epoch:
+        return None
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _int(value, default: int = NULL_INT) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def validity_years(value) -> int:
+    """score_validity is free text such as '5 years'."""
+    if value is None:
+        return NULL_INT
+    match = YEARS_REGEX.search(str(value))
+    return int(match.group(1)) if match else NULL_INT
+
+
+def build_bytes(catalogue: Dict[str, List[Dict]], generation: Optional[int] = None) -> bytes:
+    """Encode a catalogue (as returned by services.catalogue.fetch_catalogue)."""
+    writer = ColumnarWriter(generation or time.time_ns())
+    s = writer.strings
+
+    institutions = sorted(catalogue["institutions"], key=lambda i: str(i.get("msea_org_id")))
+    inst_index = {inst["msea_org_id"]: i for i, inst in enumerate(institutions)}
+
+    writer.add("inst_id", "I", (s.intern(i.get("id")) for i in institutions))
+    writer.add("inst_org", "I", (s.intern(i.get("msea_org_id")) for i in institutions))
+    writer.add("inst_name", "I", (s.intern(i.get("name")) for i in institutions))
+    writer.add("inst_city", "I", (s.intern(i.get("city")) for i in institutions))
+    writer.add("inst_state", "I", (s.intern(i.get("state")) for i in institutions))
+    writer.add("inst_zip", "I", (s.intern(i.get("zip")) for i in institutions))
+    writer.add("inst_max_credits", "i", (_int(i.get("max_credits")) for i in institutions))
+    writer.add("inst_fee", "i", (_int(i.get("transcription_fee")) for i in institutions))
+    writer.add("inst_enrollment", "i", (_int(i.get("enrollment")) for i in institutions))
+    writer.add("inst_validity", "i", (validity_years(i.get("score_validity")) for i in institutions))
+    writer.add(
+        "inst_flags",
+        "B",
+        (
+            (FLAG_FAILED_COURSES if i.get("can_use_for_failed_courses") else 0)
+            | (FLAG_ENROLLED_STUDENTS if i.get("can_enrolled_students_use_clep") else 0)
+            for i in institutions
+        ),
+    )
+    writer.add("inst_updated", "q", (_epoch(i.get("last_updated")) for i in institutions))
+
+    # Acceptances are grouped by exam and sorted by cut score so a learner's
+    # matches for one exam are a prefix found by binary search
+    acceptances = sorted(
+        (a for a in catalogue["acceptances"] if a.get("msea_org_id") in inst_index),
+        key=lambda a: (a["eid"], a["cut_score"]),
+    )
+    max_eid = max((a["eid"] for a in acceptances), default=0)
+    offsets = [0] * (max_eid + 2)
+    for a in acceptances:
+        offsets[a["eid"] + 1] += 1
+    for eid in range(1, max_eid + 2):
+        offsets[eid] += offsets[eid - 1]
+
+    writer.add("exam_offsets", "I", offsets)
+    writer.add("acc_inst", "I", (inst_index[a["msea_org_id"]] for a in acceptances))
+    writer.add("acc_eid", "H", (a["eid"] for a in acceptances))
+    writer.add("acc_cut", "B", (a["cut_score"] for a in acceptances))
+    writer.add("acc_credits", "B", (_int(a.get("credits"), 0) for a in acceptances))
+    writer.add("acc_course", "I", (s.intern(a.get("related_course")) for a in acceptances))
+    writer.add("acc_updated", "q", (_epoch(a.get("last_updated")) for a in acceptances))
+
+    exams = sorted(catalogue["exams"], key=lambda e: e["eid"])
+    writer.add("exam_eid", "H", (e["eid"] for e in exams))
+    writer.add("exam_name", "I", (s.intern(e.get("name")) for e in exams))
+
+    return writer.to_bytes()
+
+
+def write_snapshot(
+    catalogue: Dict[str, List[Dict]], path: str = DEFAULT_PATH, generation: Optional[int] = None
+) -> int:
+    """Write a snapshot next to `path` and atomically rename it into place."""
+    data = build_bytes(catalogue, generation)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(data)
+
+
+class Snapshot:
+    """Read-only view over a mapped snapshot file."""
+
+    def __init__(self, buffer, mapping: Optional[mmap.mmap] = None):
+        self._mapping = mapping
+        self.reader = ColumnarReader(buffer)
+        self.generation = self.reader.generation
+        r = self.reader
+        self.exam_offsets = r["exam_offsets"]
+        self.acc_inst = r["acc_inst"]
+        self.acc_eid = r["acc_eid"]
+        self.acc_cut = r["acc_cut"]
+        self.acc_credits = r["acc_credits"]
+        self.acc_updated = r["acc_updated"]
+        self._exam_names = {
+            eid: r.string(name) for eid, name in zip(r["exam_eid"], r["exam_name"])
+        }
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapping, mapping)
+
+    @property
+    def institution_count(self) -> int:
+        return len(self.reader["inst_org"])
+
+    @property
+    def acceptance_count(self) -> int:
+        return len(self.acc_eid)
+
+    def exam_name(self, eid: int) -> Optional[str]:
+        return self._exam_names.get(eid)
+
+    def exam_range(self, eid: int) -> Tuple[int, int]:
+        """Acceptance index range for an exam, ordered by cut score."""
+        if eid < 0 or eid + 1 >= len(self.exam_offsets):
+            return 0, 0
+        return self.exam_offsets[eid], self.exam_offsets[eid + 1]
+
+    def matches(self, score_map: Dict[int, int]) -> Iterator[int]:
+        """Acceptance indices whose cut score the learner's score meets."""
+        for eid, score in score_map.items():
+            lo, hi = self.exam_range(eid)
+            end = bisect.bisect_right(self.acc_cut, score, lo, hi)
+            yield from range(lo, end)
+
+    def institution(self, i: int) -> Dict:
+        r = self.reader
+        flags = r["inst_flags"][i]
+
+        def nullable(column: str) -> Optional[int]:
+            value = r[column][i]
+            return None if value == NULL_INT else value
+
+        return {
+            "id": r.string(r["inst_id"][i]),
+            "msea_org_id": r.string(r["inst_org"][i]),
+            "name": r.string(r["inst_name"][i]),
+            "city": r.string(r["inst_city"][i]),
+            "state": r.string(r["inst_state"][i]),
+            "zip": r.string(r["inst_zip"][i]),
+            "max_credits": nullable("inst_max_credits"),
+            "transcription_fee": nullable("inst_fee"),
+            "enrollment": nullable("inst_enrollment"),
+            "score_validity_years": nullable("inst_validity"),
+            "can_use_for_failed_courses": bool(flags & FLAG_FAILED_COURSES),
+            "can_enrolled_students_use_clep": bool(flags & FLAG_ENROLLED_STUDENTS),
+            "last_updated": _iso(r["inst_updated"][i]),
+        }
+
+    def acceptance(self, i: int) -> Dict:
+        r = self.reader
+        return {
+            "institution": self.acc_inst[i],
+            "eid": self.acc_eid[i],
+            "cut_score": self.acc_cut[i],
+            "credits": self.acc_credits[i],
+            "related_course": r.string(r["acc_course"][i]),
+            "last_updated": _iso(self.acc_updated[i]),
+        }
+
+
+class SnapshotManager:
+    """Hands out the current snapshot, remapping it when the file is swapped."""
+
+    def __init__(self, path: str = DEFAULT_PATH, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._identity: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+
+    def current(self) -> Optional[Snapshot]:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return self._snapshot
+            identity = (st.st_ino, st.st_mtime_ns)
+            if identity != self._identity:
+                # Requests still holding the old Snapshot keep its mapping alive
+                self._snapshot = Snapshot.open(self.path)
+                self._identity = identity
+            return self._snapshot
+
+    def reload(self) -> Optional[Snapshot]:
+        """Check the file now rather than after `check_interval`."""
+        self._checked_at = 0.0
+        return self.current()
+
+
+snapshots = SnapshotManager()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the catalogue snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Export the catalogue from Supabase")
+    build.add_argument("--out", default=DEFAULT_PATH)
+    info = sub.add_parser("info", help="Print snapshot statistics")
+    info.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from services.catalogue import fetch_catalogue
+
+        size = write_snapshot(fetch_catalogue(), args.out)
+        print(f"Wrote {size} bytes to {args.out}")
+    else:
+        snap = Snapshot.open(args.path)
+        print(f"generation:   {snap.generation}")
+        print(f"institutions: {snap.institution_count}")
+        print(f"acceptances:  {snap.acceptance_count}")
+        print(f"exams:        {len(snap._exam_names)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+What-if score simulator.
+
+For every exam, `cumulative[eid, s - 20]` counts the institutions whose cut
+score for that exam is at most `s`, over the whole 20-80 CLEP domain. Raising a
+score from `c` to `s` brings in `cumulative[s] - cumulative[c]` institutions,
+minus those the learner already matches through another exam. That correction
+is the same histogram taken over only the learner's matched institutions.
+The full exams x scores table is then a few array operations.
+
+Near misses come from the per-exam acceptance lists, which are sorted by cut
+score: the policies within `window` points above the learner's score are one
+bisect range.
+
+The index is built from one catalogue read. A policy write publishes
+`exam:<id>` tags; only those exams' acceptances are re-read (once, shared with
+the leaderboard, see services/exam_feed.py), and the histograms are
+recomputed from memory on the next query.
+"""
+import bisect
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.catalogue import ACCEPTANCE_COLUMNS, fetch_all
+from services.exam_feed import ExamIndexManager
+
+SCORE_MIN = 20
+SCORE_MAX = 80
+SCORES = SCORE_MAX - SCORE_MIN + 1
+
+WHATIF_INDEX_TTL = float(os.getenv("WHATIF_INDEX_TTL", "86400"))
+NEAR_MISS_WINDOW = 5
+
+
+class WhatIfIndex:
+    def __init__(self, acceptances: List[Dict], institutions: List[Dict], exams: List[Dict]):
+        self.institutions = {
+            i["msea_org_id"]: {k: i.get(k) for k in ("msea_org_id", "name", "city", "state")}
+            for i in institutions
+        }
+        self.exam_names = {e["eid"]: e.get("name") for e in exams}
+        # msea_org_id -> {eid: (cut, credits)}
+        self.by_institution: Dict[str, Dict[int, Tuple[int, int]]] = defaultdict(dict)
+        # eid -> (cuts ascending, org ids, credits) in the same order
+        self.by_exam: Dict[int, Tuple[List[int], List[str], List[int]]] = {}
+        self._flat: Optional[Tuple[np.ndarray, ...]] = None
+
+        grouped = defaultdict(list)
+        for acc in acceptances:
+            grouped[acc["eid"]].append(acc)
+        for eid, rows in grouped.items():
+            self._set_exam(eid, rows)
+
+    def __len__(self) -> int:
+        return len(self.by_institution)
+
+    def _set_exam(self, eid: int, rows: List[Dict]) -> None:
+        """(Re)index one exam's acceptances."""
+        previous = self.by_exam.pop(eid, None)
+        if previous is not None:
+            for org_id in previous[1]:
+                cuts = self.by_institution.get(org_id)
+                if cuts is not None:
+                    cuts.pop(eid, None)
+                    if not cuts:
+                        del self.by_institution[org_id]
+        self._flat = None
+
+        # An institution's lowest cut for the exam is the one that counts
+        best: Dict[str, Tuple[int, int]] = {}
+        for acc in rows:
+            if acc.get("cut_score") is None:
+                continue
+            entry = (int(acc["cut_score"]), int(acc.get("credits") or 0))
+            org_id = acc["msea_org_id"]
+            if org_id not in best or entry[0] < best[org_id][0]:
+                best[org_id] = entry
+        if not best:
+            return
+
+        ordered = sorted((cut, org_id, credits) for org_id, (cut, credits) in best.items())
+        self.by_exam[eid] = (
+            [cut for cut, _, _ in ordered],
+            [org_id for _, org_id, _ in ordered],
+            [credits for _, _, credits in ordered],
+        )
+        for cut, org_id, credits in ordered:
+            self.by_institution[org_id][eid] = (cut, credits)
+
+    def _arrays(self) -> Tuple[np.ndarray, ...]:
+        """
+        Flat per-acceptance columns (institution row, eid, cut), the
+        institution -> row map, and cumulative[eid, s - 20], rebuilt from
+        `by_exam` after it changes.
+        """
+        if self._flat is None:
+            org_rows = {org_id: i for i, org_id in enumerate(self.by_institution)}
+            eids, orgs, cuts = [], [], []
+            for eid, (exam_cuts, org_ids, _) in self.by_exam.items():
+                eids.extend([eid] * len(exam_cuts))
+                orgs.extend(org_rows[o] for o in org_ids)
+                cuts.extend(exam_cuts)
+            acc_eid = np.asarray(eids, dtype=np.int64)
+            acc_org = np.asarray(orgs, dtype=np.int64)
+            acc_cut = np.asarray(cuts, dtype=np.int64)
+            exam_slots = max(self.by_exam, default=0) + 1
+            cells = acc_eid * SCORES + np.clip(acc_cut, SCORE_MIN, SCORE_MAX) - SCORE_MIN
+            histogram = np.bincount(cells, minlength=exam_slots * SCORES).reshape(exam_slots, SCORES)
+            self._flat = (acc_org, acc_eid, acc_cut, org_rows, np.cumsum(histogram, axis=1))
+        return self._flat
+
+    def matched(self, score_map: Dict[int, int]) -> Set[str]:
+        """Institutions accepting at least one of the learner's scores."""
+        matched = set()
+        for eid, score in score_map.items():
+            exam = self.by_exam.get(eid)
+            if exam is not None:
+                matched.update(exam[1][:bisect.bisect_right(exam[0], score)])
+        return matched
+
+    def sensitivity(self, score_map: Dict[int, int]) -> Dict[int, np.ndarray]:
+        """
+        eid -> additional institutions at each score 20..80 (index s - 20),
+        zero at and below the learner's current score.
+        """
+        acc_org, acc_eid, acc_cut, org_rows, cumulative = self._arrays()
+        exam_slots = len(cumulative)
+
+        current = np.full(exam_slots, SCORE_MIN - 1, dtype=np.int64)
+        for eid, score in score_map.items():
+            if 0 <= eid < exam_slots:
+                current[eid] = score
+        is_matched = np.zeros(len(org_rows), dtype=bool)
+        is_matched[[org_rows[o] for o in self.matched(score_map)]] = True
+
+        # Cuts, per exam, of institutions already matched through some other
+        # exam: raising this exam gains nothing from them
+        already = is_matched[acc_org] & (acc_cut > current[acc_eid])
+        cells = acc_eid[already] * SCORES + np.clip(acc_cut[already], SCORE_MIN, SCORE_MAX) - SCORE_MIN
+        gained = cumulative - np.cumsum(
+            np.bincount(cells, minlength=exam_slots * SCORES).reshape(exam_slots, SCORES), axis=1
+        )
+
+        # Only scores above the current one add anything
+        slot = np.clip(current, SCORE_MIN, SCORE_MAX) - SCORE_MIN
+        taken = current >= SCORE_MIN
+        gained[taken] -= gained[taken, slot[taken]][:, None]
+        gained[(np.arange(SCORES)[None, :] <= slot[:, None]) & taken[:, None]] = 0
+        return {eid: gained[eid] for eid in self.by_exam}
+
+    def near_misses(self, score_map: Dict[int, int], window: int = NEAR_MISS_WINDOW) -> List[Dict]:
+        """
+        Institutions the learner misses by at most `window` points on some
+        exam, with the misses per institution, closest first.
+        """
+        matched = self.matched(score_map)
+        misses = defaultdict(list)
+        for eid, score in score_map.items():
+            exam = self.by_exam.get(eid)
+            if exam is None:
+                continue
+            cuts, org_ids, credits = exam
+            lo = bisect.bisect_right(cuts, score)
+            hi = bisect.bisect_right(cuts, score + window, lo)
+            for i in range(lo, hi):
+                misses[org_ids[i]].append({
+                    "eid": eid,
+                    "exam_name": self.exam_names.get(eid),
+                    "score": score,
+                    "cut_score": cuts[i],
+                    "points_needed": cuts[i] - score,
+                    "credits": credits[i],
+                })
+
+        result = []
+        for org_id, exam_misses in misses.items():
+            exam_misses.sort(key=lambda m: m["points_needed"])
+            result.append({
+                **(self.institutions.get(org_id) or {"msea_org_id": org_id}),
+                "already_matched": org_id in matched,
+                "misses": exam_misses,
+            })
+        result.sort(key=lambda r: (r["misses"][0]["points_needed"], r["already_matched"], r.get("name") or ""))
+        return result
+
+
+class WhatIfIndexManager(ExamIndexManager[WhatIfIndex]):
+    """Builds the index once and re-indexes single exams after policy writes."""
+
+    name = "what-if index"
+
+    def __init__(self, ttl: float = WHATIF_INDEX_TTL):
+        super().__init__(ttl)
+
+    def build(self) -> WhatIfIndex:
+        return WhatIfIndex(
+            fetch_all("acceptance", ACCEPTANCE_COLUMNS),
+            fetch_all("institutions", "msea_org_id, name, city, state"),
+            fetch_all("exams", "eid, name"),
+        )
+
+    def apply(self, index: WhatIfIndex, changes: Dict[int, List[Dict]]) -> None:
+        for eid, rows in changes.items():
+            index._set_exam(eid, rows)
+
+
+whatif_index = WhatIfIndexManager()
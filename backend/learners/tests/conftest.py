@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Same import roots as app.py: learners modules plus the backend-wide `shared`
+LEARNERS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.abspath(os.path.join(LEARNERS_DIR, "..")))
+sys.path.insert(0, LEARNERS_DIR)
@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("msgpack")
+
+from models import InstitutionHit, LearnerExam
+from services import match_cache
+from shared.cache import InMemorySharedTier, LRUTier, TwoTierCache
+
+
+def _hit(eid, cut, score):
+    return InstitutionHit(
+        msea_org_id="org-1",
+        name="State University",
+        city="Albany",
+        state="NY",
+        zip="12222",
+        eid=eid,
+        exam_name="College Algebra",
+        required_cut=cut,
+        learner_score=score,
+        credits=3,
+        last_updated="2026-01-01T00:00:00",
+    )
+
+
+def test_get_matches_round_trips_through_shared_tier(monkeypatch):
+    shared = InMemorySharedTier()
+    writer = TwoTierCache(LRUTier(), shared, sync_interval=0)
+    monkeypatch.setattr(match_cache, "cache", writer)
+
+    calls = []
+
+    def compute(exams, zipcode, state):
+        calls.append(exams)
+        return [_hit(e.eid, 50, e.score) for e in exams]
+
+    first = match_cache.get_matches(
+        [LearnerExam(eid=7, score=62)], None, None, "db", lambda eid: [50, 60], compute
+    )
+    assert first == [_hit(7, 50, 62)]
+
+    # A second process has an empty local tier and reads the shared entry
+    reader = TwoTierCache(LRUTier(), shared, sync_interval=0)
+    monkeypatch.setattr(match_cache, "cache", reader)
+    second = match_cache.get_matches(
+        [LearnerExam(eid=7, score=65)], None, None, "db", lambda eid: [50, 60], compute
+    )
+
+    assert len(calls) == 1
+    assert second == [_hit(7, 50, 65)]
+    assert isinstance(second[0], InstitutionHit)
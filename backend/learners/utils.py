@@ -1,3 +1,5 @@
+import base64
+import json
 import re
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional, Any, List
@@ -111,3 +113,41 @@ def filter_by_zip_or_state(
             return False
 
     return True
+
+
+def parse_scores_param(raw: Optional[str]) -> Dict[int, int]:
+    """
+    Parse a `scores` query parameter of the form "eid:score,eid:score".
+    Raises ValueError on malformed pairs or out-of-range scores.
+    """
+    scores: Dict[int, int] = {}
+    if not raw:
+        return scores
+
+    for pair in raw.split(","):
+        eid, sep, score = pair.strip().partition(":")
+        if not sep or not eid.strip().isdigit() or not is_valid_score(score.strip()):
+            raise ValueError(f"Invalid score '{pair.strip()}', expected eid:score with score 20-80")
+        scores[int(eid)] = int(score)
+
+    return scores
+
+
+def encode_cursor(key: List[Any]) -> str:
+    """Opaque keyset cursor for the sort key of the last item on a page."""
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list):
+        raise ValueError("Invalid cursor")
+    return key
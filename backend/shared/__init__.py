@@ -0,0 +1 @@
+# Shared helpers used by both the institutions and learners services
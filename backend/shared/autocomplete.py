@@ -0,0 +1,385 @@
+"""
+Typo-tolerant institution name autocomplete, shared by both services.
+
+`AutocompleteIndex` keeps three structures over normalized text:
+
+- a prefix trie over name and city/state tokens, each node holding the ids of
+  institutions with a token under it (split by field so name matches rank
+  first);
+- the sorted list of full normalized names, so "name starts with the query"
+  is a bisect range;
+- a trigram index over the token vocabulary, used only when prefix matching
+  finds fewer than `limit` results, to map misspelled tokens to close ones.
+
+Every structure supports `upsert`/`remove` of one institution.
+`InstitutionAutocomplete` loads the catalogue once and then follows the
+`change_log` feed (institutes migration 002) to apply inserts, renames and
+deletes incrementally. The feed is paged by `seq`, which is assigned in
+commit order, and `change_log` is readable by the service role only, so the
+client must use the service role key.
+"""
+import bisect
+import gc
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Dice similarity a misspelled token needs to count as a match
+FUZZY_MIN_SIMILARITY = 0.45
+FUZZY_TOKENS_PER_TERM = 5
+# Upper bound on institutions scored by the typo-tolerant pass
+FUZZY_CANDIDATES = 1000
+PAGE_SIZE = 1000
+
+
+def normalize(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Node:
+    __slots__ = ("children", "name_ids", "loc_ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.name_ids: Set[Any] = set()
+        self.loc_ids: Set[Any] = set()
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._root = _Node()
+        self._records: Dict[Any, Dict] = {}
+        self._tokens: Dict[Any, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+        self._names: List[Tuple[str, Any]] = []
+        self._sort_key: Dict[Any, Tuple[int, str]] = {}
+        self._vocab: Counter = Counter()
+        self._trigram_tokens: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def load(self, items: Iterable[Tuple[Any, Dict]]) -> None:
+        """Add many institutions, sorting the name list once at the end."""
+        for key, record in items:
+            self._add(key, record, sorted_insert=False)
+        self._names.sort()
+
+    def upsert(self, key: Any, record: Dict) -> None:
+        if key in self._records:
+            self.remove(key)
+        self._add(key, record)
+
+    def _add(self, key: Any, record: Dict, sorted_insert: bool = True) -> None:
+        name = normalize(record.get("name"))
+        name_tokens = tuple(dict.fromkeys(name.split()))
+        loc_tokens = tuple(
+            dict.fromkeys(normalize(f"{record.get('city') or ''} {record.get('state') or ''}").split())
+        )
+        self._records[key] = record
+        self._tokens[key] = (name_tokens, loc_tokens)
+        self._sort_key[key] = (len(name), name)
+        if sorted_insert:
+            bisect.insort(self._names, (name, key))
+        else:
+            self._names.append((name, key))
+        for token in name_tokens:
+            self._add_token(token, key, "name_ids")
+        for token in loc_tokens:
+            self._add_token(token, key, "loc_ids")
+
+    def remove(self, key: Any) -> None:
+        if key not in self._records:
+            return
+        name_tokens, loc_tokens = self._tokens.pop(key)
+        name = self._sort_key.pop(key)[1]
+        del self._records[key]
+        i = bisect.bisect_left(self._names, (name, key))
+        if i < len(self._names) and self._names[i] == (name, key):
+            del self._names[i]
+        for token in name_tokens:
+            self._remove_token(token, key, "name_ids")
+        for token in loc_tokens:
+            self._remove_token(token, key, "loc_ids")
+
+    def _add_token(self, token: str, key: Any, field: str) -> None:
+        node = self._root
+        for ch in token:
+            child = node.children.get(ch)
+            if child is None:
+                child = node.children[ch] = _Node()
+            node = child
+            getattr(node, field).add(key)
+        if self._vocab[token] == 0:
+            for gram in _trigrams(token):
+                self._trigram_tokens.setdefault(gram, set()).add(token)
+        self._vocab[token] += 1
+
+    def _remove_token(self, token: str, key: Any, field: str) -> None:
+        path = []
+        node = self._root
+        for ch in token:
+            path.append((node, ch))
+            node = node.children[ch]
+            getattr(node, field).discard(key)
+        # Prune nodes no institution passes through any more
+        for parent, ch in reversed(path):
+            child = parent.children[ch]
+            if child.children or child.name_ids or child.loc_ids:
+                break
+            del parent.children[ch]
+
+        self._vocab[token] -= 1
+        if self._vocab[token] <= 0:
+            del self._vocab[token]
+            for gram in _trigrams(token):
+                tokens = self._trigram_tokens.get(gram)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._trigram_tokens[gram]
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _node(self, prefix: str) -> Optional[_Node]:
+        node = self._root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def _close_tokens(self, term: str) -> List[Tuple[str, float]]:
+        """Vocabulary tokens within FUZZY_MIN_SIMILARITY of a (misspelled) term."""
+        grams = _trigrams(term)
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(self._trigram_tokens.get(gram, ()))
+        scored = []
+        for token, shared in overlap.items():
+            similarity = 2 * shared / (len(grams) + len(token) + 1)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append((token, similarity))
+        return heapq.nlargest(FUZZY_TOKENS_PER_TERM, scored, key=lambda t: t[1])
+
+    def _take(self, ranked: Iterable[Any], results: List[Dict], seen: Set[Any], limit: int) -> None:
+        for key in ranked:
+            if len(results) >= limit:
+                return
+            if key not in seen:
+                seen.add(key)
+                results.append(self._records[key])
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """Top `limit` institutions for a partial, possibly misspelled query."""
+        started = time.perf_counter()
+        phrase = normalize(query)
+        terms = phrase.split()
+        if not terms:
+            return []
+
+        results: List[Dict] = []
+        seen: Set[Any] = set()
+        by_rank = self._sort_key.__getitem__
+
+        # 1. Names starting with the whole query
+        i = bisect.bisect_left(self._names, (phrase,))
+        starts = []
+        while i < len(self._names) and self._names[i][0].startswith(phrase) and len(starts) < limit:
+            starts.append(self._names[i][1])
+            i += 1
+        self._take(sorted(starts, key=by_rank), results, seen, limit)
+
+        # 2. Every term prefixes a name token, then 3. a name or location token
+        nodes = [self._node(term) for term in terms]
+        if len(results) < limit and all(nodes):
+            name_hits = set.intersection(*(n.name_ids for n in nodes))
+            self._take(heapq.nsmallest(limit, name_hits - seen, key=by_rank), results, seen, limit)
+            if len(results) < limit:
+                any_hits = set.intersection(*(n.name_ids | n.loc_ids for n in nodes))
+                self._take(heapq.nsmallest(limit, any_hits - seen, key=by_rank), results, seen, limit)
+
+        # 4. Typo tolerance: each term also matches close vocabulary tokens,
+        # and institutions matching more (and closer) terms rank higher
+        if len(results) < limit:
+            term_sets: List[List[Tuple[Set[Any], float]]] = []
+            for term, node in zip(terms, nodes):
+                entries = []
+                if node is not None:
+                    entries += [(node.name_ids, 1.0), (node.loc_ids, 1.0)]
+                elif len(term) >= 3:
+                    for token, similarity in self._close_tokens(term):
+                        close = self._node(token)
+                        entries += [(close.name_ids, similarity), (close.loc_ids, similarity)]
+                if entries:
+                    term_sets.append(entries)
+
+            # Score candidates drawn from the rarest sets first
+            candidates: Set[Any] = set()
+            for ids, _ in sorted((e for entries in term_sets for e in entries), key=lambda e: len(e[0])):
+                room = FUZZY_CANDIDATES - len(candidates)
+                if room <= 0:
+                    break
+                # Tokens this common barely narrow the match; a sample will do
+                candidates.update(ids if len(ids) <= room else itertools.islice(ids, room))
+            candidates -= seen
+
+            # Each term adds its closest matching token's similarity
+            scored = dict.fromkeys(candidates, 0.0)
+            for entries in term_sets:
+                best: Dict[Any, float] = {}
+                for ids, similarity in sorted(entries, key=lambda e: -e[1]):
+                    for key in candidates.intersection(ids):
+                        best.setdefault(key, similarity)
+                for key, similarity in best.items():
+                    scored[key] += similarity
+            fuzzy = heapq.nsmallest(limit, scored, key=lambda k: (-scored[k], self._sort_key[k]))
+            self._take(fuzzy, results, seen, limit)
+            metrics.incr("autocomplete.fuzzy")
+
+        metrics.observe("autocomplete.search_ms", (time.perf_counter() - started) * 1000)
+        return results
+
+
+class InstitutionAutocomplete:
+    """Loads institutions into an index and follows change_log for updates."""
+
+    def __init__(
+        self,
+        client: Any,
+        columns: str = "id, name, city, state",
+        refresh_interval: float = 30.0,
+        full_reload_interval: float = 3600.0,
+    ):
+        self.client = client
+        self.columns = columns
+        self.fields = [c.strip() for c in columns.split(",")]
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._lock = threading.Lock()
+        self._index: Optional[AutocompleteIndex] = None
+        self._cursor: Optional[int] = None
+        self._loaded_at = 0.0
+        self._polled_at = 0.0
+
+    def _latest_change(self) -> Optional[int]:
+        # Rows still being committed have no seq yet
+        rows = (
+            self.client.table("change_log")
+            .select("seq")
+            .gt("seq", 0)
+            .order("seq", desc=True)
+            .limit(1)
+            .execute()
+            .data
+        )
+        return rows[0]["seq"] if rows else 0
+
+    def _load(self) -> None:
+        try:
+            # Take the cursor first so changes made during the load are replayed
+            cursor = self._latest_change()
+        except Exception as e:
+            logger.warning(f"change_log unavailable, falling back to periodic reloads: {e}")
+            cursor = None
+
+        rows = []
+        start = 0
+        while True:
+            page = (
+                self.client.table("institutions")
+                .select(self.columns)
+                .range(start, start + PAGE_SIZE - 1)
+                .execute()
+                .data
+            )
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+
+        index = AutocompleteIndex()
+        # The trie is hundreds of thousands of long-lived nodes; collector
+        # passes during the build would only rescan them
+        gc.disable()
+        try:
+            index.load((row["id"], row) for row in rows)
+        finally:
+            gc.enable()
+
+        self._index, self._cursor = index, cursor
+        self._loaded_at = self._polled_at = time.monotonic()
+        logger.info(f"Loaded autocomplete index over {len(index)} institutions")
+
+    def _poll(self) -> None:
+        self._polled_at = time.monotonic()
+        while True:
+            changes = (
+                self.client.table("change_log")
+                .select("seq, op, row_id, row")
+                .eq("table_name", "institutions")
+                .gt("seq", self._cursor)
+                .order("seq")
+                .limit(PAGE_SIZE)
+                .execute()
+                .data
+            )
+            for change in changes:
+                if change["op"] == "DELETE" or not change.get("row"):
+                    self._index.remove(change["row_id"])
+                else:
+                    row = change["row"]
+                    self._index.upsert(row["id"], {f: row.get(f) for f in self.fields})
+                self._cursor = change["seq"]
+            metrics.incr("autocomplete.changes_applied", len(changes))
+            if len(changes) < PAGE_SIZE:
+                return
+
+    def current(self) -> AutocompleteIndex:
+        now = time.monotonic()
+        if self._index is not None and now - self._polled_at < self.refresh_interval:
+            return self._index
+        with self._lock:
+            if self._index is None or (
+                self._cursor is None and now - self._loaded_at > self.full_reload_interval
+            ):
+                self._load()
+            elif now - self._polled_at >= self.refresh_interval:
+                if self._cursor is None:
+                    self._polled_at = now
+                else:
+                    try:
+                        self._poll()
+                    except Exception as e:
+                        logger.error(f"Autocomplete change poll failed: {e}")
+            return self._index
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        index = self.current()
+        # Polls mutate the index in place under the same lock
+        with self._lock:
+            return index.search(query, limit)
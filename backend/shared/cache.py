@@ -0,0 +1,556 @@
+"""
+Two-tier cache shared by the institutions and learners services.
+
+Tier 1 is an in-process LRU. Tier 2 is optional and lives behind a small
+Redis-compatible interface so every worker of both services sees the same
+entries; `InMemorySharedTier` stands in for Redis in tests and single
+process development.
+
+Entries carry tags such as `institution:<id>` and `exam:<id>`. Writers call
+`invalidate_tags()`, which drops matching entries from the shared tier and
+appends the tags to an invalidation stream. Every worker polls that stream
+at least every `sync_interval` seconds and evicts the same tags locally, so
+no worker serves an invalidated entry for longer than that bound.
+
+Every publish also bumps a per-tag generation counter. `get_or_load` notes the
+generations of its tags before loading and stores the result only if none of
+them moved. Otherwise a load that started before a write and finished after
+its invalidation would put the stale value back.
+
+Shared-tier values are MessagePack. Plain data round-trips as is, and
+dataclasses only if registered with `@shared_type`, so reading the shared tier
+never runs arbitrary code (unlike pickle).
+"""
+import dataclasses
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tag generation counters outlive any entry they guard
+GENERATION_TTL = 7 * 86400
+
+CATALOGUE_TAG = "catalogue"
+EXAMS_TAG = "exams"
+# Institution rows changed wholesale (an import); single rows publish
+# `institution:<id>` instead
+INSTITUTIONS_TAG = "institutions"
+# Published by the learners service when learner_exams scores change, along
+# with `learner_scores:<learner_id>` for each learner whose scores changed
+LEARNER_SCORES_TAG = "learner_scores"
+
+
+def institution_tag(institution_id: Any) -> str:
+    return f"institution:{institution_id}"
+
+
+def exam_tag(exam_id: Any) -> str:
+    return f"exam:{exam_id}"
+
+
+def learner_scores_tag(learner_id: Any) -> str:
+    return f"{LEARNER_SCORES_TAG}:{learner_id}"
+
+
+def policy_tags(institution_id: Any, *exam_ids: Any) -> List[str]:
+    """Tags to publish after an acceptance write."""
+    tags = [CATALOGUE_TAG, institution_tag(institution_id)]
+    tags.extend(exam_tag(e) for e in exam_ids if e is not None)
+    return tags
+
+
+# ----------------------------------------------------------------------
+# Shared-tier encoding
+# ----------------------------------------------------------------------
+
+_SHARED_EXT = 1
+_shared_types: Dict[str, type] = {}
+
+
+def shared_type(cls):
+    """Allow a dataclass to be stored in the shared tier."""
+    _shared_types[cls.__qualname__] = cls
+    return cls
+
+
+def _ext_default(obj: Any):
+    import msgpack
+
+    name = type(obj).__qualname__
+    if dataclasses.is_dataclass(obj) and _shared_types.get(name) is type(obj):
+        fields = [getattr(obj, f.name) for f in dataclasses.fields(obj)]
+        return msgpack.ExtType(_SHARED_EXT, pack([name, fields]))
+    raise TypeError(f"{name} is not registered with @shared_type")
+
+
+def _ext_hook(code: int, data: bytes):
+    import msgpack
+
+    if code != _SHARED_EXT:
+        return msgpack.ExtType(code, data)
+    name, fields = unpack(data)
+    cls = _shared_types.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown shared type {name}")
+    return cls(*fields)
+
+
+def pack(value: Any) -> bytes:
+    import msgpack  # optional dependency, only needed with a shared tier
+
+    return msgpack.packb(value, default=_ext_default, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+class LRUTier:
+    """Bounded in-process tier with per-entry expiry and tags."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Any, float, frozenset]]" = OrderedDict()
+        self._by_tag: Dict[str, Set[str]] = {}
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()) -> None:
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        evicted = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._by_tag.get(tag, ())):
+                    self._remove(key)
+                    evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def _remove(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+
+class SharedTier:
+    """Interface of the cross-process tier (a subset of what Redis offers)."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Iterable[str],
+        generations: Optional[List[int]] = None,
+    ) -> bool:
+        """Store `value`; with `generations`, only if every tag still has
+        that generation. Returns whether it was stored."""
+        raise NotImplementedError
+
+    def generations(self, tags: List[str]) -> List[int]:
+        """Current generation of each tag (0 if never published)."""
+        raise NotImplementedError
+
+    def publish(self, tags: List[str]) -> None:
+        """Bump the tags' generations, delete entries carrying any of them
+        and append them to the stream."""
+        raise NotImplementedError
+
+    def poll(self, cursor: Optional[str]) -> Tuple[Optional[str], List[str], bool]:
+        """Read invalidations after `cursor`.
+
+        Returns:
+            Tuple of (new cursor, tags, reset) where reset means the cursor
+            fell off the retained stream and the caller must drop everything.
+        """
+        raise NotImplementedError
+
+
+class InMemorySharedTier(SharedTier):
+    """Process-local stand-in for Redis, used in tests and development."""
+
+    def __init__(self, max_stream: int = 10000):
+        self.max_stream = max_stream
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[bytes, float]] = {}
+        self._tag_keys: Dict[str, Set[str]] = {}
+        self._generations: Dict[str, int] = {}
+        self._stream: List[Tuple[int, List[str]]] = []
+        self._seq = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Iterable[str],
+        generations: Optional[List[int]] = None,
+    ) -> bool:
+        tags = list(tags)
+        with self._lock:
+            if generations is not None and [self._generations.get(t, 0) for t in tags] != generations:
+                return False
+            self._values[key] = (value, time.monotonic() + ttl)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+            return True
+
+    def generations(self, tags: List[str]) -> List[int]:
+        with self._lock:
+            return [self._generations.get(t, 0) for t in tags]
+
+    def publish(self, tags: List[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in self._tag_keys.pop(tag, ()):
+                    self._values.pop(key, None)
+            self._seq += 1
+            self._stream.append((self._seq, list(tags)))
+            del self._stream[:-self.max_stream]
+
+    def poll(self, cursor: Optional[str]) -> Tuple[Optional[str], List[str], bool]:
+        with self._lock:
+            if cursor is None:
+                return str(self._seq), [], False
+            after = int(cursor)
+            oldest = self._stream[0][0] if self._stream else self._seq + 1
+            reset = after + 1 < oldest and after < self._seq
+            tags = [t for seq, batch in self._stream if seq > after for t in batch]
+            return str(self._seq), tags, reset
+
+
+class RedisSharedTier(SharedTier):
+    """Shared tier backed by Redis (or any server speaking its protocol)."""
+
+    STREAM = "cache:invalidations"
+
+    # KEYS: value key, then n generation keys, then n tag-set keys
+    # ARGV: value, ttl in ms, n, check (0/1), then n expected generations
+    # Tag sets live as long as their longest-lived member.
+    SET_SCRIPT = """
+    local n = tonumber(ARGV[3])
+    if ARGV[4] == '1' then
+        for i = 1, n do
+            if (redis.call('GET', KEYS[1 + i]) or '0') ~= ARGV[4 + i] then
+                return 0
+            end
+        end
+    end
+    local ttl = tonumber(ARGV[2])
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ttl)
+    for i = 1, n do
+        local tag = KEYS[1 + n + i]
+        redis.call('SADD', tag, KEYS[1])
+        if redis.call('PTTL', tag) < ttl then
+            redis.call('PEXPIRE', tag, ttl)
+        end
+    end
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "clep", max_stream: int = 10000):
+        import redis  # optional dependency, only needed when CACHE_REDIS_URL is set
+
+        self._redis = redis.Redis.from_url(url)
+        self._set_script = self._redis.register_script(self.SET_SCRIPT)
+        self.prefix = prefix
+        self.max_stream = max_stream
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:cache:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    def _generation(self, tag: str) -> str:
+        return f"{self.prefix}:gen:{tag}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._redis.get(self._key(key))
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Iterable[str],
+        generations: Optional[List[int]] = None,
+    ) -> bool:
+        tags = list(tags)
+        keys = [self._key(key)]
+        keys += [self._generation(t) for t in tags]
+        keys += [self._tag(t) for t in tags]
+        args = [value, max(int(ttl * 1000), 1), len(tags), 0 if generations is None else 1]
+        args += [str(g) for g in (generations or [0] * len(tags))]
+        return bool(self._set_script(keys=keys, args=args))
+
+    def generations(self, tags: List[str]) -> List[int]:
+        if not tags:
+            return []
+        values = self._redis.mget([self._generation(t) for t in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def publish(self, tags: List[str]) -> None:
+        pipe = self._redis.pipeline()
+        # Bump generations first: a conditional set that runs after this
+        # fails, and one that ran before it is in the members read below
+        for tag in tags:
+            pipe.incr(self._generation(tag))
+            pipe.expire(self._generation(tag), GENERATION_TTL)
+        for tag in tags:
+            pipe.smembers(self._tag(tag))
+        members = pipe.execute()[2 * len(tags):]
+
+        pipe = self._redis.pipeline()
+        keys = set().union(*members) if members else set()
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(*(self._tag(t) for t in tags))
+        pipe.xadd(
+            f"{self.prefix}:{self.STREAM}",
+            {"tags": "\n".join(tags)},
+            maxlen=self.max_stream,
+            approximate=True,
+        )
+        pipe.execute()
+
+    def poll(self, cursor: Optional[str]) -> Tuple[Optional[str], List[str], bool]:
+        stream = f"{self.prefix}:{self.STREAM}"
+        if cursor is None:
+            last = self._redis.xrevrange(stream, count=1)
+            return (last[0][0].decode() if last else "0-0"), [], False
+
+        reset = False
+        if cursor != "0-0" and not self._redis.xrange(stream, min=cursor, max=cursor):
+            # Our position was trimmed away; anything between it and the
+            # oldest retained entry may have been missed
+            first = self._redis.xrange(stream, count=1)
+            reset = bool(first) and _stream_id(first[0][0].decode()) > _stream_id(cursor)
+
+        entries = self._redis.xrange(stream, min=f"({cursor}", count=self.max_stream)
+        tags: List[str] = []
+        for entry_id, fields in entries:
+            cursor = entry_id.decode()
+            tags.extend(fields[b"tags"].decode().split("\n"))
+        return cursor, tags, reset
+
+
+def _stream_id(value: str) -> Tuple[int, int]:
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        local: Optional[LRUTier] = None,
+        shared: Optional[SharedTier] = None,
+        sync_interval: float = 1.0,
+    ):
+        self.local = local or LRUTier()
+        self.shared = shared
+        self.sync_interval = sync_interval
+        self._subscribers: List[Callable[[Set[str]], None]] = []
+        self._sync_lock = threading.Lock()
+        self._cursor: Optional[str] = None
+        self._last_sync = 0.0
+        self._listener: Optional[threading.Thread] = None
+        # Local invalidation counts per tag, for loads in this process
+        self._generations: Dict[str, int] = {}
+        self._resets = 0
+        if shared is not None:
+            self._cursor, _, _ = shared.poll(None)
+
+    @classmethod
+    def from_env(cls) -> "TwoTierCache":
+        local = LRUTier(int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1024")))
+        url = os.getenv("CACHE_REDIS_URL")
+        shared = RedisSharedTier(url) if url else None
+        return cls(local, shared, float(os.getenv("CACHE_SYNC_INTERVAL", "1.0")))
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        self._maybe_sync()
+        hit, value = self.local.get(key)
+        if hit:
+            metrics.incr("cache.local_hit")
+            return True, value
+        if self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                metrics.incr("cache.shared_hit")
+                try:
+                    value, expires_at, tags = unpack(raw)
+                except Exception as e:
+                    logger.error(f"Unreadable shared cache entry {key}: {e}")
+                    metrics.incr("cache.miss")
+                    return False, None
+                remaining = expires_at - time.time()
+                if remaining > 0:
+                    self.local.set(key, value, remaining, tags)
+                    return True, value
+        metrics.incr("cache.miss")
+        return False, None
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float,
+        tags: Iterable[str] = (),
+        generations: Optional[Tuple[List[int], Optional[List[int]]]] = None,
+    ) -> bool:
+        """
+        Store in both tiers. `generations` (from `generations()` before
+        loading) makes the store conditional on no tag having been
+        invalidated since. Returns whether the value was stored.
+        """
+        tags = list(tags)
+        local_gens, shared_gens = generations if generations is not None else (None, None)
+        if local_gens is not None and local_gens != self._local_generations(tags):
+            metrics.incr("cache.stale_load_dropped")
+            return False
+        if self.shared is not None:
+            payload = pack([value, time.time() + ttl, tags])
+            if not self.shared.set(key, payload, ttl, tags, shared_gens):
+                metrics.incr("cache.stale_load_dropped")
+                return False
+        self.local.set(key, value, ttl, tags)
+        return True
+
+    def _local_generations(self, tags: List[str]) -> List[int]:
+        # A stream reset counts as invalidating every tag
+        return [self._resets] + [self._generations.get(t, 0) for t in tags]
+
+    def generations(self, tags: Iterable[str]) -> Tuple[List[int], Optional[List[int]]]:
+        """Per-tag generations to pass to `set` after a load."""
+        tags = list(tags)
+        shared = self.shared.generations(tags) if self.shared is not None else None
+        return self._local_generations(tags), shared
+
+    def get_or_load(
+        self, key: str, loader: Callable[[], Any], ttl: float, tags: Iterable[str] = ()
+    ) -> Any:
+        hit, value = self.get(key)
+        if hit:
+            return value
+        tags = list(tags)
+        generations = self.generations(tags)
+        value = loader()
+        # Not stored if any tag was invalidated while loading
+        self.set(key, value, ttl, tags, generations)
+        return value
+
+    def invalidate_tags(self, *tags: str) -> None:
+        """Evict tagged entries here and, via the shared tier, in every worker."""
+        tags = [t for t in tags if t]
+        if not tags:
+            return
+        metrics.incr("cache.invalidations", len(tags))
+        if self.shared is not None:
+            try:
+                self.shared.publish(tags)
+            except Exception as e:
+                logger.error(f"Failed to publish cache invalidation {tags}: {e}")
+        self._apply(set(tags))
+
+    def subscribe(self, callback: Callable[[Set[str]], None]) -> None:
+        """Call `callback(tags)` whenever tags are invalidated locally or remotely."""
+        self._subscribers.append(callback)
+        self.start_listener()
+
+    def start_listener(self) -> None:
+        """Poll the invalidation stream in the background even when idle."""
+        if self.shared is None or self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+            self._maybe_sync()
+
+    def _maybe_sync(self) -> None:
+        if self.shared is None or time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._cursor, tags, reset = self.shared.poll(self._cursor)
+            self._last_sync = time.monotonic()
+            if reset:
+                metrics.incr("cache.resets")
+                self._resets += 1
+                self.local.clear()
+                self._notify({CATALOGUE_TAG, EXAMS_TAG, INSTITUTIONS_TAG, LEARNER_SCORES_TAG})
+            elif tags:
+                self._apply(set(tags))
+        except Exception as e:
+            logger.error(f"Cache invalidation sync failed: {e}")
+        finally:
+            self._sync_lock.release()
+
+    def _apply(self, tags: Set[str]) -> None:
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        evicted = self.local.invalidate_tags(tags)
+        metrics.incr("cache.evictions", evicted)
+        self._notify(tags)
+
+    def _notify(self, tags: Set[str]) -> None:
+        for callback in list(self._subscribers):
+            try:
+                callback(tags)
+            except Exception as e:
+                logger.error(f"Cache invalidation subscriber failed: {e}")
+
+
+cache = TwoTierCache.from_env()
@@ -0,0 +1,75 @@
+"""
+Conditional GET support.
+
+Endpoints derive a strong ETag from a cheap data version stamp (e.g. the
+newest `institutions.last_updated`) plus anything else that changes the
+representation, and answer `If-None-Match` with a 304 before touching the
+tables that back the full response.
+"""
+import hashlib
+from typing import Any, Dict, Optional
+
+from flask import Response, request
+
+from shared.metrics import metrics
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from version parts."""
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def _opaque(tag: str) -> str:
+    """Strip the weak prefix, quotes and any representation suffix.
+
+    respond_raw() appends `-<encoding>` / `-mp` so each encoded
+    representation gets its own strong validator; they all revalidate
+    against the same data version.
+    """
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag.strip('"').split("-", 1)[0]
+
+
+def matching_etag(etag: str, if_none_match: Optional[str]) -> Optional[str]:
+    """
+    The current validator to send with a 304, or None if `If-None-Match`
+    does not match (weak comparison, RFC 9110 13.1.2).
+
+    A listed tag that matches is the current version of the representation the
+    client holds (suffix included), so it is returned, as the strong tag we
+    issued. `*` names no representation, so it gets `etag` itself.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    wanted = _opaque(etag)
+    for tag in if_none_match.split(","):
+        if _opaque(tag) == wanted:
+            tag = tag.strip()
+            return tag[2:] if tag.startswith("W/") else tag
+    return None
+
+
+def not_modified(etag: str, cache_control: str) -> Optional[Response]:
+    """Return a 304 response if the client already holds this version."""
+    current = matching_etag(etag, request.headers.get("If-None-Match"))
+    if current is None:
+        metrics.incr("etag.miss")
+        return None
+
+    metrics.incr("etag.not_modified")
+    response = Response(status=304)
+    response.headers["ETag"] = current
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept")
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def validators(etag: str, cache_control: str) -> Dict[str, str]:
+    """Headers to attach to a full 200 response."""
+    return {"ETag": etag, "Cache-Control": cache_control}
@@ -0,0 +1,122 @@
+"""
+Sparse fieldsets for list endpoints.
+
+Turns a `?fields=` query parameter into a PostgREST `select` string,
+validated against a per-endpoint allow-list. Both the native PostgREST
+form and a dotted shorthand are accepted for related rows:
+
+    ?fields=id,name,institutions(name,state)
+    ?fields=id,name,institutions.name,institutions.state
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+FIELD_NAME_REGEX = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class FieldSelectionError(ValueError):
+    """Raised when a requested field is malformed or not allowed."""
+
+
+@dataclass
+class Projection:
+    """Allow-list of columns (and embeddable relations) for one table."""
+
+    columns: FrozenSet[str]
+    default: Tuple[str, ...]
+    relations: Dict[str, "Projection"] = field(default_factory=dict)
+    # Columns the endpoint itself depends on (sorting, joins); always selected
+    required: Tuple[str, ...] = ()
+
+    def select(self, raw: Optional[str] = None) -> str:
+        """Build the PostgREST select string for a `fields` parameter value."""
+        tokens = _split(raw) if raw and raw.strip() else list(self.default)
+        return _render(self, _resolve(self, tokens))
+
+    def allowed(self) -> List[str]:
+        names = sorted(self.columns)
+        names.extend(f"{rel}(...)" for rel in sorted(self.relations))
+        return names
+
+
+def _split(raw: str) -> List[str]:
+    """Split on top-level commas, keeping parenthesised groups intact."""
+    tokens: List[str] = []
+    depth = 0
+    current = []
+    for ch in raw:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth < 0:
+                raise FieldSelectionError("Unbalanced parentheses in fields")
+        if ch == "," and depth == 0:
+            tokens.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    if depth != 0:
+        raise FieldSelectionError("Unbalanced parentheses in fields")
+    tokens.append("".join(current).strip())
+    return [t for t in tokens if t]
+
+
+def _resolve(projection: Projection, tokens: List[str]) -> Dict[str, Optional[List[str]]]:
+    """Map each selected column to None and each relation to its sub-tokens."""
+    selected: Dict[str, Optional[List[str]]] = {}
+    for token in tokens:
+        name, sub = token, None
+        if "(" in token:
+            if not token.endswith(")"):
+                raise FieldSelectionError(f"Malformed field '{token}'")
+            name, _, inner = token[:-1].partition("(")
+            sub = _split(inner)
+        elif "." in token:
+            name, _, rest = token.partition(".")
+            sub = [rest]
+        name = name.strip()
+
+        if not FIELD_NAME_REGEX.match(name):
+            raise FieldSelectionError(f"Malformed field '{token}'")
+
+        if name in projection.relations:
+            existing = selected.get(name) or []
+            selected[name] = existing + (sub or list(projection.relations[name].default))
+        elif sub is None and name in projection.columns:
+            selected[name] = None
+        else:
+            raise FieldSelectionError(
+                f"Unknown field '{token}'. Allowed: {', '.join(projection.allowed())}"
+            )
+
+    for name in projection.required:
+        selected.setdefault(name, None)
+    return selected
+
+
+def _render(projection: Projection, selected: Dict[str, Optional[List[str]]]) -> str:
+    parts = []
+    for name, sub in selected.items():
+        if sub is None:
+            parts.append(name)
+        else:
+            relation = projection.relations[name]
+            parts.append(f"{name}({_render(relation, _resolve(relation, sub))})")
+    return ",".join(parts)
+
+
+# Column allow-lists for the tables both services read
+INSTITUTION_COLUMNS = frozenset({
+    "id", "org_id", "name", "city", "state", "zip", "enrollment",
+    "max_credits", "transcription_fee", "can_use_for_failed_courses",
+    "can_enrolled_students_use_clep", "score_validity", "clep_web_url",
+    "last_updated", "verified_by",
+})
+ACCEPTANCE_COLUMNS = frozenset({
+    "id", "institution_id", "exam_id", "cut_score", "credits",
+    "related_course", "updated_by_contact_id", "last_updated",
+    "likes", "dislikes", "version",
+})
+EXAM_COLUMNS = frozenset({"id", "name"})
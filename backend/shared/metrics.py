@@ -0,0 +1,58 @@
+"""
+In-process metrics registry shared by the backend services.
+Counters and timing summaries are kept per worker and exposed via /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class Metrics:
+    """Thread-safe counters and timing summaries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample (e.g. a duration in milliseconds)."""
+        with self._lock:
+            summary = self._timings.get(name)
+            if summary is None:
+                summary = {"count": 0, "total": 0.0, "max": 0.0}
+                self._timings[name] = summary
+            summary["count"] += 1
+            summary["total"] += value
+            if value > summary["max"]:
+                summary["max"] = value
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Observe the wall time of the wrapped block in milliseconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            timings = {
+                name: {
+                    "count": s["count"],
+                    "avg": s["total"] / s["count"] if s["count"] else 0.0,
+                    "max": s["max"],
+                    "total": s["total"],
+                }
+                for name, s in self._timings.items()
+            }
+            return {"counters": dict(self._counters), "timings": timings}
+
+
+metrics = Metrics()
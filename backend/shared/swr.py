@@ -0,0 +1,149 @@
+"""
+Stale-while-revalidate cache with single-flight loading.
+
+Entries younger than `soft_ttl` are served as-is. Between `soft_ttl` and
+`hard_ttl` the stale value is still served while one background thread
+refreshes it. Past `hard_ttl` (or on a cold key) callers block on a load,
+and concurrent callers for the same key wait on that one load instead of
+each hitting the database.
+
+Every key has a generation that `invalidate` bumps. A load remembers the
+generation it started at and its result is not stored if that has moved, so
+a load that began before an invalidation cannot put the old value back.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from shared.cache import shared_type
+from shared.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@shared_type
+@dataclass
+class CachedBody:
+    """A pre-serialized response body and the validator it was built with."""
+
+    body: bytes
+    mimetype: str
+    etag: str
+
+
+@dataclass
+class _Entry:
+    value: Any
+    loaded_at: float
+
+
+class _Flight:
+    """One in-progress load that other callers can wait on."""
+
+    def __init__(self, generation: Tuple[int, int]):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SWRCache:
+    def __init__(self, name: str, soft_ttl: float, hard_ttl: float, max_entries: int = 256):
+        if hard_ttl < soft_ttl:
+            raise ValueError("hard_ttl must be >= soft_ttl")
+        self.name = name
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        # Bumped by invalidate() for every key / for one key
+        self._epoch = 0
+        self._generations: Dict[Hashable, int] = {}
+
+    def _generation(self, key: Hashable) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(key, 0)
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry.loaded_at if entry else None
+
+            if entry and age < self.soft_ttl:
+                metrics.incr(f"swr.{self.name}.fresh")
+                return entry.value
+
+            if entry and age < self.hard_ttl:
+                metrics.incr(f"swr.{self.name}.stale")
+                if key not in self._flights:
+                    flight = self._flights[key] = _Flight(self._generation(key))
+                    threading.Thread(
+                        target=self._load, args=(key, loader, flight), daemon=True
+                    ).start()
+                return entry.value
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(self._generation(key))
+
+        if leader:
+            metrics.incr(f"swr.{self.name}.miss")
+            self._load(key, loader, flight)
+        else:
+            metrics.incr(f"swr.{self.name}.coalesced")
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], flight: _Flight) -> None:
+        try:
+            start = time.perf_counter()
+            value = loader()
+            metrics.observe(f"swr.{self.name}.load_ms", (time.perf_counter() - start) * 1000)
+            with self._lock:
+                if flight.generation == self._generation(key):
+                    self._entries[key] = _Entry(value, time.monotonic())
+                    self._evict()
+                else:
+                    # Invalidated mid-load; the value may predate the write
+                    metrics.incr(f"swr.{self.name}.discarded")
+            flight.value = value
+        except Exception as e:
+            # Background refreshes keep serving the stale value; blocked callers see the error
+            logger.error(f"{self.name} cache load failed for {key!r}: {e}")
+            metrics.incr(f"swr.{self.name}.load_errors")
+            flight.error = e
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def _evict(self) -> None:
+        """Drop the oldest entries beyond max_entries (caller holds the lock)."""
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self._entries, key=lambda k: self._entries[k].loaded_at)
+            for key in oldest[:overflow]:
+                del self._entries[key]
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Force the next read of `key` (or of every key) to load synchronously."""
+        with self._lock:
+            if key is None:
+                self._epoch += 1
+                self._generations.clear()
+                self._entries.clear()
+                # Later callers start a new load instead of joining a stale one
+                self._flights.clear()
+            else:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._entries.pop(key, None)
+                self._flights.pop(key, None)